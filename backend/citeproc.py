@@ -5,19 +5,28 @@
 # The strategy in the first case will be to check wether we have the DOI in our system and if the last update is not to long ago, we just skip.
 # This has the reason, that a users might wait if they refresh their profile.
 
+import functools
 import logging
+import multiprocessing
+import queue
 import re
 import requests
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
 
 from django.conf import settings
+from django.db import connections
 from django.utils import timezone
 
+from backend import doicache
 from backend.doiprefixes import free_doi_prefixes
 from backend.pubtype_translations import CITEPROC_PUBTYPE_TRANSLATION
+from backend.resolver import resolver
+from backend.utils import RateLimiter
 from backend.utils import request_retry
 from backend.utils import utf8_truncate
 from papers.baremodels import BareName
@@ -26,6 +35,7 @@ from papers.baremodels import BarePaper
 from papers.doi import doi_to_crossref_identifier
 from papers.doi import doi_to_url
 from papers.doi import to_doi
+from papers.models import CrossRefCheckpoint
 from papers.models import OaiSource
 from papers.models import OaiRecord
 from papers.models import Paper
@@ -37,8 +47,7 @@ from papers.utils import tolerant_datestamp_to_datetime
 from papers.utils import validate_orcid
 from papers.utils import valid_publication_date
 from publishers.models import AliasPublisher
-from publishers.models import Journal
-from publishers.models import Publisher
+from publishers.models import AliasPublisherCounter
 
 
 logger = logging.getLogger('dissemin.' + __name__)
@@ -94,13 +103,14 @@ class Citeproc():
 
 
     @classmethod
-    def to_paper(cls, data):
+    def to_paper(cls, data, deferred_indexing=False):
         """
         Call this function to convert citeproc metadata into a paper object
         Our strategy is as follows:
         We collect first all data necessary, if me miss something, then we raise CiteprocError.
         If we have collected everything, we pass that to the corresponding baremodels.
         :param data: citeproc metadata. Note that CrossRef does put its citeproc into a message block
+        :param deferred_indexing: if True, the paper is reindexed later by the task index_dirty_papers
         :returns: Paper object
         :raises: CiteprocError
         """
@@ -115,10 +125,69 @@ class Citeproc():
         bare_paper.update_availability()
 
         paper = Paper.from_bare(bare_paper)
-        paper.update_index()
+        paper.update_index(deferred=deferred_indexing)
         return paper
 
 
+    @classmethod
+    def to_papers(cls, items, deferred_indexing=False):
+        """
+        Bulk version of to_paper: converts a list of citeproc metadata into paper objects.
+        Journals, publishers and the source are resolved with a few queries for the whole list, papers and records are written with bulk operations and the search index is updated with one request.
+        Items that cannot be converted are skipped.
+        :param items: list of citeproc metadata
+        :param deferred_indexing: if True, the papers are reindexed later by the task index_dirty_papers
+        :returns: list of Paper objects
+        """
+        translated = []
+        for item in items:
+            try:
+                if not isinstance(item, dict):
+                    raise CiteprocError('Invalid metadaformat, expecting dict')
+                translated.append((cls._get_paper_data(item), cls._get_unresolved_oairecord_data(item)))
+            except CiteprocError as e:
+                logger.debug(e)
+                logger.debug(item)
+
+        journals_by_issn, journals_by_title = resolver.journals(
+            [bare_oairecord_data['issn'] for _, bare_oairecord_data in translated],
+            [bare_oairecord_data['journal_title'] for _, bare_oairecord_data in translated],
+        )
+        source = resolver.source('crossref')
+        aliases = AliasPublisherCounter()
+
+        bare_papers = []
+        for bare_paper_data, bare_oairecord_data in translated:
+            journal = journals_by_issn.get(bare_oairecord_data['issn']) or journals_by_title.get(bare_oairecord_data['journal_title'].upper())
+            publisher_name = bare_oairecord_data['publisher_name']
+            if journal is not None:
+                publisher = journal.publisher
+                aliases.add(publisher_name, publisher)
+            else:
+                publisher = resolver.publisher(publisher_name)
+
+            bare_oairecord_data.update({
+                'journal' : journal,
+                'publisher' : publisher,
+                'source' : source,
+            })
+            try:
+                bare_paper = BarePaper.create(**bare_paper_data)
+                bare_oairecord = BareOaiRecord(paper=bare_paper, **bare_oairecord_data)
+                bare_paper.add_oairecord(bare_oairecord)
+                bare_paper.update_availability()
+            except ValueError as e:
+                logger.debug(e)
+                continue
+            bare_papers.append(bare_paper)
+
+        aliases.flush()
+
+        papers = [paper for paper in Paper.from_bare_batch(bare_papers) if paper is not None]
+        Paper.bulk_update_index(papers, deferred=deferred_indexing)
+        return papers
+
+
     @staticmethod
     def _convert_to_name_pair(dct):
         """ Converts a dictionary {'family':'Last','given':'First'} to ('First','Last') """
@@ -238,6 +307,28 @@ class Citeproc():
         :returns: Returns a dict, ready to passed to a BarePaper instance
         :raises: CiteprocError
         """
+        bare_oairecord_data = cls._get_unresolved_oairecord_data(data)
+
+        journal = resolver.journal(issn=bare_oairecord_data['issn'], title=bare_oairecord_data['journal_title'])
+        publisher = cls._get_publisher(bare_oairecord_data['publisher_name'], journal)
+
+        bare_oairecord_data.update({
+            'journal' : journal,
+            'publisher' : publisher,
+            'source' : resolver.source('crossref'),
+        })
+
+        return bare_oairecord_data
+
+
+    @classmethod
+    def _get_unresolved_oairecord_data(cls, data):
+        """
+        Same as _get_oairecord_data, but does not touch the database, i.e. journal, publisher and source are not set.
+        :param data: citeproc metadata
+        :returns: Returns a dict, that needs journal, publisher and source to be passed to a BarePaper instance
+        :raises: CiteprocError
+        """
         doi = cls._get_doi(data)
         splash_url = doi_to_url(doi)
         licenses = data.get('licenses', [])
@@ -245,10 +336,8 @@ class Citeproc():
 
         journal_title = cls._get_container(data)
         issn = cls._get_issn(data)
-        journal = Journal.find(issn=issn, title=journal_title)
 
         publisher_name = data.get('publisher', '')[:512]
-        publisher = cls._get_publisher(publisher_name, journal)
 
         bare_oairecord_data = {
             'doi' : doi,
@@ -256,15 +345,12 @@ class Citeproc():
             'identifier' : doi_to_crossref_identifier(doi),
             'issn' : issn,
             'issue' : data.get('issue', ''),
-            'journal' : journal,
             'journal_title' : journal_title,
             'pages' : data.get('page', ''),
             'pdf_url' : pdf_url,
             'pubdate' : cls._get_pubdate(data),
-            'publisher' : publisher,
             'publisher_name' : publisher_name,
             'pubtype' : cls._get_pubtype(data),
-            'source' : OaiSource.objects.get(identifier='crossref'),
             'splash_url' : splash_url,
             'volume' : data.get('volume', ''),
         }
@@ -354,7 +440,7 @@ class Citeproc():
             publisher = journal.publisher
             AliasPublisher.increment(name, publisher)
         else:
-            publisher = Publisher.find(name)
+            publisher = resolver.publisher(name)
         return publisher
 
 
@@ -457,13 +543,85 @@ class CrossRef(Citeproc):
     """
 
     batch_length = 30
+    # If set, the papers of a page of results are saved with bulk operations
+    bulk_ingest = True
     emit_status_every = 10
+    # Number of days fetched in parallel by fetch_latest_records
+    fetch_processes = 1
+    # Number of pages fetched in advance while a page is being saved
+    prefetch_pages = 2
+    rate_limiter = RateLimiter()
+    # Number of processes sharing the rate limit, set by fetch_latest_records
+    rate_limit_processes = 1
     rows = 500
 
     @classmethod
     def _fetch_day(cls, day):
         """
-        Fetches a whole day from CrossRef
+        Fetches a whole day from CrossRef.
+        Pages are fetched by a separate thread that stays up to prefetch_pages ahead of the saving.
+        After each saved page, the cursor is stored in a CrossRefCheckpoint, so that an interrupted fetch resumes from there.
+        """
+        checkpoint, created = CrossRefCheckpoint.objects.get_or_create(day=day, defaults={'cursor' : '*'})
+        if not created:
+            logger.info('Resuming day {} after {} pages'.format(day.isoformat(), checkpoint.pages))
+
+        pages = queue.Queue(maxsize=cls.prefetch_pages)
+        stop = threading.Event()
+
+        def put(page):
+            # Gives up if the consumer has stopped
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for page in cls._fetch_pages(day, checkpoint.cursor):
+                    if not put(page):
+                        return
+            except Exception as e:
+                put(e)
+            else:
+                put(None)
+
+        producer = threading.Thread(target=produce, name='crossref-{}'.format(day.isoformat()), daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                total_results, next_cursor, items = page
+                checkpoint.new_papers += cls._save_items(items)
+                checkpoint.total_results = total_results
+                checkpoint.cursor = next_cursor or ''
+                checkpoint.pages += 1
+                checkpoint.save()
+                if checkpoint.pages % cls.emit_status_every == 0:
+                    logger.info('Parsed another {} papers. {} more to go'.format(cls.rows*cls.emit_status_every, checkpoint.total_results-checkpoint.pages*cls.rows))
+        finally:
+            stop.set()
+            producer.join()
+
+        logger.info('For day {} have {} paper been added or updated out of {}.'.format(day.isoformat(), checkpoint.new_papers, checkpoint.total_results))
+        checkpoint.delete()
+
+
+    @classmethod
+    def _fetch_pages(cls, day, cursor='*'):
+        """
+        Generator over the pages of results of a day from CrossRef
+        :param day: date object
+        :param cursor: cursor to start from. CrossRef cursors expire after a few minutes, if it is not accepted, we start from the beginning of the day.
+        :returns: yields triples of total number of results, next cursor and list of items
         """
         filters = {
             'from-update-date' : day.isoformat(),
@@ -480,44 +638,78 @@ class CrossRef(Citeproc):
         }
 
         s = requests.Session()
-        cursor = '*'
         total_results = 0
-        loop_runs = 0
-        new_papers = 0
+        resumed = cursor != '*'
         while cursor:
             params['cursor'] = cursor
-            r = request_retry(
-                url,
-                params=params,
-                headers=headers,
-                timeout=30,
-                session=s,
-            )
+            cls.rate_limiter.wait()
+            try:
+                r = request_retry(
+                    url,
+                    params=params,
+                    headers=headers,
+                    timeout=30,
+                    session=s,
+                    retries=0 if resumed else 5,
+                )
+            except requests.exceptions.HTTPError as e:
+                if not resumed:
+                    raise
+                logger.info('Cursor for day {} not accepted, starting over: {}'.format(day.isoformat(), e))
+                cursor = '*'
+                resumed = False
+                continue
+            resumed = False
+            cls._update_rate_limit(r)
+            total_results = jpath('message/total-results', r.json(), 0)
             if cursor == '*':
-                total_results = jpath('message/total-results', r.json(), 0)
                 logger.info('Fetch for day: {}, number results: {}'.format(day.isoformat(), total_results))
             cursor = jpath('message/next-cursor', r.json())
             items = jpath('message/items', r.json(), [])
             if len(items) == 0:
                 cursor = False
             else:
-                for item in items:
-                    try:
-                        cls.to_paper(item)
-                    except CiteprocError:
-                        logger.debug(CiteprocError)
-                        logger.debug(item)
-                    except ValueError as e:
-                        logger.debug(e)
-                        logger.debug(item)
-                    else:
-                        new_papers += 1
-            # After running ten times
-            loop_runs += 1
-            if loop_runs % cls.emit_status_every == 0:
-                logger.info('Parsed another {} papers. {} more to go'.format(cls.rows*cls.emit_status_every, total_results-loop_runs*cls.rows))
-
-        logger.info('For day {} have {} paper been added or updated out of {}.'.format(day.isoformat(), new_papers, total_results))
+                yield total_results, cursor, items
+
+
+    @classmethod
+    def _update_rate_limit(cls, response):
+        """
+        CrossRef announces its rate limit in the headers, e.g. 50 requests per 1s. We space our requests accordingly, sharing the limit among the processes fetching in parallel.
+        :param response: response from CrossRef API
+        """
+        try:
+            limit = int(response.headers['X-Rate-Limit-Limit'])
+            interval = float(response.headers['X-Rate-Limit-Interval'].rstrip('s'))
+        except (KeyError, ValueError):
+            return
+        if limit > 0:
+            cls.rate_limiter.min_interval = interval / limit * cls.rate_limit_processes
+
+
+    @classmethod
+    def _save_items(cls, items):
+        """
+        Saves a page of items fetched from CrossRef, in bulk if bulk_ingest is set
+        :param items: list of citeproc metadata
+        :returns: number of papers added or updated
+        """
+        if cls.bulk_ingest:
+            return len(cls.to_papers(items, deferred_indexing=True))
+
+        new_papers = 0
+        for item in items:
+            try:
+                cls.to_paper(item, deferred_indexing=True)
+            except CiteprocError:
+                logger.debug(CiteprocError)
+                logger.debug(item)
+            except ValueError as e:
+                logger.debug(e)
+                logger.debug(item)
+            else:
+                new_papers += 1
+        return new_papers
 
 
     @staticmethod
@@ -544,24 +736,58 @@ class CrossRef(Citeproc):
 
 
     @classmethod
-    def fetch_latest_records(cls):
+    def fetch_latest_records(cls, processes=None):
         """
         Fetches the latest records from CrossRef API
+        :param processes: number of days fetched in parallel, defaults to fetch_processes
         """
         source = OaiSource.objects.get(identifier='crossref')
         update_date = source.last_update + timedelta(days=1)
         today = date.today()
+        days = []
         while update_date.date() < today:
-            try:
-                cls._fetch_day(update_date.date())
-            except requests.exceptions.RequestException as e:
-                logger.exception(e)
+            days.append(update_date)
+            update_date += timedelta(days=1)
+
+        processes = processes or cls.fetch_processes
+        if processes > 1 and len(days) > 1:
+            # Each process opens its own database connection
+            connections.close_all()
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.imap(functools.partial(_fetch_day_in_process, cls, processes), [day.date() for day in days])
+                cls._checkpoint_days(source, zip(days, results))
+        else:
+            cls.rate_limit_processes = 1
+            cls._checkpoint_days(source, ((day, cls._fetch_day_safely(day.date())) for day in days))
+
+
+    @classmethod
+    def _checkpoint_days(cls, source, results):
+        """
+        Advances last_update of the source for each day fetched successfully, in order of days. We stop at the first failed day, so that it is fetched again on the next run.
+        :param source: OaiSource crossref
+        :param results: iterable of pairs of day and success
+        """
+        for update_date, success in results:
+            if not success:
                 break
-            else:
-                source.last_update = update_date
-                source.save()
-                logger.info("Updated up to {}".format(update_date))
-                update_date += timedelta(days=1)
+            source.last_update = update_date
+            source.save()
+            logger.info("Updated up to {}".format(update_date))
+
+
+    @classmethod
+    def _fetch_day_safely(cls, day):
+        """
+        Fetches a day, logging network errors
+        :returns: True if the day has been fetched
+        """
+        try:
+            cls._fetch_day(day)
+        except requests.exceptions.RequestException as e:
+            logger.exception(e)
+            return False
+        return True
 
     @staticmethod
     def _filter_dois_by_comma(dois):
@@ -589,46 +815,63 @@ class CrossRef(Citeproc):
         # We filter DOIs with comma, we do not batch them, but return them as `None`
         dois_to_fetch = cls._filter_dois_by_comma(dois)
 
-        headers = {
-            'User-Agent' : settings.CROSSREF_USER_AGENT
-        }
-        url = 'https://api.crossref.org/works'
-        s = requests.Session()
-
-        while len(dois_to_fetch):
-            dois_batch = dois_to_fetch[:cls.batch_length]
-            dois_to_fetch = dois_to_fetch[cls.batch_length:]
-            params = {
-                'filter' : ','.join(['doi:{}'.format(doi) for doi in dois_batch]),
-                'mailto' : settings.CROSSREF_MAILTO,
-                'rows' : cls.batch_length,
-            }
+        # The papers are saved in this thread
+        for item in cls.fetch_items(dois_to_fetch):
             try:
-                r = request_retry(
-                    url,
-                    params=params,
-                    headers=headers,
-                    session=s,
-                    retries=0, # There is probably a user waiting
-                )
-            except requests.exceptions.RequestException as e:
-                # We skip the DOIs since we could not reach
-                logger.info(e)
-                continue
-            items = jpath('message/items', r.json(), [])
-            for item in items:
-                try:
-                    p = cls.to_paper(item)
-                except CiteprocError:
-                    logger.debug(item)
-                else:
-                    papers[p.get_doi()] = p
+                p = cls.to_paper(item)
+            except CiteprocError:
+                logger.debug(item)
+            else:
+                papers[p.get_doi()] = p
 
         p = [papers.get(doi.lower(), None) for doi in dois]
 
         return p
 
 
+    @classmethod
+    def fetch_items(cls, dois):
+        """
+        Fetches the metadata of DOIs from CrossRef, by batches fetched concurrently
+        :param dois: List of DOIs, without comma
+        :returns: generator of the CrossRef items found
+        """
+        batches = [dois[i:i+cls.batch_length] for i in range(0, len(dois), cls.batch_length)]
+        threads = max(1, min(settings.CROSSREF_FETCH_THREADS, len(batches)))
+        with requests.Session() as s, ThreadPoolExecutor(max_workers=threads) as executor:
+            for items in executor.map(functools.partial(cls._fetch_batch_items, s), batches):
+                yield from items
+
+    @classmethod
+    def _fetch_batch_items(cls, session, dois):
+        """
+        Fetches the metadata of a batch of DOIs from CrossRef
+        :param session: the requests session to use
+        :param dois: a list of at most batch_length DOIs
+        :returns: the list of CrossRef items, empty if CrossRef could not be reached
+        """
+        headers = {
+            'User-Agent' : settings.CROSSREF_USER_AGENT
+        }
+        params = {
+            'filter' : ','.join(['doi:{}'.format(doi) for doi in dois]),
+            'mailto' : settings.CROSSREF_MAILTO,
+            'rows' : cls.batch_length,
+        }
+        try:
+            r = request_retry(
+                'https://api.crossref.org/works',
+                params=params,
+                headers=headers,
+                session=session,
+                retries=0, # There is probably a user waiting
+            )
+        except requests.exceptions.RequestException as e:
+            # We skip the DOIs since we could not reach
+            logger.info(e)
+            return []
+        return jpath('message/items', r.json(), [])
+
     @staticmethod
     def remove_unapproved_characters(doi):
         """
@@ -641,6 +884,15 @@ class CrossRef(Citeproc):
         return re.sub(valid_characters, '', doi)
 
 
+def _fetch_day_in_process(cls, processes, day):
+    """
+    Entry point of the worker processes of CrossRef.fetch_latest_records
+    :param processes: the number of worker processes, which share the rate limit of CrossRef
+    """
+    cls.rate_limit_processes = processes
+    return cls._fetch_day_safely(day)
+
+
 class DOIResolver(Citeproc):
     """
     This class fetches citeproc metadata with content negotiation via DOI resolver.
@@ -651,46 +903,139 @@ class DOIResolver(Citeproc):
         'Accept' : 'application/citeproc+json',
     }
     timeout = 0.500 # half a second as timeout, the might user waiting
+    # Time after which a request for a DOI is done again if another one is still waiting for it
+    lock_timeout = 5
+
+    _session = None
+
+    @classmethod
+    def session(cls):
+        """
+        The HTTP session used for the DOI resolver, which keeps connections alive
+        """
+        if DOIResolver._session is None:
+            DOIResolver._session = requests.Session()
+        return DOIResolver._session
 
 
     @staticmethod
-    def _is_up_to_date(doi):
+    def _up_to_date_records():
+        """
+        The CrossRef records which were updated recently enough not to be fetched again
+        """
+        return OaiRecord.objects.select_related('about').filter(
+            source__identifier='crossref',
+            last_update__gte=timezone.now() - settings.DOI_OUTDATED_DURATION
+        )
+
+    @classmethod
+    def _is_up_to_date(cls, doi):
         """
         Checks if doi is already in the database and wheter it is up to date
         :param doi: DOI to check
-        :returns: True/False
+        :returns: the OaiRecord if it is up to date, None otherwise
         """
         try:
-            return OaiRecord.objects.select_related('about').get(
-                doi=doi,
-                source__identifier='crossref',
-                last_update__gte=timezone.now() - settings.DOI_OUTDATED_DURATION
-            )
+            return cls._up_to_date_records().get(doi=doi)
         except OaiRecord.DoesNotExist:
             return None
 
+    @classmethod
+    def up_to_date_papers(cls, dois):
+        """
+        Checks with one query which DOIs are already in the database and up to date
+        :param dois: list of DOIs to check
+        :returns: dict with the papers of the DOIs which are up to date, with DOI as key
+        """
+        return {record.doi: record.about for record in cls._up_to_date_records().filter(doi__in=dois)}
+
 
     @classmethod
     def save_doi(cls, doi):
         """
         Fetches a single DOI and updates if necessary
         :param doi: A (valid) DOI
-        :returns: Paper object
+        :returns: Paper object, or None if the DOI does not exist
         :raises: CiteprocError or RequestException
         """
         record = cls._is_up_to_date(doi)
         if record is not None:
             return record.about
 
+        entry = cls.resolve(doi)
+        if entry is None:
+            return None
+        return cls.entry_to_paper(entry)
+
+
+    @staticmethod
+    def entry_to_paper(entry):
+        """
+        Creates a paper from an entry of the DOI cache
+        :param entry: a pair of the format of the metadata and the metadata, as returned by resolve
+        :returns: Paper object
+        :raises: CiteprocError
+        """
+        fmt, metadata = entry
+        if fmt == 'crossref':
+            return CrossRef.to_paper(metadata)
+        return DOIResolver.to_paper(metadata)
+
+
+    @classmethod
+    def resolve(cls, doi):
+        """
+        Fetches the metadata of a DOI from the DOI cache, or from the DOI resolver.
+        Concurrent calls for the same DOI make only one request to the DOI resolver.
+        :param doi: A (valid) DOI
+        :returns: a pair of the format of the metadata ('doi' or 'crossref') and the citeproc metadata, or None if the DOI does not exist
+        :raises: RequestException
+        """
+        return doicache.single_flight(doi, cls._fetch_metadata, cls.lock_timeout)
+
+
+    @classmethod
+    def resolve_many(cls, dois):
+        """
+        Fetches the metadata of many DOIs, from the DOI cache when possible.
+        The other DOIs are fetched by batches from CrossRef, and those which CrossRef does not know from the DOI resolver.
+        :param dois: List of (valid) DOIs
+        :returns: dict with the pairs of format and metadata (as returned by resolve) of the DOIs found, with DOI as key
+        """
+        entries = doicache.get_many(dois)
+        missing = [doi for doi in dois if doi not in entries]
+
+        wanted = {doi.lower() : doi for doi in CrossRef._filter_dois_by_comma(missing)}
+        for item in CrossRef.fetch_items(list(wanted)):
+            doi = wanted.get((item.get('DOI') or '').lower())
+            if doi is not None:
+                entries[doi] = ('crossref', item)
+                doicache.store(doi, entries[doi])
+
+        for doi in missing:
+            if doi not in entries:
+                try:
+                    entries[doi] = cls.resolve(doi)
+                except requests.exceptions.RequestException as e:
+                    logger.info(e)
+        return {doi : entry for doi, entry in entries.items() if entry is not None}
+
+
+    @classmethod
+    def _fetch_metadata(cls, doi):
+        """
+        Fetches the metadata of a DOI from the DOI resolver
+        :returns: a pair of 'doi' and the citeproc metadata, or None if the DOI does not exist
+        :raises: RequestException
+        """
         url = '{}{}'.format(settings.DOI_RESOLVER_ENDPOINT, doi)
-        r = requests.get(
+        r = cls.session().get(
             url=url,
             headers=cls.headers,
             timeout=cls.timeout,
         )
-
+        if r.status_code == 404:
+            return None
         r.raise_for_status()
 
-        p = cls.to_paper(r.json())
-
-        return p
+        return 'doi', r.json()
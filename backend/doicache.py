@@ -0,0 +1,123 @@
+# -*- encoding: utf-8 -*-
+
+# Dissemin: open access policy enforcement tool
+# Copyright (C) 2014 Antonin Delpeuch
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+Cache of the metadata of DOIs, shared by all processes through Redis.
+
+An entry of the cache is a pair of the format of the metadata (the name
+of the :class:`backend.citeproc.Citeproc` flavour that can read it, such
+as 'doi' or 'crossref') and the raw metadata, or None if the DOI could
+not be found. The metadata is stored as compressed JSON.
+"""
+
+import json
+import logging
+import zlib
+
+from django.conf import settings
+from redis.exceptions import LockError
+
+from dissemin.settings import redis_client
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+DOI_CACHE_KEY = 'dissemin-doi-{}'
+DOI_LOCK_KEY = 'dissemin-doi-lock-{}'
+
+#: value stored for the DOIs which could not be found
+NOT_FOUND = b'-'
+
+
+def _encode(entry):
+    if entry is None:
+        return NOT_FOUND
+    fmt, metadata = entry
+    return fmt.encode('utf-8') + b':' + zlib.compress(json.dumps(metadata).encode('utf-8'))
+
+def _decode(value):
+    if value == NOT_FOUND:
+        return None
+    fmt, data = value.split(b':', 1)
+    return fmt.decode('utf-8'), json.loads(zlib.decompress(data).decode('utf-8'))
+
+def _key(doi):
+    return DOI_CACHE_KEY.format(doi.lower())
+
+
+def get_many(dois):
+    """
+    Reads the entries of some DOIs from the cache
+
+    :returns: a dict with the entries of the DOIs which are cached, with DOI as key
+    """
+    if not dois:
+        return {}
+    values = redis_client.mget([_key(doi) for doi in dois])
+    return {doi: _decode(value) for doi, value in zip(dois, values) if value is not None}
+
+def store(doi, entry):
+    """
+    Stores the entry of a DOI in the cache, until DOI_CACHE_DURATION
+    expires, or DOI_NOT_FOUND_CACHE_DURATION if the DOI could not be found.
+    """
+    duration = settings.DOI_CACHE_DURATION if entry is not None else settings.DOI_NOT_FOUND_CACHE_DURATION
+    redis_client.set(_key(doi), _encode(entry), ex=int(duration.total_seconds()))
+
+def single_flight(doi, fetch, timeout):
+    """
+    Returns the entry of a DOI from the cache, or fetches it and stores it.
+
+    Only one process or thread fetches a given DOI at a time: the others
+    wait for it, at most timeout seconds, and read its result from the
+    cache.
+
+    :param fetch: a function returning the entry of a DOI, which can raise
+        an exception if it could not be fetched (nothing is cached then)
+    :param timeout: the maximum time spent fetching a DOI, in seconds
+    """
+    cached = get_many([doi])
+    if doi in cached:
+        return cached[doi]
+
+    lock = redis_client.lock(DOI_LOCK_KEY.format(doi.lower()), timeout=timeout)
+    have_lock = lock.acquire(blocking_timeout=timeout)
+    try:
+        # the DOI may have been fetched while we were waiting for the lock
+        cached = get_many([doi])
+        if doi in cached:
+            return cached[doi]
+        entry = fetch(doi)
+        store(doi, entry)
+        return entry
+    finally:
+        if have_lock:
+            try:
+                lock.release()
+            except LockError:
+                # the lock expired while fetching
+                logger.info("Fetching the DOI %s took more than %d seconds" % (doi, timeout))
+
+def clear():
+    """
+    Empties the cache
+    """
+    keys = list(redis_client.scan_iter(DOI_CACHE_KEY.format('*')))
+    if keys:
+        redis_client.delete(*keys)
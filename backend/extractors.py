@@ -41,6 +41,13 @@ class URLExtractor(object):
         self.metadata = metadata
         return self._post_filter(self._urls())
 
+    def extract_batch(self, records):
+        """
+        Same as :meth:`extract`, for a list of (header, metadata) pairs.
+        Returns the list of the dicts of URLs of the records.
+        """
+        return [self.extract(header, metadata) for header, metadata in records]
+
     def _urls(self):
         """
         Does the actual extraction job.
@@ -55,6 +62,10 @@ class URLExtractor(object):
         return urls
 
 
+# a pattern made of one group capturing everything it matches: with the
+# skeleton \1, the substitution leaves the value unchanged
+single_group_re = re.compile(r'\([^()]*\)\$?')
+
 class RegexExtractor(URLExtractor):
 
     def __init__(self, mappings):
@@ -63,16 +74,21 @@ class RegexExtractor(URLExtractor):
         """
         super(RegexExtractor, self).__init__()
         self.mappings = mappings
+        # the bound methods of the regexes, sub being None when the
+        # substitution is the identity
+        self.compiled_mappings = [
+            (field, regex.match, None if skeleton == r'\1' and single_group_re.fullmatch(regex.pattern) else regex.sub, resource_type, skeleton)
+            for field, regex, resource_type, skeleton in mappings
+        ]
 
     def _urls(self):
 
         urls = dict()
-        for (field, regex, resource_type, skeleton) in self.mappings:
+        for (field, match, sub, resource_type, skeleton) in self.compiled_mappings:
             for val in self.metadata[field]:
                 val = val.strip()
-                match = regex.match(val)
-                if match:
-                    urls[resource_type] = regex.sub(skeleton, val)
+                if match(val):
+                    urls[resource_type] = val if sub is None else sub(skeleton, val)
         return urls
 
 
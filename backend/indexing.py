@@ -0,0 +1,129 @@
+# -*- encoding: utf-8 -*-
+
+# Dissemin: open access policy enforcement tool
+# Copyright (C) 2014 Antonin Delpeuch
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+Deferred updates of the search index for papers.
+
+There are two ways to update the index without one request to Elasticsearch
+per paper:
+
+* :func:`mark_for_indexing` records the ids of the papers in a Redis set.
+  The task `index_dirty_papers` drains this set periodically and reindexes
+  the papers by chunks. Updates of the same paper between two runs end up in
+  a single reindex. This is meant for ingest, where nobody is waiting.
+
+* :func:`index_on_commit` collects the papers modified in the current
+  transaction and reindexes them with one bulk request once it is committed.
+  Outside of a transaction, the papers are reindexed straight away.
+  This is meant for paths where a user is waiting for the result.
+"""
+
+import logging
+import threading
+
+from django.db import connection
+from django.db import transaction
+
+from backend.maintenance import index_objects
+from dissemin.settings import redis_client
+from papers.models import Paper
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+DIRTY_PAPERS_KEY = 'dissemin-index-dirty-papers'
+
+_pending = threading.local()
+
+
+def mark_for_indexing(paper_ids):
+    """
+    Records papers to be reindexed by the task `index_dirty_papers`.
+    If we are in a transaction, this is done once it is committed, so that
+    the task sees the changes.
+
+    :param paper_ids: iterable of paper ids
+    """
+    paper_ids = [pk for pk in paper_ids if pk is not None]
+    if paper_ids:
+        transaction.on_commit(lambda: redis_client.sadd(DIRTY_PAPERS_KEY, *paper_ids))
+
+
+def index_on_commit(paper_ids):
+    """
+    Reindexes papers once the current transaction is committed,
+    with a single request for all the papers of the transaction.
+
+    :param paper_ids: iterable of paper ids
+    """
+    paper_ids = set(pk for pk in paper_ids if pk is not None)
+    if not paper_ids:
+        return
+    if not connection.in_atomic_block:
+        index_papers(paper_ids)
+        return
+    # The flush is dropped together with the transaction on rollback,
+    # in which case the pending ids are stale
+    if not any(func is _flush_pending for _, func in connection.run_on_commit):
+        _pending.ids = set()
+        transaction.on_commit(_flush_pending)
+    _pending.ids.update(paper_ids)
+
+
+def _flush_pending():
+    paper_ids = getattr(_pending, 'ids', set())
+    _pending.ids = set()
+    index_papers(paper_ids)
+
+
+def index_papers(paper_ids):
+    """
+    Reindexes papers with one bulk request
+
+    :param paper_ids: iterable of paper ids
+    :returns: number of papers indexed
+    """
+    paper_ids = list(paper_ids)
+    if not paper_ids:
+        return 0
+    papers = list(Paper.objects.filter(pk__in=paper_ids))
+    return index_objects(Paper, papers)
+
+
+def index_dirty_papers(chunk_size=500):
+    """
+    Reindexes the papers recorded by :func:`mark_for_indexing`, by chunks,
+    until there are none left.
+
+    :returns: number of papers indexed
+    """
+    indexed = 0
+    while True:
+        paper_ids = redis_client.spop(DIRTY_PAPERS_KEY, chunk_size)
+        if not paper_ids:
+            break
+        try:
+            indexed += index_papers(int(pk) for pk in paper_ids)
+        except Exception:
+            # Put them back for the next run
+            redis_client.sadd(DIRTY_PAPERS_KEY, *paper_ids)
+            raise
+    if indexed:
+        logger.info('Indexed {} papers'.format(indexed))
+    return indexed
@@ -32,13 +32,23 @@ importing this module and running the function manually.
 
 from bulk_update.helper import bulk_update
 
+from django.apps import apps
+from django.db import connections
+from django.utils import timezone
+
+from dissemin.settings import redis_client
 from papers.models import Name
 from papers.models import Paper
 from papers.models import Researcher
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from elasticsearch.helpers import bulk
+from elasticsearch.helpers import parallel_bulk
 from elasticsearch.exceptions import ConnectionTimeout
 from time import sleep
+import functools
+import multiprocessing
 import haystack
 from haystack.exceptions import SkipDocument
 from haystack.constants import ID
@@ -46,6 +56,72 @@ import logging
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+def _get_search_index(model):
+    """
+    :returns: the search backend and the index for model
+    """
+    using_backends = haystack.connection_router.for_write()
+    if len(using_backends) != 1:
+        raise ValueError("Don't know what search index to use")
+    engine = haystack.connections[using_backends[0]]
+    return engine.get_backend(), engine.get_unified_index().get_index(model)
+
+def _prepare_documents(backend, index, objs):
+    """
+    Prepares the documents for the given instances, skipping those
+    that should not be indexed
+    """
+    if hasattr(index, 'full_prepare_batch'):
+        prepped_batch = index.full_prepare_batch(objs)
+    else:
+        prepped_batch = []
+        for obj in objs:
+            try:
+                prepped_batch.append(index.full_prepare(obj))
+            except SkipDocument:
+                continue
+
+    prepped_docs = []
+    for prepped_data in prepped_batch:
+        final_data = {}
+
+        # Convert the data to make sure it's happy.
+        for key, value in list(prepped_data.items()):
+            final_data[key] = backend._from_python(value)
+        final_data['_id'] = final_data[ID]
+
+        prepped_docs.append(final_data)
+    return prepped_docs
+
+def _send_documents(backend, prepped_docs):
+    """
+    Sends documents in one bulk request, waiting for the search engine if needed
+    """
+    documents_sent = False
+    while not documents_sent:
+        try:
+            bulk(backend.conn, prepped_docs, index=backend.index_name, doc_type='modelresult')
+            documents_sent = True
+        except ConnectionTimeout as e:
+            logger.warning(e)
+            logger.info('retrying')
+            sleep(30)
+
+def index_objects(model, objs, commit=True):
+    """
+    Updates the search index for a list of instances, with one bulk request.
+
+    :param commit: whether to refresh the index afterwards
+    :returns: the number of documents indexed
+    """
+    backend, index = _get_search_index(model)
+    prepped_docs = _prepare_documents(backend, index, objs)
+    if prepped_docs:
+        _send_documents(backend, prepped_docs)
+        if commit:
+            backend.conn.indices.refresh(index=backend.index_name)
+    return len(prepped_docs)
+
 def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk=0):
     """
     More efficient update of the search index for large models such as
@@ -56,12 +132,7 @@ def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk
                     should commit to the search engine
     :param firstpk: the instance to start with.
     """
-    using_backends = haystack.connection_router.for_write()
-    if len(using_backends) != 1:
-        raise ValueError("Don't know what search index to use")
-    engine = haystack.connections[using_backends[0]]
-    backend = engine.get_backend()
-    index = engine.get_unified_index().get_index(model)
+    backend, index = _get_search_index(model)
 
     qs = model.objects.order_by('pk')
     lastpk_object = list(model.objects.order_by('-pk')[:1])
@@ -80,32 +151,13 @@ def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk
     while firstpk < lastpk:
         batch_number += 1
 
-        prepped_docs = []
-        for obj in qs.filter(pk__gt=firstpk)[:batch_size]:
-            firstpk = obj.pk
-
-            try:
-                prepped_data = index.full_prepare(obj)
-                final_data = {}
+        objs = list(qs.filter(pk__gt=firstpk)[:batch_size])
+        if not objs:
+            break
+        firstpk = objs[-1].pk
+        prepped_docs = _prepare_documents(backend, index, objs)
 
-                # Convert the data to make sure it's happy.
-                for key, value in list(prepped_data.items()):
-                    final_data[key] = backend._from_python(value)
-                final_data['_id'] = final_data[ID]
-
-                prepped_docs.append(final_data)
-            except SkipDocument:
-                continue
-
-        documents_sent = False
-        while not documents_sent:
-            try:
-                bulk(backend.conn, prepped_docs, index=backend.index_name, doc_type='modelresult')
-                documents_sent = True
-            except ConnectionTimeout as e:
-                logger.warning(e)
-                logger.info('retrying')
-                sleep(30)
+        _send_documents(backend, prepped_docs)
 
         indexed += len(prepped_docs)
         if batch_number % batches_per_commit == 0:
@@ -118,6 +170,186 @@ def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk
             starttime = curtime
             indexed = 0
 
+REINDEX_CHECKPOINT_KEY = 'dissemin-reindex-{}'
+
+def reindex_model(model, shards=8, processes=None, batch_size=256, batches_per_checkpoint=10, new_index=False, restart=False):
+    """
+    Reindexes all the instances of a model, splitting the range of pks in
+    shards which are indexed in parallel by a pool of processes.
+
+    The last pk indexed in each shard is stored in Redis, so that an
+    interrupted run is resumed where it stopped when called again with the
+    same arguments.
+
+    :param shards: the number of ranges of pks to split the model into
+    :param processes: the number of worker processes (defaults to the number of CPUs)
+    :param batch_size: the number of instances to retrieve for each query
+    :param batches_per_checkpoint: the number of batches after which the
+                    progress of a shard is stored
+    :param new_index: if True, the instances are indexed in a fresh index,
+                    which replaces the current one once complete. The
+                    index name from the settings becomes an alias to it.
+    :param restart: ignore the progress of a previous run
+    :returns: the number of documents indexed
+    """
+    backend, index = _get_search_index(model)
+    label = model._meta.label
+    checkpoint_key = REINDEX_CHECKPOINT_KEY.format(label)
+    if restart:
+        redis_client.delete(checkpoint_key)
+
+    checkpoint = {key.decode('utf-8') : value.decode('utf-8') for key, value in redis_client.hgetall(checkpoint_key).items()}
+    if checkpoint:
+        if int(checkpoint['shards']) != shards or (checkpoint['index'] != backend.index_name) != new_index:
+            raise ValueError('A reindex of {} with other arguments was interrupted, restart it or resume it with the same arguments'.format(label))
+        index_name = checkpoint['index']
+        start_time = checkpoint['start_time']
+        logger.info('Resuming reindex of {} in {}'.format(label, index_name))
+    else:
+        index_name = backend.index_name
+        start_time = timezone.now().isoformat()
+        if new_index:
+            index_name = '{}_{}'.format(backend.index_name, timezone.now().strftime('%Y%m%d%H%M%S'))
+            _create_index(backend, index_name)
+        redis_client.hmset(checkpoint_key, {'shards' : shards, 'index' : index_name, 'start_time' : start_time})
+
+    pks = model.objects.order_by('pk').values_list('pk', flat=True)
+    firstpk, lastpk = pks.first(), pks.last()
+    if firstpk is None: # No object in the model
+        redis_client.delete(checkpoint_key)
+        return 0
+    shard_size = (lastpk - firstpk) // shards + 1
+    shard_ranges = [(shard, firstpk + shard * shard_size, firstpk + (shard + 1) * shard_size) for shard in range(shards)]
+
+    if new_index:
+        # Refreshing is useless until the index is used
+        backend.conn.indices.put_settings(index=index_name, body={'index' : {'refresh_interval' : '-1'}})
+
+    index_shard = functools.partial(_reindex_shard, label, index_name, checkpoint_key, batch_size, batches_per_checkpoint)
+    # Each process opens its own database connection
+    connections.close_all()
+    with multiprocessing.Pool(processes, initializer=_init_reindex_worker) as pool:
+        indexed = sum(pool.imap_unordered(index_shard, shard_ranges))
+
+    if new_index:
+        backend.conn.indices.put_settings(index=index_name, body={'index' : {'refresh_interval' : None}})
+    backend.conn.indices.refresh(index=index_name)
+    if new_index:
+        _swap_alias(backend.conn, backend.index_name, index_name)
+        # Instances changed during the reindex were indexed in the old index
+        if hasattr(model, 'last_modified'):
+            modified = model.objects.filter(last_modified__gte=start_time)
+            for batch in _batches(enumerate_large_qs(modified, batch_size=batch_size), batch_size):
+                indexed += index_objects(model, batch)
+
+    redis_client.delete(checkpoint_key)
+    logger.info('Reindexed {} instances of {} in {}'.format(indexed, label, index_name))
+    return indexed
+
+def _init_reindex_worker():
+    """
+    Opens new connections to the search engine in a worker process of
+    reindex_model, instead of sharing the sockets of the parent
+    """
+    for using in haystack.connection_router.for_write():
+        haystack.connections.reload(using)
+
+def _reindex_shard(label, index_name, checkpoint_key, batch_size, batches_per_checkpoint, shard_range):
+    """
+    Indexes the instances of a shard, from its last checkpoint.
+    This runs in the worker processes of reindex_model.
+    """
+    shard, startpk, endpk = shard_range
+    model = apps.get_model(label)
+    backend, index = _get_search_index(model)
+    firstpk = int(redis_client.hget(checkpoint_key, shard) or startpk - 1)
+    qs = model.objects.filter(pk__lt=endpk).order_by('pk')
+
+    indexed = 0
+    starttime = datetime.utcnow()
+    # The documents are sent by another thread (itself sending chunks with
+    # several threads) while we fetch and prepare the next ones. Database
+    # queries stay in this thread.
+    with ThreadPoolExecutor(max_workers=1) as sender:
+        sending = None
+        while True:
+            objs = []
+            for batch_number in range(batches_per_checkpoint):
+                batch = list(qs.filter(pk__gt=firstpk)[:batch_size])
+                if not batch:
+                    break
+                firstpk = batch[-1].pk
+                objs += batch
+            prepped_docs = _prepare_documents(backend, index, objs) if objs else []
+
+            if sending is not None:
+                future, lastpk, count = sending
+                future.result()
+                redis_client.hset(checkpoint_key, shard, lastpk)
+                indexed += count
+                curtime = datetime.utcnow()
+                rate = int(count / max((curtime-starttime).total_seconds(), 1e-3))
+                logger.info("shard %d: %d obj/s, %d / %d" % (shard, rate, lastpk, endpk))
+                starttime = curtime
+            if not objs:
+                break
+            sending = (sender.submit(_send_shard_documents, backend.conn, prepped_docs, index_name, batch_size), firstpk, len(prepped_docs))
+    return indexed
+
+def _send_shard_documents(conn, docs, index_name, batch_size):
+    """
+    Sends prepared documents to the search engine, by chunks of batch_size
+    documents sent by several threads
+    """
+    deque(parallel_bulk(conn, docs, chunk_size=batch_size, index=index_name, doc_type='modelresult'), maxlen=0)
+
+def _create_index(backend, index_name):
+    """
+    Creates an index with the mapping of the search backend
+    """
+    alias = backend.index_name
+    backend.index_name = index_name
+    backend.setup_complete = False
+    backend.existing_mapping = {}
+    try:
+        backend.setup()
+    finally:
+        backend.index_name = alias
+        backend.setup_complete = False
+
+def _swap_alias(conn, alias, index_name):
+    """
+    Points alias to index_name, atomically, and then deletes the indices
+    it pointed to before
+    """
+    actions = []
+    old_indices = []
+    if conn.indices.exists_alias(name=alias):
+        old_indices = list(conn.indices.get_alias(name=alias).keys())
+        actions += [{'remove' : {'index' : old, 'alias' : alias}} for old in old_indices]
+    elif conn.indices.exists(index=alias):
+        # The index was created before we used aliases: it has to be deleted
+        # before the alias can take its name (the remove_index action would
+        # do both at once, but it needs Elasticsearch 6.4)
+        conn.indices.delete(index=alias)
+    actions.append({'add' : {'index' : index_name, 'alias' : alias}})
+    conn.indices.update_aliases(body={'actions' : actions})
+    for old in old_indices:
+        conn.indices.delete(index=old)
+
+def _batches(iterable, batch_size):
+    """
+    Groups the items of an iterable in lists of batch_size items
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 def enumerate_large_qs(queryset, key='pk', batch_size=256, lastval=None):
     """
     Enumerates a large queryset (milions of rows) efficiently
@@ -141,7 +373,7 @@ def update_availability():
     for paper in enumerate_large_qs(Paper.objects.filter(oa_status='UNK')):
         paper.update_availability()
         if paper.oa_status != 'UNK':
-            paper.update_index()
+            paper.update_index(deferred=True)
 
 def cleanup_researchers():
     """
@@ -221,7 +453,7 @@ def fix_duplicate_orcids(p):
 
     if best_indices:
         p.save()
-        p.update_index()
+        p.update_index(deferred=True)
 
 def report_dubious_orcids():
     """
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from backend.orcid import OrcidPaperSource
+
+class Command(BaseCommand):
+    help = 'Import the profiles of the ORCID public data file, read from the tarball without unpacking it. An interrupted import is resumed when run again. The dump only contains summaries of the works: unless --no-papers is given, the works are fetched from the ORCID API, profile after profile, which is much slower than importing the researchers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help='Path to the tarball of the ORCID dump, or to a directory where it was unpacked')
+        parser.add_argument('--no-papers', action='store_true', help='Only import the researchers, not their papers, without any request to ORCID')
+        parser.add_argument('--use-doi', action='store_true', help='Fetch the metadata of the papers with a DOI from CrossRef')
+        parser.add_argument('--processes', type=int, default=None, help='Number of processes parsing the profiles, defaults to the number of CPUs. The papers are still fetched by one process')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of profiles saved in each transaction')
+        parser.add_argument('--restart', action='store_true', help='Ignore the progress of an interrupted import')
+
+    def handle(self, *args, **options):
+        metrics = OrcidPaperSource().bulk_import(
+            options['archive'],
+            fetch_papers=not options['no_papers'],
+            use_doi=options['use_doi'],
+            processes=options['processes'],
+            batch_size=options['batch_size'],
+            restart=options['restart'],
+        )
+        self.stdout.write('Imported {profiles} profiles ({invalid} invalid) and {papers} papers'.format(**metrics.as_dict()))
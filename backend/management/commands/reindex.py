@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from backend.maintenance import reindex_model
+
+class Command(BaseCommand):
+    help = 'Reindex all the instances of a model in the search engine, with several processes. An interrupted reindex is resumed when run again with the same arguments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default='papers.Paper', help='Model to reindex, as app_label.ModelName')
+        parser.add_argument('--shards', type=int, default=8, help='Number of ranges of ids indexed in parallel')
+        parser.add_argument('--processes', type=int, default=None, help='Number of worker processes, defaults to the number of CPUs')
+        parser.add_argument('--batch-size', type=int, default=256, help='Number of instances fetched per query')
+        parser.add_argument('--new-index', action='store_true', help='Index in a fresh index, which replaces the current one once complete')
+        parser.add_argument('--restart', action='store_true', help='Ignore the progress of an interrupted reindex')
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+        try:
+            indexed = reindex_model(
+                model,
+                shards=options['shards'],
+                processes=options['processes'],
+                batch_size=options['batch_size'],
+                new_index=options['new_index'],
+                restart=options['restart'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write('Reindexed {} instances of {}'.format(indexed, model._meta.label))
@@ -1,23 +1,35 @@
 # -*- encoding: utf-8 -*-
 
 
+import functools
 import gzip
 import json
 import logging
+import multiprocessing
+from collections import defaultdict
+from collections import deque
 from django.db import DataError
+from django.db import connections
 
+from dissemin.settings import redis_client
 from papers.models import Paper
+from papers.models import OaiRecord
 from papers.models import OaiSource
 from papers.baremodels import BareOaiRecord
 from papers.doi import doi_to_crossref_identifier
 from papers.doi import doi_to_url
 from papers.doi import to_doi
+from backend.citeproc import CiteprocError
+from backend.citeproc import DOIResolver
 from backend.doiprefixes import free_doi_prefixes
+from backend.resolver import resolver
 from papers.errors import MetadataSourceException
 from backend.utils import report_speed
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+OADOI_DUMP_CHECKPOINT_KEY = 'dissemin-oadoi-dump-{}'
+
 class OadoiAPI(object):
     """
     An interface to import an OAdoi dump into dissemin
@@ -31,7 +43,7 @@ class OadoiAPI(object):
             'priority':-10,
             'default_pubtype':'preprint'})
 
-        self.crossref_source = OaiSource.objects.get(identifier='crossref')
+        self.crossref_source = resolver.source('crossref')
 
     @report_speed(name='oadoi importing speed')
     def read_dump(self, filename, start_doi=None):
@@ -48,18 +60,139 @@ class OadoiAPI(object):
                     yield record
 
 
-    def load_dump(self, filename, start_doi=None, update_index=False, create_missing_dois=True):
+    def read_dump_chunks(self, filename, offset=0, chunk_size=1000):
+        """
+        Enumerates the dump by chunks of raw lines, starting from the given
+        offset in the uncompressed stream. Lines are not decoded, so that
+        this stays cheap in the process reading the dump.
+
+        Seeking in a gzip file still decompresses what comes before, but
+        without parsing it. Seeking in an uncompressed dump is immediate.
+
+        :returns: pairs of the offset after the chunk and the list of lines
+        """
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'rb') as f:
+            f.seek(offset)
+            lines = []
+            for line in iter(f.readline, b''):
+                lines.append(line)
+                if len(lines) >= chunk_size:
+                    yield f.tell(), lines
+                    lines = []
+            if lines:
+                yield f.tell(), lines
+
+    def load_dump(self, filename, start_doi=None, update_index=False, create_missing_dois=True, processes=1, chunk_size=1000, restart=False):
         """
         Reads a dump from the disk and loads it to the database.
+
+        The dump is read by chunks, which are imported by a pool of processes.
+        The offset reached in the dump is stored in Redis after each chunk,
+        so that an interrupted import resumes where it stopped when called
+        again with the same file.
+
+        :param start_doi: if given, we ignore the stored offset and start
+            from this DOI, scanning the dump from the beginning
+        :param processes: the number of worker processes
+        :param restart: ignore the offset of a previous import
         """
-        for record in self.read_dump(filename, start_doi=start_doi):
-            self.create_oairecord(record, update_index, create_missing_dois)
+        if start_doi is not None:
+            for record in self.read_dump(filename, start_doi=start_doi):
+                self.create_oairecord(record, update_index, create_missing_dois)
+            return
+
+        checkpoint_key = OADOI_DUMP_CHECKPOINT_KEY.format(filename)
+        if restart:
+            redis_client.delete(checkpoint_key)
+        offset = int(redis_client.get(checkpoint_key) or 0)
+        if offset:
+            logger.info('Resuming import of {} from offset {}'.format(filename, offset))
+
+        chunks = self.read_dump_chunks(filename, offset=offset, chunk_size=chunk_size)
+        import_chunk = functools.partial(_import_dump_chunk, update_index=update_index, create_missing_dois=create_missing_dois)
+        if processes > 1:
+            # Each process opens its own database connection
+            connections.close_all()
+            with multiprocessing.Pool(processes, initializer=_init_dump_worker) as pool:
+                # Chunks are collected in order, so that the offset only
+                # moves past chunks which were imported. At most a few
+                # chunks per process are read ahead of the workers.
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.apply_async(import_chunk, (chunk,)))
+                    if len(pending) > 2 * processes:
+                        redis_client.set(checkpoint_key, pending.popleft().get())
+                while pending:
+                    redis_client.set(checkpoint_key, pending.popleft().get())
+        else:
+            _init_dump_worker(self)
+            for chunk in chunks:
+                redis_client.set(checkpoint_key, import_chunk(chunk))
+        redis_client.delete(checkpoint_key)
+
+    def create_oairecords(self, records, update_index=True, create_missing_dois=True):
+        """
+        Given a list of lines of the dump (represented as dicts),
+        add them to the corresponding papers.
+        The papers are looked up with a few queries for the whole list.
+        """
+        records_by_doi = {}
+        for record in records:
+            doi = self._filter_record(record)
+            if doi:
+                records_by_doi[doi] = record
+        if not records_by_doi:
+            return
+
+        paper_ids = dict(OaiRecord.objects.filter(doi__in=list(records_by_doi)).values_list('doi', 'about_id'))
+        papers = Paper.objects.in_bulk(set(paper_ids.values()))
+        oairecords = defaultdict(list)
+        for oairecord in OaiRecord.objects.filter(about_id__in=list(papers)):
+            oairecords[oairecord.about_id].append(oairecord)
+        for paper in papers.values():
+            paper.cached_oairecords = oairecords[paper.pk]
+
+        # the metadata of the unknown DOIs is fetched for the whole list
+        entries = {}
+        missing = [doi for doi in records_by_doi if paper_ids.get(doi) not in papers]
+        if create_missing_dois and missing:
+            entries = DOIResolver.resolve_many(missing)
+
+        for doi, record in records_by_doi.items():
+            paper = papers.get(paper_ids.get(doi))
+            if paper is None:
+                if doi not in entries:
+                    continue
+                try:
+                    paper = DOIResolver.entry_to_paper(entries[doi])
+                except (CiteprocError, ValueError) as e:
+                    logger.info(e)
+                    continue
+                paper.cache_oairecords()
+            self._add_oa_locations(paper, doi, record, update_index)
 
     def create_oairecord(self, record, update_index=True, create_missing_dois=True):
         """
         Given one line of the dump (represented as a dict),
         add it to the corresponding paper (if it exists)
         """
+        doi = self._filter_record(record)
+        if not doi:
+            return
+
+        paper = Paper.get_by_doi(doi)
+        if not paper:
+            paper = self._create_missing_paper(doi, create_missing_dois)
+            if not paper:
+                return
+        paper.cache_oairecords()
+        self._add_oa_locations(paper, doi, record, update_index)
+
+    def _filter_record(self, record):
+        """
+        :returns: the DOI of a line of the dump, or None if there is nothing to import
+        """
         doi = to_doi(record['doi'])
         if not doi:
             return
@@ -68,21 +201,28 @@ class OadoiAPI(object):
             return
         if not record.get('oa_locations'):
             return
+        return doi
 
-        paper = Paper.get_by_doi(doi)
+    def _create_missing_paper(self, doi, create_missing_dois):
+        """
+        Creates a paper from the metadata of a DOI which is not known yet, if allowed
+        """
+        if not create_missing_dois:
+            return
+        try:
+            paper = Paper.create_by_doi(doi)
+        except (MetadataSourceException, ValueError):
+            return
         if not paper:
-            if not create_missing_dois:
-                return
-            try:
-                paper = Paper.create_by_doi(doi)
-            except (MetadataSourceException, ValueError):
-                return
-            if not paper:
-                logger.info('no such paper for doi {doi}'.format(doi=doi))
-                return
-        logger.info(doi)
-        paper.cache_oairecords()
+            logger.info('no such paper for doi {doi}'.format(doi=doi))
+        return paper
 
+    def _add_oa_locations(self, paper, doi, record, update_index):
+        """
+        Adds the OA locations of a line of the dump to a paper
+        whose OaiRecords are cached
+        """
+        logger.info(doi)
         for oa_location in record.get('oa_locations') or []:
             url = oa_location['url']
 
@@ -114,6 +254,28 @@ class OadoiAPI(object):
                 if old_pdf_url != paper.pdf_url:
                     paper.save()
                     if update_index:
-                        paper.update_index()
+                        paper.update_index(deferred=True)
             except (DataError, ValueError):
                 logger.warning('Record does not fit in the DB')
+
+
+_dump_worker_api = None
+
+def _init_dump_worker(api=None):
+    """
+    Sets up the OadoiAPI used by _import_dump_chunk in this process
+    """
+    global _dump_worker_api
+    _dump_worker_api = api or OadoiAPI()
+
+def _import_dump_chunk(chunk, update_index, create_missing_dois):
+    """
+    Imports a chunk of the dump as returned by OadoiAPI.read_dump_chunks.
+    This runs in the worker processes of OadoiAPI.load_dump.
+
+    :returns: the offset after the chunk
+    """
+    offset, lines = chunk
+    records = [json.loads(line.decode('utf-8')) for line in lines if line.strip()]
+    _dump_worker_api.create_oairecords(records, update_index, create_missing_dois)
+    return offset
@@ -20,25 +20,148 @@
 
 
 import logging
+import pytz
+import time
 
-from datetime import datetime
+from collections import deque
+from multiprocessing import Pool
 
 from backend.papersource import PaperSource
+from backend.utils import RateLimiter
 
+from django.conf import settings
+from django.db import connections
 from django.db import transaction
+from django.utils import timezone
 from multiprocessing_generator import ParallelGenerator
 from oaipmh.client import Client
+from oaipmh.common import Header
+from oaipmh.datestamp import datetime_to_datestamp
 
+from oaipmh.error import BadResumptionTokenError
 from oaipmh.error import NoRecordsMatchError
 from oaipmh.metadata import MetadataRegistry
 from oaipmh.metadata import oai_dc_reader
+from oaipmh.validation import validateArguments
+from dissemin.settings import redis_client
+from papers.models import OaiSource
 from papers.models import Paper
+from papers.name import parse_comma_name_cache_info
 from backend.translators import OAIDCTranslator
 from backend.translators import BASEDCTranslator
+from backend.oaireader import RecordsPage
 from backend.oaireader import base_dc_reader
+from backend.oaireader import streaming_readers
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+#: lock held by the task harvesting a source, see :func:`backend.tasks.harvest_oai_source`
+HARVEST_LOCK_ID = 'harvest_oai_source-{}'
+
+
+def is_harvesting(source):
+    """
+    Is the given :class:`OaiSource` being harvested?
+    """
+    return bool(redis_client.exists(HARVEST_LOCK_ID.format(source.pk)))
+
+
+def harvest_lag(source, now=None):
+    """
+    How far behind the given :class:`OaiSource` is: the time since the
+    harvest it has completed or the latest datestamp saved by the
+    harvest in progress, whichever is more recent.
+    """
+    now = now or timezone.now()
+    latest = source.last_update
+    if source.harvest_datestamp is not None and source.harvest_datestamp > latest:
+        latest = source.harvest_datestamp
+    return now - latest
+
+
+def sources_to_harvest(now=None):
+    """
+    Returns the :class:`OaiSource` which should be harvested now, the most
+    outdated first: those with an endpoint, which are not being harvested
+    and whose last harvest is older than their harvest interval. There
+    are at most as many as the number of harvests that can be started
+    without exceeding settings.OAI_HARVEST_CONCURRENCY.
+    """
+    now = now or timezone.now()
+    sources = list(OaiSource.objects.filter(endpoint__isnull=False).order_by('last_update'))
+    harvesting = set(source.pk for source in sources if is_harvesting(source))
+    slots = settings.OAI_HARVEST_CONCURRENCY - len(harvesting)
+    due = [
+        source for source in sources
+        if source.pk not in harvesting and source.last_update + source.harvest_interval <= now
+    ]
+    return due[:max(slots, 0)]
+
+
+
+class IngestMetrics(object):
+    """
+    Timings of an OAI ingestion, reported in the logs as records per second
+    and average milliseconds spent translating and saving each record,
+    with the number of records whose translation failed.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.failed = 0
+        self.translate_time = 0.
+        self.save_time = 0.
+        self.start = time.monotonic()
+        self.since_report = 0
+
+    def add(self, records, translate_time, save_time, failed=0):
+        self.records += records
+        self.failed += failed
+        self.translate_time += translate_time
+        self.save_time += save_time
+        self.since_report += records
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.start
+        return {
+            'records': self.records,
+            'failed': self.failed,
+            'records_per_second': round(self.records / elapsed, 1) if elapsed else None,
+            'translate_ms': round(1000 * self.translate_time / self.records, 2) if self.records else None,
+            'save_ms': round(1000 * self.save_time / self.records, 2) if self.records else None,
+        }
+
+    def report(self):
+        metrics = self.as_dict()
+        logger.info("OAI ingestion: " + " ".join("{}={}".format(key, value) for key, value in metrics.items()), extra={'metrics': metrics})
+        logger.info("author names cache: %s" % str(parse_comma_name_cache_info()))
+        self.since_report = 0
+
+
+def translate_records(translators, format, records):
+    """
+    Translates a batch of records with the translator for their format.
+
+    :returns: the list of translated :class:`BarePaper` (None for the
+        records which could not be translated), the time spent
+        translating, in seconds, and the number of records whose
+        translator raised an exception
+    """
+    start = time.monotonic()
+    papers, failed = translators[format].translate_batch(records)
+    return papers, time.monotonic() - start, failed
+
+
+_worker_translators = None
+
+def _init_translate_worker(translators):
+    global _worker_translators
+    _worker_translators = translators
+
+def _translate_batch(format, records):
+    return translate_records(_worker_translators, format, records)
+
+
 class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSource
     """
     A paper source that fetches records from the OAI-PMH proxy
@@ -50,7 +173,22 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
     the metadata is served in.
     """
 
-    def __init__(self, oaisource, day_granularity=False, *args, **kwargs):
+    #: number of records saved in one transaction
+    batch_size = 100
+    #: number of processes translating records while they are saved,
+    #: 0 to translate them in the current process
+    translate_processes = 2
+    #: number of records between two reports of the metrics
+    report_every = 1000
+    #: number of records between two checkpoints of the ingest
+    checkpoint_every = 5000
+    #: parse the records with the streaming readers of :mod:`backend.oaireader`
+    streaming = True
+    #: whether the endpoint lists the records by increasing datestamp,
+    #: which OAI-PMH does not require, see :meth:`harvest`
+    chronological = False
+
+    def __init__(self, oaisource, day_granularity=False, batch_size=None, translate_processes=None, *args, **kwargs):
         """
         This sets up the paper source.
 
@@ -58,6 +196,8 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
         :param day_granularity: should we use day-granular timestamps
             to fetch from the proxy or full timestamps (default: False,
             full timestamps)
+        :param batch_size: overrides :attr:`batch_size`
+        :param translate_processes: overrides :attr:`translate_processes`
 
         See the protocol reference for more information on timestamp
         granularity:
@@ -72,10 +212,16 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
         self.registry.registerReader('base_dc', base_dc_reader)
         self.client = Client(oaisource.endpoint, self.registry)
         self.client._day_granularity = day_granularity
+        self.oaisource = oaisource
+        self.rate_limiter = RateLimiter(oaisource.request_delay)
         self.translators = {
             'oai_dc': OAIDCTranslator(oaisource),
             'base_dc': BASEDCTranslator(oaisource),
         }
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if translate_processes is not None:
+            self.translate_processes = translate_processes
 
     # Translator management
 
@@ -94,7 +240,7 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
     # Record ingestion
 
     def ingest(self, from_date=None, metadataPrefix='oai_dc',
-               resumptionToken=None):
+               resumptionToken=None, checkpoint=None):
         """
         Main method to fill Dissemin with papers!
 
@@ -102,14 +248,116 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
                           the proxy (useful for incremental fetching)
         :param metadataPrefix: restrict the ingest for this metadata
                           format
+        :param resumptionToken: resume a previous ingest from this token
+                          (from_date is then ignored)
+        :param checkpoint: a function called every :attr:`checkpoint_every`
+                          records with the resumption token to resume the
+                          ingest from and the latest datestamp of the saved
+                          records, see :meth:`process_records`
         """
-        args = {'metadataPrefix':metadataPrefix}
-        if from_date:
-            args['from_'] = from_date
+        args = {}
         if resumptionToken:
             args['resumptionToken'] = resumptionToken
-        records = self.client.listRecords(**args)
-        self.process_records(records, metadataPrefix)
+        else:
+            args['metadataPrefix'] = metadataPrefix
+            if from_date:
+                args['from_'] = from_date
+        records = self.list_records(metadataPrefix, **args)
+        return self.process_records(records, metadataPrefix, checkpoint=checkpoint)
+
+    def harvest(self, metadataPrefix='oai_dc'):
+        """
+        Fetches the records modified since the last harvest of the source.
+
+        The progress of the harvest is saved on the :class:`OaiSource`
+        every :attr:`checkpoint_every` records. If the previous harvest
+        was interrupted, it is resumed from its resumption token, and the
+        next harvest starts from the time the interrupted one started.
+
+        If the token has expired, the harvest starts over from the last
+        complete harvest, since the records not reached yet can have older
+        datestamps than those saved. Only if the endpoint is
+        :attr:`chronological` does it restart from the latest datestamp saved.
+        """
+        source = self.oaisource
+        source.start_harvest()
+        resumed = False
+        if source.resumption_token:
+            try:
+                self.ingest(metadataPrefix=metadataPrefix,
+                            resumptionToken=source.resumption_token,
+                            checkpoint=source.checkpoint_harvest)
+                resumed = True
+            except BadResumptionTokenError:
+                logger.info("Resumption token of %s expired, restarting the harvest" % source.identifier)
+
+        if not resumed:
+            from_date = source.last_update
+            if self.chronological and source.harvest_datestamp is not None:
+                from_date = source.harvest_datestamp
+            try:
+                self.ingest(from_date.astimezone(pytz.UTC).replace(tzinfo=None),
+                            metadataPrefix=metadataPrefix,
+                            checkpoint=source.checkpoint_harvest)
+            except NoRecordsMatchError:
+                logger.info("No new records from %s" % source.identifier)
+
+        source.finish_harvest()
+
+    def list_records(self, metadataPrefix, **kwargs):
+        """
+        Iterates over the records returned by the ListRecords verb, as
+        pyoai's listRecords does. The third item of each record (always None
+        in pyoai) is the resumption token of the page containing the record
+        (None for the first page): the ingest can be resumed from there
+        without missing the record.
+
+        Pages are parsed with a :class:`StreamingMetadataReader` if there
+        is one for the format and :attr:`streaming` is set, otherwise with
+        the pyoai reader registered for the format.
+
+        :param metadataPrefix: the format of the records
+        :param kwargs: arguments of the first ListRecords request, as for
+            pyoai's listRecords (from_ and until are datetimes)
+        """
+        token = kwargs.get('resumptionToken')
+        kwargs = self._request_arguments('ListRecords', kwargs)
+        reader = streaming_readers.get(metadataPrefix) if self.streaming else None
+        while True:
+            self.rate_limiter.wait()
+            if reader is not None:
+                page = RecordsPage(self.client.makeRequest(verb='ListRecords', **kwargs), reader)
+                for header, metadata in page:
+                    yield header, metadata, token
+                next_token = page.resumption_token
+            else:
+                tree = self.client.makeRequestErrorHandling(verb='ListRecords', **kwargs)
+                records, next_token = self.client.buildRecords(
+                    metadataPrefix, self.client.getNamespaces(), self.registry, tree)
+                for header, metadata, about in records:
+                    yield header, metadata, token
+            if next_token is None:
+                break
+            token = next_token
+            kwargs = {'resumptionToken': token}
+
+    def _request_arguments(self, verb, kwargs):
+        """
+        Converts the arguments of a request as pyoai's Client.handleVerb
+        does, since we call makeRequest directly: they are validated
+        (unless we resume from a token), and the from_ and until dates
+        become datestamps, from_ being renamed to from.
+        """
+        kwargs = dict(kwargs)
+        if 'resumptionToken' not in kwargs:
+            validateArguments(verb, kwargs)
+        from_ = kwargs.pop('from_', None)
+        if from_ is not None:
+            kwargs['from'] = datetime_to_datestamp(from_, self.client._day_granularity)
+        until = kwargs.pop('until', None)
+        if until is not None:
+            kwargs['until'] = datetime_to_datestamp(until, self.client._day_granularity)
+        return kwargs
 
     def create_paper_by_identifier(self, identifier, metadataPrefix):
         """
@@ -157,33 +405,133 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
             except ValueError:
                 logger.exception("Ignoring invalid paper with header %s" % header.identifier())
 
-    def process_records(self, listRecords, format):
+    def process_records(self, listRecords, format, checkpoint=None):
         """
-        Save as :class:`Paper` all the records contained in this list
+        Save as :class:`Paper` all the records contained in this list.
+
+        Records are translated by a pool of :attr:`translate_processes`
+        processes (or in this process if there are none), while the
+        translated papers are saved by batches of :attr:`batch_size`, each
+        in one transaction. Invalid papers are skipped without aborting
+        the rest of their batch, and the records which could not be
+        translated are counted in the metrics.
+
+        :param listRecords: the records, as returned by :meth:`list_records`
+            or pyoai
+        :param format: the metadata format of the records
+        :param checkpoint: if provided, it is called every
+            :attr:`checkpoint_every` records with the resumption token of
+            the page of the latest saved record and the latest datestamp of
+            the saved records, once they are committed
+        :returns: the :class:`IngestMetrics` of the ingestion
         """
         # check that we have at least one translator, otherwise
         # it's not really worth trying…
         if not self.translators:
             raise ValueError("No OAI translators have been set up: " +
                              "We cannot save any record.")
+        if format not in self.translators:
+            logger.warning("Unknown metadata format %s, skipping" % format)
+            return
 
-        last_report = datetime.now()
-        processed_since_report = 0
-
+        metrics = IngestMetrics()
+        pool = None
+        # resumption token and latest datestamp of each batch, in order
+        checkpoints = deque()
+        latest_datestamp = None
+        since_checkpoint = 0
         with ParallelGenerator(listRecords, max_lookahead=1000) as g:
-            for record in g:
-                header = record[0]
-                metadata = record[1]._map
-
-                self.process_record(header, metadata, format)
-
-                # rate reporting
-                processed_since_report += 1
-                if processed_since_report >= 1000:
-                    td = datetime.now() - last_report
-                    rate = 'infty'
-                    if td.seconds:
-                        rate = str(processed_since_report / td.seconds)
-                    logger.info("current rate: %s records/s" % rate)
-                    processed_since_report = 0
-                    last_report = datetime.now()
+            batches = self._record_batches(g, checkpoints)
+            if self.translate_processes:
+                # the workers would otherwise share our database connection
+                connections.close_all()
+                pool = Pool(self.translate_processes, initializer=_init_translate_worker, initargs=(self.translators,))
+                translated = self._translate_in_pool(pool, format, batches)
+            else:
+                translated = (translate_records(self.translators, format, batch) for batch in batches)
+
+            try:
+                for papers, translate_time, failed in translated:
+                    start = time.monotonic()
+                    self.save_papers(papers)
+                    metrics.add(len(papers), translate_time, time.monotonic() - start, failed)
+                    if failed:
+                        logger.warning("Could not translate %d records of %s" % (failed, self.oaisource.identifier))
+                    if metrics.since_report >= self.report_every:
+                        metrics.report()
+
+                    token, datestamp = checkpoints.popleft()
+                    if datestamp is not None and (latest_datestamp is None or datestamp > latest_datestamp):
+                        latest_datestamp = datestamp
+                    since_checkpoint += len(papers)
+                    if checkpoint is not None and since_checkpoint >= self.checkpoint_every:
+                        checkpoint(token, latest_datestamp)
+                        since_checkpoint = 0
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+
+        metrics.report()
+        return metrics
+
+    def _translate_in_pool(self, pool, format, batches):
+        """
+        Translates the batches in the pool and returns the results in
+        order. At most two batches per process wait for a worker, so that
+        the records are not fetched faster than they are saved.
+        """
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_translate_batch, (format, batch)))
+            if len(pending) > 2 * self.translate_processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def _record_batches(self, records, checkpoints):
+        """
+        Groups the records (as returned by :meth:`list_records` or pyoai)
+        in lists of :attr:`batch_size` pairs of header and metadata, which
+        can be sent to another process. Deleted records are skipped.
+
+        :param checkpoints: a deque to which the resumption token and the
+            latest datestamp of each batch are appended
+        """
+        batch = []
+        token = None
+        datestamp = None
+        for record in records:
+            header, metadata = record[0], record[1]
+            if len(record) > 2:
+                token = record[2]
+            if header.datestamp() is not None and (datestamp is None or header.datestamp() > datestamp):
+                datestamp = header.datestamp()
+            if metadata is None:
+                continue
+            header = Header(None, header.identifier(), header.datestamp(), [str(spec) for spec in header.setSpec()], header.isDeleted())
+            batch.append((header, metadata._map))
+            if len(batch) >= self.batch_size:
+                checkpoints.append((token, datestamp))
+                yield batch
+                batch = []
+                datestamp = None
+        if batch:
+            checkpoints.append((token, datestamp))
+            yield batch
+
+    def save_papers(self, papers):
+        """
+        Saves a batch of translated papers in one transaction.
+        Each invalid paper only rolls back its own savepoint.
+
+        :param papers: list of :class:`BarePaper`, possibly containing None
+        :returns: the list of saved :class:`Paper`
+        """
+        bare_papers = [paper for paper in papers if paper is not None]
+        with transaction.atomic():
+            saved = [paper for paper in Paper.from_bare_batch(bare_papers) if paper is not None]
+            Paper.bulk_update_index(saved, deferred=True)
+        if len(saved) < len(bare_papers):
+            logger.info("Ignored %d invalid papers" % (len(bare_papers) - len(saved)))
+        return saved
@@ -18,7 +18,23 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 #
 
+import re
+
+from io import BytesIO
+from lxml import etree
+from oaipmh import error
+from oaipmh.common import Header
+from oaipmh.common import Metadata
+from oaipmh.datestamp import datestamp_to_datetime
 from oaipmh.metadata import MetadataReader
+from oaipmh.metadata import oai_dc_reader
+
+OAI_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/'
+
+#: error codes of OAI-PMH, see :meth:`oaipmh.client.BaseClient.makeRequestErrorHandling`
+OAI_ERROR_CODES = ['badArgument', 'badResumptionToken', 'badVerb',
+    'cannotDisseminateFormat', 'idDoesNotExist', 'noRecordsMatch',
+    'noMetadataFormats', 'noSetHierarchy']
 
 base_dc_reader = MetadataReader(
     fields={
@@ -56,3 +72,136 @@ base_dc_reader = MetadataReader(
     'dc' : 'http://purl.org/dc/elements/1.1/'}
     )
 
+
+
+class StreamingMetadataReader(object):
+    """
+    Reads the same metadata as a :class:`MetadataReader`, but in one pass
+    over the children of the metadata element instead of one XPath
+    evaluation per field.
+
+    Only ``textList`` fields of the form ``ns:container/ns:element/text()``
+    are supported, as in :data:`base_dc_reader`.
+    """
+    field_re = re.compile(r'^(\w+):(\w+)/(\w+):(\w+)/text\(\)$')
+
+    def __init__(self, reader):
+        self.field_names = list(reader._fields)
+        #: maps the tags of a container and of its child to a field name
+        self.fields = {}
+        for name, (field_type, expr) in reader._fields.items():
+            match = self.field_re.match(expr)
+            if field_type != 'textList' or not match:
+                raise ValueError('Unsupported field for streaming: {}'.format(name))
+            container_ns, container, element_ns, element = match.groups()
+            key = ('{%s}%s' % (reader._namespaces[container_ns], container),
+                   '{%s}%s' % (reader._namespaces[element_ns], element))
+            self.fields[key] = name
+
+    def __call__(self, element):
+        map = {name: [] for name in self.field_names}
+        for container in element:
+            for child in container:
+                name = self.fields.get((container.tag, child.tag))
+                if name is None:
+                    continue
+                # the text nodes of the element, as text() selects them
+                if child.text:
+                    map[name].append(child.text)
+                map[name].extend(grandchild.tail for grandchild in child if grandchild.tail)
+        return Metadata(None, map)
+
+
+#: the streaming readers, by metadata format
+streaming_readers = {
+    'oai_dc': StreamingMetadataReader(oai_dc_reader),
+    'base_dc': StreamingMetadataReader(base_dc_reader),
+}
+
+
+def depth(element):
+    """
+    Number of ancestors of an element
+    """
+    result = 0
+    element = element.getparent()
+    while element is not None:
+        result += 1
+        element = element.getparent()
+    return result
+
+
+class RecordsPage(object):
+    """
+    The records of an OAI-PMH response (to ListRecords or GetRecord),
+    parsed incrementally with iterparse when iterating over the page.
+    Each record is cleared once read, so only one record is held in memory
+    as a tree.
+
+    Records are (header, metadata) pairs as built by pyoai, except that
+    they do not hold their XML element. The metadata is None for deleted
+    records. The resumption token of the page is available once all its
+    records have been read.
+    """
+
+    def __init__(self, xml, reader):
+        """
+        :param xml: the response, as bytes
+        :param reader: the :class:`StreamingMetadataReader` for the format
+            of the records
+        """
+        self.xml = xml
+        self.reader = reader
+        self.resumption_token = None
+
+    def __iter__(self):
+        tags = ['{%s}%s' % (OAI_NAMESPACE, tag) for tag in ['record', 'resumptionToken', 'error']]
+        try:
+            for event, element in etree.iterparse(BytesIO(self.xml), events=('end',), tag=tags):
+                tag = etree.QName(element).localname
+                # skip the elements of the OAI namespace in the metadata
+                if depth(element) != (1 if tag == 'error' else 2):
+                    continue
+                if tag == 'record':
+                    yield self.read_record(element)
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+                elif tag == 'resumptionToken':
+                    self.resumption_token = (element.text or '').strip() or None
+                else:
+                    self.raise_error(element)
+        except etree.XMLSyntaxError as e:
+            raise error.XMLSyntaxError(str(e))
+
+    def read_record(self, element):
+        identifier = None
+        datestamp = None
+        setspecs = []
+        deleted = False
+        metadata = None
+        for child in element:
+            tag = etree.QName(child).localname if isinstance(child.tag, str) else None
+            if tag == 'header':
+                deleted = child.get('status') == 'deleted'
+                for field in child:
+                    field_tag = etree.QName(field).localname if isinstance(field.tag, str) else None
+                    if field_tag == 'identifier':
+                        identifier = field.text or ''
+                    elif field_tag == 'datestamp':
+                        datestamp = datestamp_to_datetime(field.text or '')
+                    elif field_tag == 'setSpec':
+                        setspecs.append(field.text or '')
+            elif tag == 'metadata':
+                metadata = self.reader(child)
+        return Header(None, identifier, datestamp, setspecs, deleted), metadata
+
+    def raise_error(self, element):
+        """
+        Raises the exception pyoai raises for this error element
+        """
+        code = element.get('code')
+        if code not in OAI_ERROR_CODES:
+            raise error.UnknownError(
+                "Unknown error code from server: %s, message: %s" % (code, element.text))
+        raise getattr(error, code[0].upper() + code[1:] + 'Error')(element.text)
@@ -20,12 +20,26 @@
 
 
 import logging
-import json
 import os
+import time
 
-from django.conf import settings
+from collections import deque
+from itertools import count
+from itertools import islice
+from itertools import takewhile
+from multiprocessing import Pool
 
-from backend.citeproc import CrossRef
+from django.conf import settings
+from django.db import DataError
+from django.db import connections
+from django.db import transaction
+
+from backend.citeproc import CiteprocError
+from backend.citeproc import DOIResolver
+from backend.orciddump import DumpImportMetrics
+from backend.orciddump import OrcidDumpProfile
+from backend.orciddump import dump_members
+from backend.orciddump import parse_profiles
 from backend.papersource import PaperSource
 from notification.api import add_notification_for
 from notification.api import delete_notification_per_tag
@@ -35,19 +49,28 @@ from papers.baremodels import BarePaper
 from papers.errors import MetadataSourceException
 from papers.models import OaiSource
 from papers.models import OaiRecord
+from papers.models import OrcidWorkVersion
 from papers.models import Researcher
 from papers.models import Paper
 from papers.orcid import OrcidProfile
 from papers.orcid import affiliate_author_with_orcid
 from papers.utils import validate_orcid
+from dissemin.settings import redis_client
 from search import SearchQuerySet
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+ORCID_DUMP_CHECKPOINT_KEY = 'dissemin-orcid-dump-{}'
+
 ### Paper fetching ####
 
 class OrcidPaperSource(PaperSource):
 
+    #: Number of works without DOI saved together
+    batch_size = 50
+    #: Number of profiles imported from a dump between two progress reports
+    dump_report_every = 10000
+
     def __init__(self, *args, **kwargs):
         super(OrcidPaperSource, self).__init__(*args, **kwargs)
         self.oai_source = OaiSource.objects.get(identifier='orcid')
@@ -103,55 +126,95 @@ class OrcidPaperSource(PaperSource):
         return []
 
     def create_paper(self, work):
-        assert (not work.skipped)
-        # Create paper
-        authors, orcids = work.authors_and_orcids
-        paper = BarePaper.create(
-            work.title,
-            authors,
-            work.pubdate,
-            visible=True,
-            affiliations=None,
-            orcids=orcids,
-        )
-        record = BareOaiRecord(
-            source=self.oai_source,
-            identifier=work.api_uri,
-            splash_url=work.splash_url,
-            pubtype=work.pubtype
-        )
-
-        paper.add_oairecord(record)
+        return self.create_papers([work])[0]
 
-        try:
-            p = Paper.from_bare(paper)
-            p = self.associate_researchers(p)
-            p.save()
-            p.update_index()
-        except ValueError:
-            p = None
+    def create_papers(self, works):
+        """
+        Creates papers from a list of ORCID works, saving them with
+        Paper.from_bare_batch.
+
+        :returns: the list of papers, in the order of works, with None
+            for the works which could not be saved
+        """
+        bare_papers = []
+        for work in works:
+            assert (not work.skipped)
+            # Create paper
+            authors, orcids = work.authors_and_orcids
+            paper = BarePaper.create(
+                work.title,
+                authors,
+                work.pubdate,
+                visible=True,
+                affiliations=None,
+                orcids=orcids,
+            )
+            record = BareOaiRecord(
+                source=self.oai_source,
+                identifier=work.api_uri,
+                splash_url=work.splash_url,
+                pubtype=work.pubtype
+            )
+
+            paper.add_oairecord(record)
+            bare_papers.append(paper)
+
+        papers = Paper.from_bare_batch(bare_papers)
+        for idx, p in enumerate(papers):
+            if p is None:
+                continue
+            try:
+                p = self.associate_researchers(p)
+                p.save()
+            except ValueError:
+                p = None
+            papers[idx] = p
 
-        return p
+        Paper.bulk_update_index([p for p in papers if p is not None])
+        return papers
 
     def _oai_id_for_doi(self, orcid_id, doi):
         return 'orcid:{}:{}'.format(orcid_id, doi)
 
     def fetch_metadata_from_dois(self, ref_name, orcid_id, dois):
-        crossref_papers = CrossRef.fetch_batch(dois)
-        for paper, doi in zip(crossref_papers, dois):
-            if paper is None:
-                # We try with DOI resolver
-                # This functions does check first on our database if we have an entry
-                Paper.create_by_doi(doi)
+        """
+        Fetches the papers of the given DOIs and associates them with the
+        researcher. The DOIs which are already in our database and up to
+        date are not fetched again, the others are read from the DOI cache
+        or fetched from CrossRef and then from the DOI resolver, see
+        :meth:`DOIResolver.resolve_many`.
+
+        :returns: a generator of papers (or None), in the order of dois
+        """
+        papers = DOIResolver.up_to_date_papers(dois)
+        to_fetch = [doi for doi in dois if doi not in papers]
+        logger.info("%d DOIs up to date, %d to fetch" % (len(dois) - len(to_fetch), len(to_fetch)))
+        entries = DOIResolver.resolve_many(to_fetch) if to_fetch else {}
+        for doi in dois:
+            paper = papers.get(doi)
+            if paper is None and doi in entries:
+                try:
+                    paper = DOIResolver.entry_to_paper(entries.pop(doi))
+                except CiteprocError as e:
+                    logger.info(e)
+                papers[doi] = paper
             yield self._enhance_paper(paper, ref_name, orcid_id)
 
-    def warn_user_of_ignored_papers(self, ignored_papers):
+    def warn_user_of_ignored_papers(self, ignored_papers, replace=True):
+        """
+        Notifies the user of the researcher of the works which could not
+        be imported.
+
+        :param replace: delete the previous notifications about ignored
+            works. Otherwise, the new works are notified in addition to them.
+        """
         if self.researcher is None:
             return
         user = self.researcher.user
         if user is None:
             return
-        delete_notification_per_tag(user, 'backend_orcid')
+        if replace:
+            delete_notification_per_tag(user, 'backend_orcid')
         if ignored_papers:
             notification = {
                 'code': 'IGNORED_PAPERS',
@@ -180,19 +243,29 @@ class OrcidPaperSource(PaperSource):
                         author.researcher_id = researcher.id
                 paper.authors_list = [author.serialize() for author in new_authors]
                 papers_to_update.append(paper)
-                paper.update_index()
 
         if papers_to_update:
             Paper.objects.bulk_update(papers_to_update, ['authors_list'])
+            Paper.bulk_update_index(papers_to_update)
 
 
-    def fetch_orcid_records(self, orcid_identifier, profile=None, use_doi=True):
+    def fetch_orcid_records(self, orcid_identifier, profile=None, use_doi=True, incremental=True, researcher=None):
         """
         Queries ORCiD to retrieve the publications associated with a given ORCiD.
         It also fetches such papers from the CrossRef search interface.
 
+        When the generator is exhausted, the versions of the works which
+        were imported or ignored because of their metadata are stored as
+        :class:`OrcidWorkVersion`, so that the next incremental harvests
+        only fetch new or modified works, and those which failed. The
+        records of the works which were removed from the profile are deleted.
+
         :param profile: The ORCID profile if it has already been fetched before (format: parsed JSON).
         :param use_doi: Fetch the publications by DOI when we find one (recommended, but slow)
+        :param incremental: Only fetch the works which changed since the
+            previous harvest of the profile
+        :param researcher: the :class:`Researcher` of the profile, if it has
+            just been updated from the profile: it is not updated again
         :returns: a generator, where all the papers found are yielded. (some of them could be in
                 free form, hence not imported)
         """
@@ -210,7 +283,7 @@ class OrcidPaperSource(PaperSource):
             return
 
         # As we have fetched the profile, let's update the Researcher
-        self.researcher = Researcher.get_or_create_by_orcid(orcid_identifier,
+        self.researcher = researcher or Researcher.get_or_create_by_orcid(orcid_identifier,
                 profile.json, update=True)
         if not self.researcher:
             return
@@ -218,6 +291,27 @@ class OrcidPaperSource(PaperSource):
         # Reference name
         ref_name = profile.name
         ignored_papers = []  # list of ignored papers due to incomplete metadata
+        done_put_codes = set()  # works imported or ignored, not to be fetched again
+
+        # Only keep the works which changed since the last harvest
+        summaries = profile.work_summaries
+        known_versions = {}
+        if incremental:
+            known_versions = {
+                version.put_code: version
+                for version in OrcidWorkVersion.objects.filter(researcher=self.researcher)
+            }
+            current_put_codes = set(summary.put_code for summary in summaries)
+            removed = [version for put_code, version in known_versions.items() if put_code not in current_put_codes]
+            if removed:
+                self.remove_works(orcid_id, profile, removed)
+            summaries = [
+                summary for summary in summaries
+                if summary.put_code not in known_versions
+                or summary.last_modified is None
+                or known_versions[summary.put_code].last_modified != summary.last_modified
+            ]
+            logger.info("%d new or modified works in the ORCID profile %s" % (len(summaries), orcid_id))
 
         # Get summary publications and separate them in two classes:
         # - the ones with DOIs, that we will fetch with CrossRef
@@ -225,7 +319,7 @@ class OrcidPaperSource(PaperSource):
         # - the ones without: we will fetch ORCID's metadata about them
         #   and try to create a paper with what they provide
         put_codes = []
-        for summary in profile.work_summaries:
+        for summary in summaries:
             if summary.doi and use_doi:
                 dois_and_putcodes.append((summary.doi.lower(), summary.put_code))
             else:
@@ -237,12 +331,14 @@ class OrcidPaperSource(PaperSource):
             dois = [doi for doi, put_code in dois_and_putcodes]
             for idx, paper in enumerate(self.fetch_metadata_from_dois(ref_name, orcid_id, dois)):
                 if paper is not None:
+                    done_put_codes.add(dois_and_putcodes[idx][1])
                     yield paper
                 else:
                     put_codes.append(dois_and_putcodes[idx][1])
 
         # 2nd attempt with ORCID's own crappy metadata
         works = profile.fetch_works(put_codes)
+        batch = []
         for work in works:
             if not work:
                 continue
@@ -254,14 +350,82 @@ class OrcidPaperSource(PaperSource):
                 logger.warning("Work skipped due to incorrect metadata. \n %s \n %s" % (work.reason, work.skip_reason))
 
                 ignored_papers.append(work.as_dict())
+                done_put_codes.add(work.put_code)
                 continue
 
-            yield self.create_paper(work)
-
-        self.warn_user_of_ignored_papers(ignored_papers)
+            batch.append(work)
+            if len(batch) >= self.batch_size:
+                yield from self._create_papers_of_works(batch, done_put_codes)
+                batch = []
+        if batch:
+            yield from self._create_papers_of_works(batch, done_put_codes)
+
+        # an incremental harvest does not see the works ignored previously,
+        # so it keeps the notifications about them
+        if ignored_papers or not incremental:
+            self.warn_user_of_ignored_papers(ignored_papers, replace=not incremental)
         if ignored_papers:
             logger.warning("Total ignored papers: %d" % (len(ignored_papers)))
 
+        self.save_work_versions([summary for summary in summaries if summary.put_code in done_put_codes])
+
+    def _create_papers_of_works(self, works, done_put_codes):
+        """
+        Creates the papers of a batch of works, adding the put codes of
+        those which could be saved to done_put_codes.
+        """
+        papers = self.create_papers(works)
+        for work, paper in zip(works, papers):
+            if paper is not None:
+                done_put_codes.add(work.put_code)
+        return papers
+
+    def save_work_versions(self, summaries):
+        """
+        Stores the versions of the given work summaries for the current
+        researcher, replacing the previous ones.
+        """
+        with transaction.atomic():
+            OrcidWorkVersion.objects.filter(
+                researcher=self.researcher,
+                put_code__in=[summary.put_code for summary in summaries]
+            ).delete()
+            OrcidWorkVersion.objects.bulk_create([
+                OrcidWorkVersion(
+                    researcher=self.researcher,
+                    put_code=summary.put_code,
+                    last_modified=summary.last_modified,
+                    doi=summary.doi.lower() if summary.doi else None)
+                for summary in summaries
+            ])
+
+    def remove_works(self, orcid_id, profile, versions):
+        """
+        Deletes the records created from works which were removed from an
+        ORCID profile, as well as the papers left without any record.
+
+        :param versions: the :class:`OrcidWorkVersion` of the removed works
+        """
+        identifiers = []
+        for version in versions:
+            identifiers.append(profile.api_uri + 'work/{put_code}'.format(put_code=version.put_code))
+            if version.doi:
+                identifiers.append(self._oai_id_for_doi(orcid_id, version.doi))
+        logger.info("%d works removed from the ORCID profile %s" % (len(versions), orcid_id))
+
+        with transaction.atomic():
+            records = OaiRecord.objects.filter(source=self.oai_source, identifier__in=identifiers)
+            paper_ids = set(records.values_list('about_id', flat=True))
+            records.delete()
+            OrcidWorkVersion.objects.filter(pk__in=[version.pk for version in versions]).delete()
+            for paper in Paper.objects.filter(pk__in=paper_ids):
+                if paper.is_orphan():
+                    paper.remove_from_index()
+                    paper.delete()
+                else:
+                    paper.update_availability()
+                    paper.update_index()
+
     def fetch_and_save(self, researcher, profile=None):
         """
         Fetch papers and save them to the database.
@@ -280,36 +444,109 @@ class OrcidPaperSource(PaperSource):
                 count += 1
 
 
-    def bulk_import(self, directory, fetch_papers=True, use_doi=False):
+    def bulk_import(self, archive, fetch_papers=True, use_doi=False, processes=None, batch_size=100, restart=False):
         """
-        Bulk-imports ORCID profiles from a dump
+        Bulk-imports ORCID profiles from the public data file
         (warning: this still uses our DOI cache).
-        The directory should contain json versions
-        of orcid profiles, as in the official ORCID
-        dump.
-        """
 
-        for root, _, fnames in os.walk(directory):
-            for fname in fnames:
-                #if fname == '0000-0003-1349-4524.json':
-                #    seen = True
-                #if not seen:
-                #    continue
-
-                with open(os.path.join(root, fname), 'r') as f:
-                    try:
-                        profile = json.load(f)
-                        orcid = profile['orcid-profile'][
-                                        'orcid-identifier'][
-                                        'path']
-                        r = Researcher.get_or_create_by_orcid(
-                            orcid, profile, update=True)
-                        if fetch_papers:
-                            papers = self.fetch_orcid_records(orcid,
-                                profile=OrcidProfile(json=profile),
-                                use_doi=use_doi)
-                            for p in papers:
-                                self.save_paper(p, r)
-                    except (ValueError, KeyError):
-                        logger.warning("Invalid profile: %s" % fname)
+        The tarball is streamed: its profiles, in XML or JSON, are parsed
+        by a pool of processes and the researchers of each batch of
+        profiles are saved in one transaction. The last member of the
+        archive imported is stored in Redis, so that an interrupted import
+        is resumed where it stopped when called again.
+
+        Only the parsing runs in the pool. The dump only has the summaries
+        of the works, so with fetch_papers the works of each profile are
+        then fetched from the ORCID API, one profile at a time: this makes
+        about one request per 25 works and is by far the slowest part of
+        the import.
+
+        :param archive: the path to the tarball, or to a directory where
+            it was unpacked
+        :param fetch_papers: also create the papers of the profiles
+        :param use_doi: fetch the metadata of the papers with a DOI from
+            CrossRef, instead of ORCID
+        :param processes: the number of processes parsing the profiles
+            (defaults to the number of CPUs, 0 to parse them in this process)
+        :param batch_size: the number of profiles saved in each transaction
+        :param restart: ignore the progress of a previous import
+        :returns: the :class:`DumpImportMetrics` of the import
+        """
+        checkpoint_key = ORCID_DUMP_CHECKPOINT_KEY.format(os.path.basename(os.path.normpath(archive)))
+        if restart:
+            redis_client.delete(checkpoint_key)
+        start_after = redis_client.get(checkpoint_key)
+        if start_after is not None:
+            start_after = start_after.decode('utf-8')
+            logger.info("Resuming import of %s after %s" % (archive, start_after))
+
+        members = dump_members(archive, start_after=start_after)
+        batches = (list(islice(members, batch_size)) for _ in count())
+        batches = takewhile(bool, batches)
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        metrics = DumpImportMetrics()
+        if processes:
+            # Each process would otherwise share our database connection
+            connections.close_all()
+            with Pool(processes) as pool:
+                # the archive is read as profiles are saved, not ahead
+                pending = deque()
+                for batch in batches:
+                    pending.append(pool.apply_async(parse_profiles, (batch,)))
+                    if len(pending) > 2 * processes:
+                        self._save_dump_batch(pending.popleft().get(), fetch_papers, use_doi, checkpoint_key, metrics)
+                while pending:
+                    self._save_dump_batch(pending.popleft().get(), fetch_papers, use_doi, checkpoint_key, metrics)
+        else:
+            for batch in batches:
+                self._save_dump_batch(parse_profiles(batch), fetch_papers, use_doi, checkpoint_key, metrics)
+
+        redis_client.delete(checkpoint_key)
+        metrics.report()
+        return metrics
+
+    def _save_dump_batch(self, parsed, fetch_papers, use_doi, checkpoint_key, metrics):
+        """
+        Saves a batch of profiles returned by :func:`parse_profiles` and
+        stores the last member of the batch as checkpoint.
 
+        The dump only contains the summaries of the works, so the papers
+        are created with :meth:`fetch_orcid_records`, which fetches the
+        works from the ORCID API (and from CrossRef with use_doi), one
+        profile after the other.
+        """
+        profiles, parse_time = parsed
+        start = time.monotonic()
+        invalid = 0
+        with transaction.atomic():
+            researchers = []
+            for name, result in profiles:
+                if result is None:
+                    invalid += 1
+                    continue
+                orcid, profile = result
+                profile = OrcidDumpProfile(orcid_id=orcid, json=profile)
+                try:
+                    with transaction.atomic():
+                        researcher = Researcher.get_or_create_by_orcid(orcid, profile, update=True)
+                except (ValueError, KeyError, DataError, MetadataSourceException):
+                    researcher = None
+                if researcher is None:
+                    logger.warning("Invalid profile: %s" % name)
+                    invalid += 1
+                    continue
+                researchers.append((orcid, profile, researcher))
+
+        # outside of the transaction, as this makes requests to ORCID and CrossRef
+        papers = 0
+        if fetch_papers:
+            for orcid, profile, researcher in researchers:
+                papers += sum(1 for paper in self.fetch_orcid_records(orcid, profile=profile, use_doi=use_doi, researcher=researcher) if paper is not None)
+
+        metrics.add(len(profiles), invalid, papers, parse_time, time.monotonic() - start)
+        if profiles:
+            redis_client.set(checkpoint_key, profiles[-1][0])
+        if metrics.since_report >= self.dump_report_every:
+            metrics.report(profiles[-1][0] if profiles else None)
@@ -0,0 +1,335 @@
+# -*- encoding: utf-8 -*-
+
+# Dissemin: open access policy enforcement tool
+# Copyright (C) 2014 Antonin Delpeuch
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+Reading of the ORCID public data file, which is published every year as
+a tarball with one profile per file, either in XML or in JSON (API 2.0,
+2.1 or 3.0).
+
+The profiles are converted to the JSON layout of the 2.1 public API, so
+that they can be read by :class:`papers.orcid.OrcidProfile`. Only the
+parts of the profiles that we use are kept.
+"""
+
+import json
+import logging
+import os
+import tarfile
+import time
+
+import dateutil.parser
+from lxml import etree
+
+from papers.orcid import OrcidProfile
+from papers.orcid import OrcidWorkSummary
+from papers.utils import jpath
+from papers.utils import validate_orcid
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+DUMP_SUFFIXES = ('.json', '.xml')
+
+#: sections of the activities which are kept in the profiles
+ACTIVITIES = ['employments', 'educations', 'works']
+
+
+def dump_members(archive, start_after=None):
+    """
+    Streams the profiles contained in an ORCID dump, without unpacking it.
+
+    :param archive: the path to the tarball (possibly compressed) or to a
+        directory where it has been unpacked
+    :param start_after: the name of a member: the members up to this
+        one are skipped
+    :returns: a generator of (member name, content as bytes)
+    """
+    if os.path.isdir(archive):
+        members = _directory_members(archive)
+    else:
+        members = _tarball_members(archive)
+
+    skipping = start_after is not None
+    for name, read in members:
+        if skipping:
+            skipping = name != start_after
+            continue
+        yield name, read()
+
+def _directory_members(directory):
+    for root, dirs, fnames in os.walk(directory):
+        dirs.sort()
+        for fname in sorted(fnames):
+            if fname.endswith(DUMP_SUFFIXES):
+                path = os.path.join(root, fname)
+                yield os.path.relpath(path, directory), lambda: _read_file(path)
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _tarball_members(path):
+    # the tarball is read as a stream, so the members have to be read in order
+    with tarfile.open(path, 'r|*') as tar:
+        for member in tar:
+            # the headers of the members are not needed once read, and the
+            # dump has millions of them
+            tar.members = []
+            if member.isfile() and member.name.endswith(DUMP_SUFFIXES):
+                yield member.name, lambda: tar.extractfile(member).read()
+
+
+def parse_profile(name, content):
+    """
+    Parses a profile from the ORCID dump.
+
+    :param name: the name of the file, whose extension gives the format
+    :param content: the content of the file
+    :returns: the ORCID id and the profile in the layout of the 2.1 API,
+        or None if the profile is invalid
+    """
+    try:
+        if name.endswith('.xml'):
+            profile = profile_from_xml(content)
+        else:
+            profile = normalize_profile(json.loads(content.decode('utf-8')))
+    except (ValueError, KeyError, TypeError, AttributeError, etree.XMLSyntaxError):
+        logger.warning("Invalid profile: %s" % name)
+        return None
+    orcid = validate_orcid(jpath('orcid-identifier/path', profile))
+    if orcid is None:
+        logger.warning("Invalid profile: %s" % name)
+        return None
+    return orcid, profile
+
+def parse_profiles(members):
+    """
+    Parses a batch of profiles, in a worker process.
+
+    :param members: a list of (member name, content)
+    :returns: the list of (member name, result of :func:`parse_profile`)
+        and the time spent parsing, in seconds
+    """
+    start = time.monotonic()
+    profiles = [(name, parse_profile(name, content)) for name, content in members]
+    return profiles, time.monotonic() - start
+
+
+def normalize_profile(profile):
+    """
+    Converts a JSON profile of the 2.0, 2.1 or 3.0 API to the layout of
+    the 2.1 API, dropping the activities we do not use.
+    """
+    activities = profile.get('activities-summary') or {}
+    normalized = {
+        'orcid-identifier': profile['orcid-identifier'],
+        'person': profile.get('person') or {},
+        'activities-summary': {section: activities.get(section) for section in ACTIVITIES},
+    }
+    for section in ['employment', 'education']:
+        affiliations = activities.get(section + 's') or {}
+        if 'affiliation-group' in affiliations:
+            # 3.0 API: the summaries are grouped
+            normalized['activities-summary'][section + 's'] = {
+                section + '-summary': [
+                    summary[section + '-summary']
+                    for group in affiliations['affiliation-group'] or []
+                    for summary in group.get('summaries') or []
+                ]
+            }
+    return normalized
+
+
+def _children(element, name):
+    if element is None:
+        return []
+    return [child for child in element if isinstance(child.tag, str) and etree.QName(child).localname == name]
+
+def _child(element, *path):
+    for name in path:
+        children = _children(element, name)
+        element = children[0] if children else None
+    return element
+
+def _text(element, *path):
+    element = _child(element, *path)
+    if element is not None and element.text and element.text.strip():
+        return element.text.strip()
+
+def _value(element, *path):
+    text = _text(element, *path)
+    if text is not None:
+        return {'value': text}
+
+def _timestamp(element, *path):
+    """
+    Converts a date of the XML schema to milliseconds since the epoch, as
+    in the JSON API.
+    """
+    text = _text(element, *path)
+    if text is not None:
+        return {'value': int(1000 * dateutil.parser.parse(text).timestamp())}
+
+def profile_from_xml(content):
+    """
+    Converts an XML profile of the 2.0, 2.1 or 3.0 schema to the JSON
+    layout of the 2.1 API. Namespaces are ignored, as they change with
+    the versions of the schema.
+    """
+    record = etree.fromstring(content)
+    identifier = _child(record, 'orcid-identifier')
+    if identifier is None:
+        raise ValueError('No ORCID identifier')
+
+    person = _child(record, 'person')
+    name = _child(person, 'name')
+    profile = {
+        'orcid-identifier': {
+            'uri': _text(identifier, 'uri'),
+            'path': _text(identifier, 'path'),
+            'host': _text(identifier, 'host'),
+        },
+        'person': {
+            'name': {
+                'given-names': _value(name, 'given-names'),
+                'family-name': _value(name, 'family-name'),
+                'credit-name': _value(name, 'credit-name'),
+            } if name is not None else None,
+            'other-names': {
+                'other-name': [
+                    {'content': _text(other_name, 'content')}
+                    for other_name in _children(_child(person, 'other-names'), 'other-name')
+                ]
+            },
+            'researcher-urls': {
+                'researcher-url': [
+                    {'url-name': _text(url, 'url-name'), 'url': _value(url, 'url')}
+                    for url in _children(_child(person, 'researcher-urls'), 'researcher-url')
+                ]
+            },
+        },
+        'activities-summary': {},
+    }
+
+    activities = _child(record, 'activities-summary')
+    for section in ['employment', 'education']:
+        container = _child(activities, section + 's')
+        # in the 3.0 schema, the summaries are grouped in affiliation-groups
+        summaries = container.iter('{*}' + section + '-summary') if container is not None else []
+        profile['activities-summary'][section + 's'] = {
+            section + '-summary': [_affiliation_from_xml(summary) for summary in summaries]
+        }
+
+    profile['activities-summary']['works'] = {
+        'group': [
+            {'work-summary': [_work_summary_from_xml(summary) for summary in _children(group, 'work-summary')]}
+            for group in _children(_child(activities, 'works'), 'group')
+        ]
+    }
+    return profile
+
+def _affiliation_from_xml(summary):
+    organization = _child(summary, 'organization')
+    disambiguated = _child(organization, 'disambiguated-organization')
+    return {
+        'organization': {
+            'name': _text(organization, 'name'),
+            'address': {
+                'city': _text(organization, 'address', 'city'),
+                'country': _text(organization, 'address', 'country'),
+            },
+            'disambiguated-organization': {
+                'disambiguated-organization-identifier': _text(disambiguated, 'disambiguated-organization-identifier'),
+                'disambiguation-source': _text(disambiguated, 'disambiguation-source'),
+            } if disambiguated is not None else None,
+        }
+    }
+
+def _work_summary_from_xml(summary):
+    put_code = summary.get('put-code')
+    return {
+        'put-code': int(put_code) if put_code else None,
+        'title': {'title': _value(summary, 'title', 'title')},
+        'last-modified-date': _timestamp(summary, 'last-modified-date'),
+        'external-ids': {
+            'external-id': [
+                {
+                    'external-id-type': _text(external_id, 'external-id-type'),
+                    'external-id-value': _text(external_id, 'external-id-value'),
+                    # lowercase in XML, uppercase in JSON
+                    'external-id-relationship': (_text(external_id, 'external-id-relationship') or '').upper() or None,
+                }
+                for external_id in _children(_child(summary, 'external-ids'), 'external-id')
+            ]
+        },
+    }
+
+
+class OrcidDumpProfile(OrcidProfile):
+    """
+    A profile read from the ORCID dump: the summaries of its works are
+    included in the profile, so they are not fetched from the API.
+    """
+
+    def _work_summaries_generator(self):
+        for group in jpath('activities-summary/works/group', self.json) or []:
+            for summary in group.get('work-summary') or []:
+                yield OrcidWorkSummary(summary)
+
+
+class DumpImportMetrics(object):
+    """
+    Progress of the import of an ORCID dump, reported in the logs as
+    profiles per second and average milliseconds spent parsing and saving
+    each profile.
+    """
+
+    def __init__(self):
+        self.profiles = 0
+        self.invalid = 0
+        self.papers = 0
+        self.parse_time = 0.
+        self.save_time = 0.
+        self.start = time.monotonic()
+        self.since_report = 0
+
+    def add(self, profiles, invalid, papers, parse_time, save_time):
+        self.profiles += profiles
+        self.invalid += invalid
+        self.papers += papers
+        self.parse_time += parse_time
+        self.save_time += save_time
+        self.since_report += profiles
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.start
+        return {
+            'profiles': self.profiles,
+            'invalid': self.invalid,
+            'papers': self.papers,
+            'profiles_per_second': round(self.profiles / elapsed, 1) if elapsed else None,
+            'parse_ms': round(1000 * self.parse_time / self.profiles, 2) if self.profiles else None,
+            'save_ms': round(1000 * self.save_time / self.profiles, 2) if self.profiles else None,
+        }
+
+    def report(self, member=None):
+        metrics = self.as_dict()
+        logger.info("ORCID dump import: " + " ".join("{}={}".format(key, value) for key, value in metrics.items()) +
+                    (" last={}".format(member) if member else ""), extra={'metrics': metrics})
+        self.since_report = 0
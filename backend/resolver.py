@@ -0,0 +1,210 @@
+# -*- encoding: utf-8 -*-
+
+# Dissemin: open access policy enforcement tool
+# Copyright (C) 2014 Antonin Delpeuch
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+In-process cache for the lookups done for every record during ingest:
+journals by ISSN or title, publishers by name and OAI sources by identifier.
+
+Results, including negative ones, are kept for a limited time in bounded
+LRU caches. The caches are local to a process: modifications of journals
+and publishers clear them in the process doing the modification, other
+processes see the change once the entries expire.
+"""
+
+import logging
+import threading
+
+from collections import OrderedDict
+from time import monotonic
+
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from papers.models import OaiSource
+from publishers.models import Journal
+from publishers.models import Publisher
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+_missing = object()
+
+
+class LRUCache(object):
+    """
+    A bounded mapping with least recently used eviction and expiry of entries.
+    Can be shared between threads.
+    """
+
+    def __init__(self, maxsize, ttl, negative_ttl=None):
+        """
+        :param maxsize: maximum number of entries
+        :param ttl: lifetime of an entry in seconds
+        :param negative_ttl: lifetime of an entry whose value is None, defaults to ttl
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=_missing):
+        """
+        :returns: the value stored for key, or default if there is none or it has expired
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > monotonic():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self.lock:
+            self.data[key] = (monotonic() + ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class Resolver(object):
+    """
+    Memoizes Journal.find, Publisher.find and the lookup of OaiSource by identifier.
+    """
+
+    def __init__(self, maxsize=50000, ttl=3600, negative_ttl=300):
+        self.journals_by_issn = LRUCache(maxsize, ttl, negative_ttl)
+        self.journals_by_title = LRUCache(maxsize, ttl, negative_ttl)
+        self.publishers = LRUCache(maxsize, ttl, negative_ttl)
+        self.sources = LRUCache(1000, ttl, negative_ttl)
+
+    def journal(self, issn=None, title=None):
+        """
+        Same as Journal.find(issn=issn, title=title)
+        """
+        if issn:
+            journal = self.journals_by_issn.get(issn)
+            if journal is _missing:
+                journal = Journal.find(issn=issn, title=None)
+                self.journals_by_issn.set(issn, journal)
+            if journal is not None:
+                return journal
+
+        if title:
+            key = title.upper()
+            journal = self.journals_by_title.get(key)
+            if journal is _missing:
+                journal = Journal.find(issn=None, title=title)
+                self.journals_by_title.set(key, journal)
+            return journal
+
+    def journals(self, issns, titles):
+        """
+        Set based version of journal: only the values missing from the cache are queried, with one query for ISSNs and one for titles.
+        :param issns: iterable of ISSNs
+        :param titles: iterable of journal titles
+        :returns: two dicts, mapping ISSNs and upper cased titles to journals or None
+        """
+        journals_by_issn = dict()
+        to_fetch = set()
+        for issn in set(filter(None, issns)):
+            journal = self.journals_by_issn.get(issn)
+            if journal is _missing:
+                to_fetch.add(issn)
+            else:
+                journals_by_issn[issn] = journal
+        if to_fetch:
+            for journal in Journal.objects.filter(Q(issn__in=to_fetch) | Q(essn__in=to_fetch)).select_related('publisher'):
+                for issn in (journal.issn, journal.essn):
+                    if issn in to_fetch and journals_by_issn.get(issn) is None:
+                        journals_by_issn[issn] = journal
+            for issn in to_fetch:
+                self.journals_by_issn.set(issn, journals_by_issn.setdefault(issn, None))
+
+        journals_by_title = dict()
+        to_fetch = set()
+        for title in set(title.upper() for title in titles if title):
+            journal = self.journals_by_title.get(title)
+            if journal is _missing:
+                to_fetch.add(title)
+            else:
+                journals_by_title[title] = journal
+        if to_fetch:
+            for journal in Journal.objects.annotate(upper_title=Upper('title')).filter(upper_title__in=to_fetch).select_related('publisher'):
+                journals_by_title.setdefault(journal.upper_title, journal)
+            for title in to_fetch:
+                self.journals_by_title.set(title, journals_by_title.setdefault(title, None))
+
+        return journals_by_issn, journals_by_title
+
+    def publisher(self, name):
+        """
+        Same as Publisher.find(name)
+        """
+        publisher = self.publishers.get(name)
+        if publisher is _missing:
+            publisher = Publisher.find(name)
+            self.publishers.set(name, publisher)
+        return publisher
+
+    def source(self, identifier):
+        """
+        Same as OaiSource.objects.get(identifier=identifier)
+        :raises: OaiSource.DoesNotExist
+        """
+        source = self.sources.get(identifier)
+        if source is _missing:
+            source = OaiSource.objects.filter(identifier=identifier).first()
+            self.sources.set(identifier, source)
+        if source is None:
+            raise OaiSource.DoesNotExist('No OaiSource with identifier {}'.format(identifier))
+        return source
+
+    def invalidate_publishers(self):
+        """
+        To be called when journals or publishers are modified. Journals are cleared as well, since they hold their publisher.
+        """
+        self.journals_by_issn.clear()
+        self.journals_by_title.clear()
+        self.publishers.clear()
+
+    def invalidate_sources(self):
+        self.sources.clear()
+
+    def invalidate(self):
+        self.invalidate_publishers()
+        self.invalidate_sources()
+
+
+resolver = Resolver()
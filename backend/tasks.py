@@ -22,13 +22,15 @@
 
 from celery import shared_task
 from celery.utils.log import get_task_logger
-from datetime import datetime
 from datetime import timedelta
 
+from django.conf import settings
 from django.utils import timezone
 
 from backend.citeproc import CrossRef
+from backend.indexing import index_dirty_papers as index_dirty_papers_in_bulk
 from backend.oai import OaiPaperSource
+from backend.oai import sources_to_harvest
 from backend.orcid import OrcidPaperSource
 from backend.utils import run_only_once
 from backend.zotero import consolidate_publication
@@ -126,23 +128,41 @@ def update_all_stats():
     AccessStatistics.update_all_stats(Publisher)
 
 
+@shared_task(name='index_dirty_papers')
+@run_only_once('index_dirty_papers', timeout=15*60)
+def index_dirty_papers():
+    """
+    Updates the search index for the papers modified by ingest
+    since the last run
+    """
+    index_dirty_papers_in_bulk()
+
+
 @shared_task(name='update_crossref')
 @run_only_once('update_crossref', timeout=24*3600)
 def update_crossref():
     """
     Updates paper metadata from Crossref
     """
-    CrossRef.fetch_latest_records()
+    CrossRef.fetch_latest_records(processes=settings.CROSSREF_FETCH_PROCESSES)
 
 @shared_task(name='update_oai_sources')
-@run_only_once('update_oai_sources', timeout=24*3600)
+@run_only_once('update_oai_sources', timeout=10*60)
 def update_oai_sources():
     """
-    Fetches new and updated records from all configured OAI sources since
-    their last update.
+    Starts a harvest task for each OAI source which is due, so that slow
+    sources do not delay the others.
+    """
+    for source in sources_to_harvest():
+        harvest_oai_source.delay(source_id=source.pk)
+
+@shared_task(name='harvest_oai_source')
+@run_only_once('harvest_oai_source', keys=['source_id'], timeout=settings.OAI_HARVEST_LOCK_TIMEOUT)
+def harvest_oai_source(source_id):
+    """
+    Fetches new and updated records from an OAI source since its last
+    update, resuming an interrupted harvest.
     """
-    for source in OaiSource.objects.filter(endpoint__isnull=False):
-        oai = OaiPaperSource(source)
-        oai.ingest(source.last_update.replace(tzinfo=None), metadataPrefix='base_dc')
-        source.last_update = datetime.now()
-        source.save()
+    source = OaiSource.objects.get(pk=source_id)
+    oai = OaiPaperSource(source)
+    oai.harvest(metadataPrefix='base_dc')
@@ -0,0 +1,47 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Micro-benchmark of the URL extractors of :mod:`backend.extractors` on the
+BASE records recorded in ``backend/tests/data``. It is not collected by the
+test suite, run it with::
+
+    python -m backend.tests.bench_extractors
+
+It compares :meth:`RegexExtractor._urls` with the naive implementation
+trying each mapping on each value of each record, kept as
+:func:`backend.tests.extractor_helpers.naive_urls`.
+"""
+
+import timeit
+
+from backend.extractors import REGISTERED_OAI_EXTRACTORS
+from backend.tests.extractor_helpers import naive_urls
+from backend.tests.extractor_helpers import recorded_records
+
+COPIES = 1000
+REPEAT = 5
+
+
+def main():
+    records = recorded_records() * COPIES
+    print('Time to find the URLs of {} records in ms'.format(len(records)))
+    print('{:>14} {:>10} {:>10}'.format('extractor', 'naive', 'compiled'))
+    for name, extractor in sorted(REGISTERED_OAI_EXTRACTORS.items()):
+        # fill in the fields used by other sources
+        sample = [dict(metadata, relation=metadata.get('relation', []), source=metadata.get('source', [])) for header, metadata in records]
+        def naive():
+            for metadata in sample:
+                naive_urls(extractor, metadata)
+        def compiled():
+            for metadata in sample:
+                extractor.metadata = metadata
+                extractor._urls()
+        print('{:>14} {:>10.1f} {:>10.1f}'.format(
+            name,
+            1000 * min(timeit.repeat(naive, number=1, repeat=REPEAT)),
+            1000 * min(timeit.repeat(compiled, number=1, repeat=REPEAT)),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Helpers shared by the tests and the benchmark of the URL extractors of
+:mod:`backend.extractors`.
+"""
+
+import os
+
+from backend.oaireader import RecordsPage
+from backend.oaireader import streaming_readers
+
+DATADIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def naive_urls(extractor, metadata):
+    """
+    The URLs found by the mappings of a :class:`RegexExtractor`, matching
+    every regex against every value
+    """
+    urls = dict()
+    for (field, regex, resource_type, skeleton) in extractor.mappings:
+        for val in metadata[field]:
+            val = val.strip()
+            match = regex.match(val)
+            if match:
+                urls[resource_type] = regex.sub(skeleton, val)
+    return urls
+
+
+def recorded_records():
+    """
+    The (header, metadata) pairs of the recorded BASE records
+    """
+    records = []
+    for fname in sorted(os.listdir(DATADIR)):
+        if fname.startswith('ft') and fname.endswith('.xml'):
+            with open(os.path.join(DATADIR, fname), 'rb') as f:
+                page = RecordsPage(f.read(), streaming_readers['base_dc'])
+                records += [(header, metadata._map) for header, metadata in page]
+    return records
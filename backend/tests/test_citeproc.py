@@ -1,5 +1,6 @@
 import os
 import pytest
+import requests
 import responses
 
 from datetime import date
@@ -22,9 +23,12 @@ from backend.citeproc import CiteprocTitleError
 from backend.citeproc import Citeproc
 from backend.citeproc import CrossRef
 from backend.citeproc import DOIResolver
+from backend.citeproc import _fetch_day_in_process
+from backend.utils import RateLimiter
 from papers.baremodels import BareName
 from papers.doi import doi_to_crossref_identifier
 from papers.doi import doi_to_url
+from papers.models import CrossRefCheckpoint
 from papers.models import OaiRecord
 from papers.models import OaiSource
 from papers.models import Paper
@@ -539,6 +543,44 @@ class TestCrossRef(TestCiteproc):
         source.refresh_from_db()
         assert source.last_update.date() == timezone.now().date() - timedelta(days=1)
 
+    @pytest.mark.usefixtures('db')
+    def test_fetch_latest_records_failing_day(self, monkeypatch):
+        """
+        The source date must not go beyond a day that failed
+        """
+        failing_day = timezone.now().date() - timedelta(days=5)
+        fetched_days = []
+        def ret_func(day):
+            fetched_days.append(day)
+            if day == failing_day:
+                raise requests.exceptions.ConnectionError()
+
+        monkeypatch.setattr(self.test_class, '_fetch_day', ret_func)
+
+        source = OaiSource.objects.get(identifier='crossref')
+        source.last_update = timezone.now() - timedelta(days=10)
+        source.save()
+        self.test_class.fetch_latest_records()
+        source.refresh_from_db()
+        assert source.last_update.date() == failing_day - timedelta(days=1)
+        assert fetched_days[-1] == failing_day
+
+    @pytest.mark.parametrize('processes', [1, 3])
+    def test_rate_limit_shared_by_processes(self, monkeypatch, processes):
+        """
+        The rate limit announced by CrossRef is shared among the processes actually used
+        """
+        monkeypatch.setattr(self.test_class, 'rate_limiter', RateLimiter())
+        monkeypatch.setattr(self.test_class, 'rate_limit_processes', 1)
+        monkeypatch.setattr(self.test_class, '_fetch_day', lambda day: None)
+        _fetch_day_in_process(self.test_class, processes, date.today())
+
+        response = requests.Response()
+        response.headers['X-Rate-Limit-Limit'] = '50'
+        response.headers['X-Rate-Limit-Interval'] = '1s'
+        self.test_class._update_rate_limit(response)
+        assert self.test_class.rate_limiter.min_interval == pytest.approx(processes / 50)
+
     @responses.activate
     @pytest.mark.usefixtures('db')
     def test_fetch_batch(self):
@@ -564,6 +606,28 @@ class TestCrossRef(TestCiteproc):
         for paper, doi in zip(papers, dois):
             assert paper.get_doi() == doi.lower()
 
+    @responses.activate
+    @pytest.mark.usefixtures('db')
+    def test_fetch_batch_parallel(self, monkeypatch):
+        """
+        Batches are fetched concurrently, and all papers are returned in order
+        """
+        f_path = os.path.join(settings.BASE_DIR, 'backend', 'tests', 'data', 'crossref_batch.json')
+        with open(f_path, 'r') as f:
+            body = f.read()
+        responses.add(
+            responses.GET,
+            url='https://api.crossref.org/works',
+            body=body,
+            status=200,
+        )
+        monkeypatch.setattr(self.test_class, 'batch_length', 1)
+        dois = ['10.1016/j.gsd.2018.08.007', '10.1109/sYnAsc.2010.88']
+        papers = self.test_class.fetch_batch(dois)
+        assert len(responses.calls) == 2
+        for paper, doi in zip(papers, dois):
+            assert paper.get_doi() == doi.lower()
+
     @responses.activate
     @pytest.mark.usefixtures('db')
     def test_fetch_batch_doi_not_found(self):
@@ -636,6 +700,62 @@ class TestCrossRef(TestCiteproc):
         assert query['rows'][0] == str(self.test_class.rows)
         assert query['mailto'][0] == settings.CROSSREF_MAILTO
 
+    @pytest.mark.usefixtures('db')
+    def test_fetch_day_checkpoint(self, monkeypatch, rsps_fetch_day):
+        """
+        If saving a page fails, the checkpoint must point after the last saved page
+        """
+        saved_pages = []
+        def save_items(items):
+            if saved_pages:
+                raise ValueError('Error')
+            saved_pages.append(items)
+            return len(items)
+        monkeypatch.setattr(self.test_class, '_save_items', save_items)
+        day = date.today()
+        with pytest.raises(ValueError):
+            self.test_class._fetch_day(day)
+        checkpoint = CrossRefCheckpoint.objects.get(day=day)
+        assert checkpoint.pages == 1
+        assert checkpoint.new_papers == len(saved_pages[0])
+        second_cursor = parse_qs(urlparse(rsps_fetch_day.calls[1].request.url).query)['cursor'][0]
+        assert checkpoint.cursor == second_cursor
+
+    @pytest.mark.usefixtures('db')
+    def test_fetch_day_resume(self, monkeypatch, rsps_fetch_day):
+        """
+        A day with a checkpoint must resume from the stored cursor and delete the checkpoint when done
+        """
+        monkeypatch.setattr(self.test_class, '_save_items', lambda items: len(items))
+        day = date.today()
+        cursor = 'AoJ4mejM5O4CPw9odHRwOi8vZHguZG9pLm9yZy8xMC4xMDE3L2Nibzk3ODA1MTE1MjkxMDguMDAz'
+        CrossRefCheckpoint.objects.create(day=day, cursor=cursor, pages=2)
+        self.test_class._fetch_day(day)
+        assert parse_qs(urlparse(rsps_fetch_day.calls[0].request.url).query)['cursor'][0] == cursor
+        assert not CrossRefCheckpoint.objects.filter(day=day).exists()
+
+    @pytest.mark.usefixtures('db')
+    def test_fetch_day_request_error(self, monkeypatch):
+        """
+        Network errors of the prefetching thread must reach the caller
+        """
+        def request_retry(*args, **kwargs):
+            raise requests.exceptions.ConnectionError()
+        monkeypatch.setattr('backend.citeproc.request_retry', request_retry)
+        with pytest.raises(requests.exceptions.RequestException):
+            self.test_class._fetch_day(date.today())
+
+    @pytest.mark.usefixtures('db')
+    def test_fetch_day_bulk_ingest_off(self, monkeypatch, rsps_fetch_day):
+        """
+        Without bulk ingest, every item is saved on its own
+        """
+        monkeypatch.setattr(self.test_class, 'bulk_ingest', False)
+        monkeypatch.setattr(self.test_class, 'to_papers', lambda items: pytest.fail('Bulk ingest used'))
+        day = date.today()
+        self.test_class._fetch_day(day)
+        assert Paper.objects.count() > 0
+
     @pytest.mark.usefixtures('db')
     def test_fetch_day_citeproc_error(self, monkeypatch, rsps_fetch_day):
         """
@@ -643,6 +763,7 @@ class TestCrossRef(TestCiteproc):
         """
         def callback(*args, **kwargs):
             raise CiteprocError('Error')
+        monkeypatch.setattr(self.test_class, 'bulk_ingest', False)
         monkeypatch.setattr(self.test_class, 'to_paper', callback)
         day = date.today()
         self.test_class._fetch_day(day)
@@ -654,11 +775,57 @@ class TestCrossRef(TestCiteproc):
         """
         def callback(*args, **kwargs):
             raise ValueError('Error')
+        monkeypatch.setattr(self.test_class, 'bulk_ingest', False)
         monkeypatch.setattr(self.test_class, 'to_paper', callback)
         day = date.today()
         self.test_class._fetch_day(day)
 
 
+    @pytest.mark.usefixtures('db')
+    def test_to_papers(self, citeproc):
+        """
+        Papers and records must be created, invalid items skipped
+        """
+        papers = self.test_class.to_papers([citeproc, {'title' : []}, None])
+        assert len(papers) == 1
+        p = papers[0]
+        assert p.pk >= 1
+        r = OaiRecord.objects.get(about=p)
+        assert r.doi == citeproc['DOI']
+        assert r.source.identifier == 'crossref'
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_existing(self, citeproc):
+        """
+        Saving the same items again must update and not duplicate
+        """
+        p = self.test_class.to_papers([dict(citeproc)])[0]
+        citeproc['abstract'] = 'A brand new and much longer abstract'
+        q = self.test_class.to_papers([citeproc])[0]
+        assert p.pk == q.pk
+        r = OaiRecord.objects.get(about=q)
+        assert r.description == citeproc['abstract']
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_same_as_to_paper(self, citeproc):
+        """
+        Bulk ingest must find the paper created by the single item path
+        """
+        p = self.test_class.to_paper(dict(citeproc))
+        q = self.test_class.to_papers([citeproc])[0]
+        assert p.pk == q.pk
+        assert OaiRecord.objects.filter(about=q).count() == 1
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_duplicates_in_page(self, citeproc):
+        """
+        Duplicates within one page end up in the same paper
+        """
+        papers = self.test_class.to_papers([citeproc, dict(citeproc)])
+        assert len(papers) == 2
+        assert papers[0].pk == papers[1].pk
+
+
     def test_filter_dois_by_comma(self):
         """
         Tests filtering of DOIs wheter they have a ',' or not
@@ -744,3 +911,57 @@ class TestDOI(TestCiteproc):
         q = self.test_class.save_doi(doi)
 
         assert p == q
+
+    @pytest.mark.usefixtures('db')
+    def test_up_to_date_papers(self, mock_doi):
+        """
+        Only the DOIs with a recent CrossRef record must be returned
+        """
+        dois = ['10.1016/j.gsd.2018.08.007', '10.1109/synasc.2010.88']
+        p = self.test_class.save_doi(dois[0])
+        self.test_class.save_doi(dois[1])
+        OaiRecord.objects.filter(doi=dois[1]).update(last_update=timezone.now() - settings.DOI_OUTDATED_DURATION - timedelta(days=1))
+
+        assert self.test_class.up_to_date_papers(dois + ['10.spanish/inquisition']) == {dois[0]: p}
+
+    @pytest.mark.usefixtures('db')
+    def test_save_doi_not_found(self, mock_doi):
+        """
+        A DOI which does not exist is not requested again
+        """
+        doi = '10.spanish/inquisition'
+        assert self.test_class.save_doi(doi) is None
+        assert self.test_class.save_doi(doi) is None
+        assert len(mock_doi.calls) == 1
+
+    @pytest.mark.usefixtures('db')
+    def test_save_doi_cached(self, mock_doi):
+        """
+        The metadata of a DOI is cached, even if the paper is not kept
+        """
+        doi = '10.1016/j.gsd.2018.08.007'
+        self.test_class.save_doi(doi).delete()
+        p = self.test_class.save_doi(doi)
+        assert len(mock_doi.calls) == 1
+        assert p.get_doi() == doi
+
+    def test_resolve_many(self, mock_doi):
+        """
+        DOIs are fetched from CrossRef by batch, then from the DOI resolver, and cached
+        """
+        f_path = os.path.join(settings.BASE_DIR, 'backend', 'tests', 'data', 'crossref_batch.json')
+        with open(f_path, 'r') as f:
+            mock_doi.add(responses.GET, url='https://api.crossref.org/works', body=f.read(), status=200)
+        dois = ['10.1016/j.gsd.2018.08.007', '10.1109/sYnAsc.2010.88', '10.1021/cen-v043n050.p033', '10.spanish/inquisition']
+
+        entries = self.test_class.resolve_many(dois)
+        assert sorted(entries) == sorted(dois[:3])
+        assert entries[dois[0]][0] == 'crossref'
+        assert entries[dois[1]][0] == 'crossref'
+        assert entries[dois[2]][0] == 'doi'
+        calls = len(mock_doi.calls)
+        # one batch for CrossRef, and a request to the DOI resolver for the DOIs it does not know
+        assert calls == 3
+
+        assert self.test_class.resolve_many(dois) == entries
+        assert len(mock_doi.calls) == calls
@@ -0,0 +1,52 @@
+import pytest
+import threading
+import time
+
+from backend import doicache
+
+
+@pytest.fixture(autouse=True)
+def clear_doicache():
+    doicache.clear()
+    yield
+    doicache.clear()
+
+
+class TestDOICache():
+
+    def test_store(self):
+        doicache.store('10.1007/ABC', ('doi', {'title': 'Some title'}))
+        doicache.store('10.1007/def', None)
+        assert doicache.get_many(['10.1007/abc', '10.1007/def', '10.1007/ghi']) == {
+            '10.1007/abc': ('doi', {'title': 'Some title'}),
+            '10.1007/def': None,
+        }
+
+    def test_single_flight(self):
+        """
+        Concurrent requests for a DOI fetch it only once
+        """
+        fetched = []
+        def fetch(doi):
+            fetched.append(doi)
+            time.sleep(0.2)
+            return ('doi', {'DOI': doi})
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(doicache.single_flight('10.1007/abc', fetch, 5))) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert fetched == ['10.1007/abc']
+        assert results == [('doi', {'DOI': '10.1007/abc'})] * 5
+
+    def test_single_flight_error(self):
+        """
+        Nothing is cached if the DOI could not be fetched
+        """
+        def fetch(doi):
+            raise ConnectionError
+        with pytest.raises(ConnectionError):
+            doicache.single_flight('10.1007/abc', fetch, 5)
+        assert doicache.get_many(['10.1007/abc']) == {}
@@ -0,0 +1,28 @@
+import pytest
+
+from backend.extractors import REGISTERED_OAI_EXTRACTORS
+from backend.extractors import baseExtractor
+from backend.tests.extractor_helpers import naive_urls
+from backend.tests.extractor_helpers import recorded_records
+
+
+@pytest.mark.parametrize('name', sorted(REGISTERED_OAI_EXTRACTORS))
+def test_same_urls_as_naive(name):
+    extractor = REGISTERED_OAI_EXTRACTORS[name]
+    for header, metadata in recorded_records():
+        metadata = dict(metadata, relation=metadata.get('relation', []), source=metadata.get('source', []))
+        extractor.metadata = metadata
+        urls = extractor._urls()
+        expected = naive_urls(extractor, metadata)
+        assert urls == expected
+        assert list(urls) == list(expected)
+
+
+def test_last_value_wins():
+    metadata = {
+        'identifier': ['10.1234/abc', ' http://example.com/a.pdf ', 'http://example.com/b', 'doi:10.1234/abc'],
+        'link': ['http://example.com/link'],
+    }
+    baseExtractor.metadata = metadata
+    assert baseExtractor._urls() == {'splash': 'http://example.com/link', 'pdf': 'http://example.com/a.pdf'}
+
@@ -0,0 +1,83 @@
+import pytest
+
+from django.db import connection
+from django.db import transaction
+
+from backend import indexing
+from backend.indexing import DIRTY_PAPERS_KEY
+from backend.indexing import index_dirty_papers
+from backend.indexing import index_on_commit
+from backend.indexing import mark_for_indexing
+from dissemin.settings import redis_client
+from papers.models import Paper
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    """
+    Records the batches of papers sent to the search engine
+    """
+    batches = []
+    def index_objects(model, objs):
+        batches.append(sorted(obj.pk for obj in objs))
+        return len(objs)
+    monkeypatch.setattr(indexing, 'index_objects', index_objects)
+    return batches
+
+
+@pytest.fixture
+def dirty_papers():
+    redis_client.delete(DIRTY_PAPERS_KEY)
+    yield
+    redis_client.delete(DIRTY_PAPERS_KEY)
+
+
+@pytest.fixture
+def run_on_commit():
+    """
+    The tests run in a transaction which is never committed, so this runs
+    the callbacks registered with on_commit so far
+    """
+    def run():
+        callbacks = connection.run_on_commit
+        connection.run_on_commit = []
+        for _, func in callbacks:
+            func()
+    return run
+
+
+@pytest.mark.usefixtures('db')
+class TestIndexing():
+
+    @pytest.fixture
+    def papers(self):
+        return sorted(Paper.objects.create(title='Paper {}'.format(i), fingerprint='paper-{}'.format(i), pubdate='2019-10-08').pk for i in range(2))
+
+    def test_index_on_commit_coalesces(self, papers, indexed, run_on_commit):
+        with transaction.atomic():
+            index_on_commit(papers[:1])
+            index_on_commit(papers)
+            index_on_commit(papers[1:])
+        assert indexed == []
+        run_on_commit()
+        assert indexed == [papers]
+
+    @pytest.mark.usefixtures('dirty_papers')
+    def test_index_dirty_papers(self, papers, indexed, run_on_commit):
+        mark_for_indexing(papers)
+        mark_for_indexing(papers[:1])
+        run_on_commit()
+        assert index_dirty_papers(chunk_size=1) == 2
+        assert sorted(sum(indexed, [])) == papers
+        assert index_dirty_papers() == 0
+
+    @pytest.mark.usefixtures('dirty_papers')
+    def test_index_dirty_papers_error(self, papers, monkeypatch, run_on_commit):
+        def index_objects(model, objs):
+            raise ConnectionError
+        monkeypatch.setattr(indexing, 'index_objects', index_objects)
+        mark_for_indexing(papers)
+        run_on_commit()
+        with pytest.raises(ConnectionError):
+            index_dirty_papers()
+        assert redis_client.scard(DIRTY_PAPERS_KEY) == 2
@@ -2,7 +2,9 @@ import pytest
 
 from django.test import TestCase
 
+from backend import maintenance
 from backend.maintenance import update_paper_statuses, unmerge_paper_by_dois
+from dissemin.settings import redis_client
 from papers.models import OaiRecord
 from papers.models import Paper
 
@@ -44,3 +46,44 @@ class MaintenanceTest(TestCase):
         self.assertTrue(p4.id != p1.id)
         self.assertTrue(p4.id != p3.id)
         self.assertEqual(p4.title, title2)
+
+
+@pytest.mark.usefixtures('db')
+class TestReindex():
+
+    @pytest.fixture
+    def checkpoint_key(self):
+        key = maintenance.REINDEX_CHECKPOINT_KEY.format('test')
+        redis_client.delete(key)
+        yield key
+        redis_client.delete(key)
+
+    @pytest.fixture
+    def sent(self, monkeypatch):
+        """
+        Records the ids of the documents sent to the search engine
+        """
+        sent = []
+        def parallel_bulk(conn, docs, **kwargs):
+            for doc in docs:
+                sent.append(doc['_id'])
+                yield True, {}
+        monkeypatch.setattr(maintenance, 'parallel_bulk', parallel_bulk)
+        return sent
+
+    def test_batches(self):
+        assert list(maintenance._batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+    def test_reindex_shard(self, checkpoint_key, sent):
+        pks = sorted(Paper.objects.create(title='Paper {}'.format(i), fingerprint='paper-{}'.format(i), pubdate='2019-10-08').pk for i in range(3))
+        indexed = maintenance._reindex_shard('papers.Paper', 'test', checkpoint_key, 1, 2, (0, pks[0], pks[-1]))
+        assert indexed == 2
+        assert sent == ['papers.paper.{}'.format(pk) for pk in pks[:2]]
+        assert int(redis_client.hget(checkpoint_key, 0)) == pks[1]
+
+    def test_reindex_shard_resume(self, checkpoint_key, sent):
+        pks = sorted(Paper.objects.create(title='Paper {}'.format(i), fingerprint='paper-{}'.format(i), pubdate='2019-10-08').pk for i in range(3))
+        redis_client.hset(checkpoint_key, 0, pks[0])
+        indexed = maintenance._reindex_shard('papers.Paper', 'test', checkpoint_key, 10, 10, (0, pks[0], pks[-1] + 1))
+        assert indexed == 2
+        assert sent == ['papers.paper.{}'.format(pk) for pk in pks[1:]]
@@ -3,7 +3,9 @@ import pytest
 
 import django.test
 
+from backend.oadoi import OADOI_DUMP_CHECKPOINT_KEY
 from backend.oadoi import OadoiAPI
+from dissemin.settings import redis_client
 from papers.models import Paper
 
 @pytest.mark.usefixtures("load_test_data")
@@ -28,3 +30,34 @@ class OadoiAPITest(django.test.TestCase):
         # the paper is now OA, yay!
         p = Paper.get_by_doi(doi)
         self.assertEqual(p.pdf_url, 'http://europepmc.org/articles/pmc5718814?pdf=render')
+
+    def test_read_dump_chunks(self):
+        filename = os.path.join(self.testdir, 'data/sample_unpaywall_snapshot.jsonl.gz')
+        oadoi = OadoiAPI()
+        chunks = list(oadoi.read_dump_chunks(filename, chunk_size=2))
+        lines = sum([chunk for _, chunk in chunks], [])
+        self.assertEqual(len(lines), len(list(oadoi.read_dump(filename))))
+        self.assertTrue(all(len(chunk) <= 2 for _, chunk in chunks))
+
+        # Resume after the first chunk
+        offset = chunks[0][0]
+        resumed = list(oadoi.read_dump_chunks(filename, offset=offset, chunk_size=2))
+        self.assertEqual(sum([chunk for _, chunk in resumed], []), lines[len(chunks[0][1]):])
+
+    @pytest.mark.usefixtures('mock_doi')
+    def test_ingest_dump_resume(self):
+        doi = '10.1080/21645515.2017.1330236'
+        Paper.create_by_doi(doi)
+        filename = os.path.join(self.testdir, 'data/sample_unpaywall_snapshot.jsonl.gz')
+        oadoi = OadoiAPI()
+        offset, _ = list(oadoi.read_dump_chunks(filename))[-1]
+
+        # An import which stopped at the end of the dump has nothing left to do
+        checkpoint_key = OADOI_DUMP_CHECKPOINT_KEY.format(filename)
+        redis_client.set(checkpoint_key, offset)
+        oadoi.load_dump(filename)
+        self.assertEqual(Paper.get_by_doi(doi).pdf_url, None)
+        self.assertEqual(redis_client.get(checkpoint_key), None)
+
+        oadoi.load_dump(filename, chunk_size=2)
+        self.assertEqual(Paper.get_by_doi(doi).pdf_url, 'http://europepmc.org/articles/pmc5718814?pdf=render')
@@ -23,16 +23,26 @@
 import codecs
 import os
 import pytest
+import pytz
 import unittest
 
+from datetime import datetime
+from datetime import timedelta
 from mock import patch
+from oaipmh.error import BadResumptionTokenError
 from oaipmh.error import CannotDisseminateFormatError
 from oaipmh.error import IdDoesNotExistError
 from oaipmh.client import Client
 
 from django.test import TestCase
+from django.utils import timezone
 
+from backend.oai import HARVEST_LOCK_ID
 from backend.oai import OaiPaperSource
+from backend.oai import harvest_lag
+from backend.oai import is_harvesting
+from backend.oai import sources_to_harvest
+from dissemin.settings import redis_client
 from papers.models import OaiRecord
 from papers.models import OaiSource
 from papers.models import Paper
@@ -310,3 +320,208 @@ class OaiTest(TestCase):
                 'ftdatacite:oai:oai.datacite.org:3505359',
                 'base_dc')
         self.assertTrue(paper.pdf_url is not None)
+
+    # tests of the batched ingestion
+
+    def get_base_records(self, identifiers):
+        records = []
+        for identifier in identifiers:
+            fname = identifier.replace('/', '_') + '.xml'
+            with codecs.open(os.path.join(self.testdir, 'data', fname), 'r', 'utf-8') as f:
+                oai_record = f.read()
+            with patch.object(Client, 'makeRequest', return_value=oai_record.encode('utf-8')):
+                records.append(self.base_oai.client.getRecord(metadataPrefix='base_dc', identifier=identifier))
+        return records
+
+    def test_process_records(self):
+        identifiers = [
+            'ftunivsavoie:oai:HAL:hal-01062241v1',
+            'ftunivsavoie:oai:HAL:hal-01062339v1',
+            'ftdatacite:oai:oai.datacite.org:402223',
+        ]
+        records = self.get_base_records(identifiers)
+        self.base_oai.batch_size = 2
+        self.base_oai.translate_processes = 0
+
+        metrics = self.base_oai.process_records(iter(records), 'base_dc')
+
+        self.assertEqual(metrics.records, 3)
+        self.assertEqual(OaiRecord.objects.filter(identifier__in=identifiers).count(), 3)
+
+    def test_process_records_skips_invalid(self):
+        records = self.get_base_records([
+            'ftunivsavoie:oai:HAL:hal-01062241v1',
+            'ftdatacite:oai:oai.datacite.org:402223',
+        ])
+        # no authors: the record cannot be translated
+        records[0][1]._map['creator'] = []
+        self.base_oai.translate_processes = 0
+
+        self.base_oai.process_records(iter(records), 'base_dc')
+
+        self.assertFalse(OaiRecord.objects.filter(identifier='ftunivsavoie:oai:HAL:hal-01062241v1').exists())
+        self.assertTrue(OaiRecord.objects.filter(identifier='ftdatacite:oai:oai.datacite.org:402223').exists())
+
+    def test_process_records_counts_failures(self):
+        records = self.get_base_records([
+            'ftunivsavoie:oai:HAL:hal-01062241v1',
+            'ftdatacite:oai:oai.datacite.org:402223',
+        ])
+        translator = self.base_oai.translators['base_dc']
+        translate = translator.translate
+        def failing_translate(header, metadata, **kwargs):
+            if header.identifier() == 'ftunivsavoie:oai:HAL:hal-01062241v1':
+                raise KeyError('creator')
+            return translate(header, metadata, **kwargs)
+        self.base_oai.translate_processes = 0
+
+        with patch.object(translator, 'translate', side_effect=failing_translate):
+            metrics = self.base_oai.process_records(iter(records), 'base_dc')
+
+        self.assertEqual(metrics.records, 2)
+        self.assertEqual(metrics.failed, 1)
+        self.assertTrue(OaiRecord.objects.filter(identifier='ftdatacite:oai:oai.datacite.org:402223').exists())
+
+    def test_translate_batch(self):
+        records = [(header, metadata._map) for header, metadata, about in self.get_base_records([
+            'ftunivsavoie:oai:HAL:hal-01062241v1',
+            'ftdatacite:oai:oai.datacite.org:402223',
+        ])]
+        translator = self.base_oai.translators['base_dc']
+
+        with patch.object(translator, 'extractor', wraps=translator.extractor) as extractor:
+            papers, failed = translator.translate_batch(records)
+
+        # the extractor is looked up once for the batch
+        extractor.assert_called_once_with()
+        self.assertEqual(failed, 0)
+        expected = [translator.translate(header, metadata) for header, metadata in records]
+        self.assertEqual(
+            [(paper.title, paper.oairecords[0].splash_url, paper.oairecords[0].pdf_url) for paper in papers],
+            [(paper.title, paper.oairecords[0].splash_url, paper.oairecords[0].pdf_url) for paper in expected])
+
+    def test_process_records_checkpoint(self):
+        records = self.get_base_records([
+            'ftunivsavoie:oai:HAL:hal-01062241v1',
+            'ftunivsavoie:oai:HAL:hal-01062339v1',
+        ])
+        records = [(header, metadata, 'token{}'.format(i)) for i, (header, metadata, about) in enumerate(records)]
+        self.base_oai.batch_size = 1
+        self.base_oai.checkpoint_every = 1
+        self.base_oai.translate_processes = 0
+        checkpoints = []
+
+        self.base_oai.process_records(iter(records), 'base_dc', checkpoint=lambda token, datestamp: checkpoints.append((token, datestamp)))
+
+        self.assertEqual([token for token, datestamp in checkpoints], ['token0', 'token1'])
+        self.assertEqual(checkpoints[-1][1], max(header.datestamp() for header, metadata, token in records))
+
+    def test_ingest_from_date(self):
+        response = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <responseDate>2019-10-02T00:00:00Z</responseDate>
+  <request verb="ListRecords">https://some_endpoint</request>
+  <ListRecords></ListRecords>
+</OAI-PMH>"""
+        self.base_oai.translate_processes = 0
+        for streaming in [True, False]:
+            self.base_oai.streaming = streaming
+            with patch.object(Client, 'makeRequest', return_value=response) as makeRequest:
+                self.base_oai.ingest(from_date=datetime(2019, 10, 1, 12, 30, 15, 42), metadataPrefix='base_dc')
+            # the date is sent as an OAI-PMH datestamp, as pyoai does
+            makeRequest.assert_called_once_with(**{
+                'verb': 'ListRecords',
+                'metadataPrefix': 'base_dc',
+                'from': '2019-10-01T12:30:15Z',
+            })
+
+    def test_harvest_resumes(self):
+        source = self.base_oai.oaisource
+        started = datetime(2019, 10, 1, tzinfo=pytz.UTC)
+        source.harvest_started = started
+        source.checkpoint_harvest('token', datetime(2019, 9, 30))
+        calls = []
+        def ingest(from_date=None, metadataPrefix='oai_dc', resumptionToken=None, checkpoint=None):
+            calls.append((from_date, resumptionToken))
+
+        with patch.object(self.base_oai, 'ingest', side_effect=ingest):
+            self.base_oai.harvest(metadataPrefix='base_dc')
+
+        self.assertEqual(calls, [(None, 'token')])
+        source.refresh_from_db()
+        self.assertIsNone(source.resumption_token)
+        self.assertIsNone(source.harvest_started)
+        # the records modified after the interrupted harvest started are
+        # fetched by the next one
+        self.assertEqual(source.last_update, started)
+
+    def test_harvest_token_expired(self):
+        source = self.base_oai.oaisource
+        last_update = source.last_update
+        source.checkpoint_harvest('expired', datetime(2019, 10, 1))
+        calls = []
+        def ingest(from_date=None, metadataPrefix='oai_dc', resumptionToken=None, checkpoint=None):
+            calls.append((from_date, resumptionToken))
+            if resumptionToken:
+                raise BadResumptionTokenError()
+            checkpoint('token', datetime(2019, 10, 2))
+
+        with patch.object(self.base_oai, 'ingest', side_effect=ingest):
+            self.base_oai.harvest(metadataPrefix='base_dc')
+
+        self.assertEqual(calls, [(None, 'expired'), (last_update.astimezone(pytz.UTC).replace(tzinfo=None), None)])
+        source.refresh_from_db()
+        self.assertIsNone(source.resumption_token)
+        self.assertIsNone(source.harvest_datestamp)
+        self.assertGreater(source.last_update, datetime(2019, 10, 2, tzinfo=pytz.UTC))
+
+    def test_harvest_token_expired_chronological(self):
+        self.base_oai.oaisource.checkpoint_harvest('expired', datetime(2019, 10, 1))
+        self.base_oai.chronological = True
+        calls = []
+        def ingest(from_date=None, metadataPrefix='oai_dc', resumptionToken=None, checkpoint=None):
+            calls.append((from_date, resumptionToken))
+            if resumptionToken:
+                raise BadResumptionTokenError()
+
+        with patch.object(self.base_oai, 'ingest', side_effect=ingest):
+            self.base_oai.harvest(metadataPrefix='base_dc')
+
+        self.assertEqual(calls, [(None, 'expired'), (datetime(2019, 10, 1), None)])
+
+
+@pytest.mark.django_db
+class TestHarvestScheduling():
+
+    @pytest.fixture
+    def sources(self):
+        OaiSource.objects.update(endpoint=None)
+        now = timezone.now()
+        sources = [
+            OaiSource.objects.create(
+                identifier='source{}'.format(hours),
+                name='Source',
+                endpoint='https://example.com/oai',
+                default_pubtype='preprint',
+                last_update=now - timedelta(hours=hours))
+            for hours in [0, 2, 3]
+        ]
+        yield sources
+        for source in sources:
+            redis_client.delete(HARVEST_LOCK_ID.format(source.pk))
+
+    def test_sources_to_harvest(self, sources):
+        assert sources_to_harvest() == [sources[2], sources[1]]
+
+    def test_sources_to_harvest_concurrency(self, sources, settings):
+        settings.OAI_HARVEST_CONCURRENCY = 2
+        redis_client.set(HARVEST_LOCK_ID.format(sources[2].pk), 'lock')
+        assert is_harvesting(sources[2])
+        assert sources_to_harvest() == [sources[1]]
+
+    def test_harvest_lag(self, sources):
+        now = timezone.now()
+        source = sources[2]
+        assert harvest_lag(source, now) == now - source.last_update
+        source.checkpoint_harvest('token', now - timedelta(minutes=10))
+        assert harvest_lag(source, now) == timedelta(minutes=10)
@@ -0,0 +1,90 @@
+import os
+import pytest
+
+from oaipmh.client import Client
+from oaipmh.error import NoRecordsMatchError
+from oaipmh.metadata import MetadataRegistry
+
+from backend.oaireader import RecordsPage
+from backend.oaireader import base_dc_reader
+from backend.oaireader import streaming_readers
+
+
+LIST_RECORDS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <ListRecords>
+    <record>
+      <header status="deleted">
+        <identifier>oai:example.org:1</identifier>
+        <datestamp>2019-10-01T00:00:00Z</datestamp>
+      </header>
+    </record>
+    <record>
+      <header>
+        <identifier>oai:example.org:2</identifier>
+        <datestamp>2019-10-02T00:00:00Z</datestamp>
+        <setSpec>set1</setSpec>
+        <setSpec>set2</setSpec>
+      </header>
+      <metadata>
+        <oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+          <dc:title>On <i>mixed</i> content</dc:title>
+          <dc:title/>
+          <dc:creator>Doe, John</dc:creator>
+          <dc:creator>Roe, Jane</dc:creator>
+        </oai_dc:dc>
+      </metadata>
+    </record>
+    <resumptionToken cursor="0">next-page</resumptionToken>
+  </ListRecords>
+</OAI-PMH>"""
+
+NO_RECORDS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <error code="noRecordsMatch">No records</error>
+</OAI-PMH>"""
+
+
+class TestRecordsPage():
+
+    def test_list_records(self):
+        page = RecordsPage(LIST_RECORDS, streaming_readers['oai_dc'])
+        records = list(page)
+
+        assert page.resumption_token == 'next-page'
+        assert len(records) == 2
+        header, metadata = records[0]
+        assert header.identifier() == 'oai:example.org:1'
+        assert header.isDeleted()
+        assert metadata is None
+        header, metadata = records[1]
+        assert header.setSpec() == ['set1', 'set2']
+        assert header.datestamp().day == 2
+        assert metadata['title'] == ['On ', ' content']
+        assert metadata['creator'] == ['Doe, John', 'Roe, Jane']
+        assert metadata['subject'] == []
+
+    def test_error(self):
+        with pytest.raises(NoRecordsMatchError):
+            list(RecordsPage(NO_RECORDS, streaming_readers['oai_dc']))
+
+    def test_same_as_pyoai(self):
+        """
+        The streaming reader reads the same metadata as base_dc_reader
+        """
+        registry = MetadataRegistry()
+        registry.registerReader('base_dc', base_dc_reader)
+        client = Client('https://example.org/oai', registry)
+        datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        fnames = [fname for fname in os.listdir(datadir) if fname.startswith('ft') and fname.endswith('.xml')]
+        assert fnames
+        for fname in fnames:
+            with open(os.path.join(datadir, fname), 'rb') as f:
+                xml = f.read()
+            tree = client.parse(xml)
+            node = tree.xpath('//oai:record/oai:metadata', namespaces=client.getNamespaces())[0]
+            expected = registry.readMetadata('base_dc', node)
+
+            [(header, metadata)] = list(RecordsPage(xml, streaming_readers['base_dc']))
+
+            assert metadata._map == expected._map
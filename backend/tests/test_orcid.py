@@ -4,9 +4,13 @@
 import pytest
 import unittest
 
-from backend.citeproc import CrossRef
+from mock import patch
+
+from backend.citeproc import DOIResolver
 from backend.orcid import affiliate_author_with_orcid
 from backend.orcid import OrcidPaperSource
+from papers.models import OaiRecord
+from papers.models import OrcidWorkVersion
 from papers.models import Paper
 from papers.models import Researcher
 from papers.tests.test_orcid import OrcidProfileStub
@@ -85,12 +89,30 @@ class TestOrcid():
         p.cache_oairecords() # Cache is not up to date
         assert len(p.oairecords) == 2
 
+    @pytest.mark.usefixtures('mock_doi')
+    def test_fetch_metadata_from_dois_up_to_date(self, researcher_lesot, monkeypatch):
+        """
+        DOIs which are up to date in our database are not fetched from CrossRef
+        """
+        dois = ['10.1016/j.ijar.2017.06.011', '10.spanish/inquisition']
+        known = Paper.create_by_doi(dois[0])
+        fetched = []
+        def resolve_many(dois):
+            fetched.extend(dois)
+            return {}
+        monkeypatch.setattr(DOIResolver, 'resolve_many', resolve_many)
+        o = OrcidPaperSource()
+        ref_name = (researcher_lesot.name.first, researcher_lesot.name.last)
+        papers = list(o.fetch_metadata_from_dois(ref_name, researcher_lesot.orcid, dois))
+        assert fetched == dois[1:]
+        assert papers[0].pk == known.pk
+        assert papers[1] is None
+
     def test_fetch_metadata_from_dois_no_paper(self, monkeypatch):
         """
         If no paper created, expect None
         """
-        monkeypatch.setattr(Paper, 'create_by_doi', lambda x: None)
-        monkeypatch.setattr(CrossRef, 'fetch_batch', lambda x: [None])
+        monkeypatch.setattr(DOIResolver, 'resolve_many', lambda x: {})
         o = OrcidPaperSource()
         papers = list(o.fetch_metadata_from_dois('spam', 'ham', ['any_doi']))
         assert len(papers) == 1
@@ -140,6 +162,64 @@ class OrcidIntegrationTest(unittest.TestCase):
         author = p.authors[0]
         self.assertEqual(author.orcid, self.r4.orcid)
 
+    @pytest.mark.usefixtures('mock_crossref', 'mock_doi')
+    def test_incremental_refresh(self):
+        profile = OrcidProfileStub('0000-0002-8612-8827', instance='orcid.org')
+        papers = list(self.source.fetch_orcid_records(self.researcher.orcid, profile=profile))
+        self.assertTrue(len(papers) > 1)
+        self.assertEqual(
+            set(OrcidWorkVersion.objects.filter(researcher=self.researcher).values_list('put_code', flat=True)),
+            set(summary.put_code for summary in profile.work_summaries))
+
+        # nothing changed in the profile
+        papers = list(self.source.fetch_orcid_records(self.researcher.orcid, profile=profile))
+        self.assertEqual(papers, [])
+
+        # a work was modified
+        summary = profile.work_summaries[0]
+        summary.json['last-modified-date']['value'] += 1000
+        papers = list(self.source.fetch_orcid_records(self.researcher.orcid, profile=profile))
+        self.assertEqual(len(papers), 1)
+        self.assertEqual(OrcidWorkVersion.objects.get(researcher=self.researcher, put_code=summary.put_code).last_modified, summary.last_modified)
+
+    @pytest.mark.usefixtures('mock_crossref', 'mock_doi')
+    def test_incremental_refresh_removed_work(self):
+        profile = OrcidProfileStub('0000-0002-8612-8827', instance='orcid.org')
+        list(self.source.fetch_orcid_records(self.researcher.orcid, profile=profile))
+        title = 'From Natural Language to RDF Graphs with Pregroups'
+        [removed] = [summary for summary in profile.work_summaries if summary.title == title]
+        identifier = profile.api_uri + 'work/{}'.format(removed.put_code)
+        self.assertTrue(OaiRecord.objects.filter(identifier=identifier).exists())
+
+        profile.work_summaries = [summary for summary in profile.work_summaries if summary.title != title]
+        papers = list(self.source.fetch_orcid_records(self.researcher.orcid, profile=profile))
+
+        self.assertEqual(papers, [])
+        self.assertFalse(OaiRecord.objects.filter(identifier=identifier).exists())
+        self.assertEqual(OrcidWorkVersion.objects.filter(researcher=self.researcher).count(), len(profile.work_summaries))
+
+    @pytest.mark.usefixtures('mock_crossref', 'mock_doi')
+    def test_incremental_refresh_retries_failed_works(self):
+        profile = OrcidProfileStub('0000-0002-8612-8827', instance='orcid.org')
+        create_papers = self.source.create_papers
+        failed = []
+        def create_papers_failing_once(works):
+            papers = create_papers(works)
+            if not failed:
+                failed.append(works[0].put_code)
+                papers[0] = None
+            return papers
+
+        with patch.object(self.source, 'create_papers', side_effect=create_papers_failing_once):
+            list(self.source.fetch_orcid_records(self.researcher.orcid, profile=profile))
+        versions = set(OrcidWorkVersion.objects.filter(researcher=self.researcher).values_list('put_code', flat=True))
+        self.assertEqual(versions, set(summary.put_code for summary in profile.work_summaries) - set(failed))
+
+        # the work which failed is fetched again
+        papers = list(self.source.fetch_orcid_records(self.researcher.orcid, profile=profile))
+        self.assertEqual(len(papers), 1)
+        self.assertTrue(OrcidWorkVersion.objects.filter(researcher=self.researcher, put_code=failed[0]).exists())
+
     @pytest.mark.usefixtures('mock_crossref')
     def test_previously_present_papers_are_attributed(self):
         # Fetch papers from a researcher
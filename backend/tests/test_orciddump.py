@@ -0,0 +1,190 @@
+import io
+import os
+import pytest
+import tarfile
+
+from backend.orcid import ORCID_DUMP_CHECKPOINT_KEY
+from backend.orcid import OrcidPaperSource
+from backend.orciddump import OrcidDumpProfile
+from backend.orciddump import dump_members
+from backend.orciddump import normalize_profile
+from backend.orciddump import parse_profile
+from backend.orciddump import profile_from_xml
+from dissemin.settings import redis_client
+from papers.models import Researcher
+
+
+PROFILE_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<record:record path="/0000-0002-8612-8827"
+    xmlns:record="http://www.orcid.org/ns/record" xmlns:common="http://www.orcid.org/ns/common"
+    xmlns:person="http://www.orcid.org/ns/person" xmlns:personal-details="http://www.orcid.org/ns/personal-details"
+    xmlns:other-name="http://www.orcid.org/ns/other-name" xmlns:researcher-url="http://www.orcid.org/ns/researcher-url"
+    xmlns:activities="http://www.orcid.org/ns/activities" xmlns:employment="http://www.orcid.org/ns/employment"
+    xmlns:work="http://www.orcid.org/ns/work">
+  <common:orcid-identifier>
+    <common:uri>https://orcid.org/0000-0002-8612-8827</common:uri>
+    <common:path>0000-0002-8612-8827</common:path>
+    <common:host>orcid.org</common:host>
+  </common:orcid-identifier>
+  <person:person>
+    <person:name visibility="public">
+      <personal-details:given-names>Antonin</personal-details:given-names>
+      <personal-details:family-name>Delpeuch</personal-details:family-name>
+    </person:name>
+    <other-name:other-names>
+      <other-name:other-name put-code="1">
+        <other-name:content>Delpeuch, A.</other-name:content>
+      </other-name:other-name>
+    </other-name:other-names>
+    <researcher-url:researcher-urls>
+      <researcher-url:researcher-url put-code="2">
+        <researcher-url:url-name>Homepage</researcher-url:url-name>
+        <researcher-url:url>https://example.org/</researcher-url:url>
+      </researcher-url:researcher-url>
+    </researcher-url:researcher-urls>
+  </person:person>
+  <activities:activities-summary>
+    <activities:employments>
+      <activities:affiliation-group>
+        <employment:employment-summary put-code="3">
+          <common:organization>
+            <common:name>University of Oxford</common:name>
+            <common:address>
+              <common:city>Oxford</common:city>
+              <common:country>GB</common:country>
+            </common:address>
+            <common:disambiguated-organization>
+              <common:disambiguated-organization-identifier>https://ror.org/052gg0110</common:disambiguated-organization-identifier>
+              <common:disambiguation-source>ROR</common:disambiguation-source>
+            </common:disambiguated-organization>
+          </common:organization>
+        </employment:employment-summary>
+      </activities:affiliation-group>
+    </activities:employments>
+    <activities:works>
+      <activities:group>
+        <work:work-summary put-code="16667185">
+          <common:last-modified-date>2019-10-08T12:00:00.000Z</common:last-modified-date>
+          <work:title>
+            <common:title>From Natural Language to RDF Graphs with Pregroups</common:title>
+          </work:title>
+          <common:external-ids>
+            <common:external-id>
+              <common:external-id-type>doi</common:external-id-type>
+              <common:external-id-value>10.1007/978-3-319-25904-8_2</common:external-id-value>
+              <common:external-id-relationship>self</common:external-id-relationship>
+            </common:external-id>
+          </common:external-ids>
+        </work:work-summary>
+      </activities:group>
+    </activities:works>
+  </activities:activities-summary>
+</record:record>"""
+
+
+def orcid_fixture(orcid):
+    with open(os.path.join('papers', 'fixtures', 'orcid', orcid + '.json'), 'rb') as f:
+        return f.read()
+
+def make_tarball(path, members):
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return str(path)
+
+
+class TestParseProfile():
+
+    def test_profile_from_xml(self):
+        profile = OrcidDumpProfile(orcid_id='0000-0002-8612-8827', json=profile_from_xml(PROFILE_XML))
+        assert profile.name == ('Antonin', 'Delpeuch')
+        assert profile.other_names == [('A.', 'Delpeuch')]
+        assert profile.homepage == 'https://example.org/'
+        assert profile.institution == {
+            'identifier': 'ror-https://ror.org/052gg0110',
+            'name': 'University of Oxford',
+            'country': 'GB',
+        }
+        [summary] = profile.work_summaries
+        assert summary.put_code == 16667185
+        assert summary.doi == '10.1007/978-3-319-25904-8_2'
+        assert summary.title == 'From Natural Language to RDF Graphs with Pregroups'
+        assert summary.last_modified == 1570536000000
+
+    def test_normalize_profile_v3(self):
+        profile = {
+            'orcid-identifier': {'path': '0000-0002-8612-8827'},
+            'person': {},
+            'activities-summary': {
+                'employments': {'affiliation-group': [{'summaries': [{'employment-summary': {'put-code': 3}}]}]},
+                'fundings': {'group': []},
+            },
+        }
+        normalized = normalize_profile(profile)
+        assert normalized['activities-summary']['employments'] == {'employment-summary': [{'put-code': 3}]}
+        assert 'fundings' not in normalized['activities-summary']
+
+    def test_parse_profile_json(self):
+        orcid, profile = parse_profile('0000-0001-6723-6833.json', orcid_fixture('0000-0001-6723-6833'))
+        assert orcid == '0000-0001-6723-6833'
+        assert len(OrcidDumpProfile(orcid_id=orcid, json=profile).work_summaries) > 0
+
+    @pytest.mark.parametrize('name, content', [
+        ('invalid.json', b'{"orcid-identifier":'),
+        ('invalid.xml', b'<record'),
+        ('no-orcid.json', b'{"orcid-identifier": {"path": "0000-0000-0000-0000"}}'),
+    ])
+    def test_parse_profile_invalid(self, name, content):
+        assert parse_profile(name, content) is None
+
+
+class TestDumpMembers():
+
+    def test_tarball(self, tmp_path):
+        archive = make_tarball(tmp_path / 'dump.tar.gz', [
+            ('summaries/a.xml', b'a'),
+            ('summaries/README', b'readme'),
+            ('summaries/b.json', b'b'),
+            ('summaries/c.xml', b'c'),
+        ])
+        assert list(dump_members(archive)) == [('summaries/a.xml', b'a'), ('summaries/b.json', b'b'), ('summaries/c.xml', b'c')]
+        assert list(dump_members(archive, start_after='summaries/b.json')) == [('summaries/c.xml', b'c')]
+
+    def test_directory(self, tmp_path):
+        (tmp_path / 'b').mkdir()
+        (tmp_path / 'b' / 'c.json').write_bytes(b'c')
+        (tmp_path / 'a.xml').write_bytes(b'a')
+        assert list(dump_members(str(tmp_path))) == [('a.xml', b'a'), (os.path.join('b', 'c.json'), b'c')]
+
+
+@pytest.mark.usefixtures('db')
+class TestBulkImport():
+
+    @pytest.fixture
+    def archive(self, tmp_path):
+        path = make_tarball(tmp_path / 'dump.tar.gz', [
+            ('summaries/0000-0001-6723-6833.json', orcid_fixture('0000-0001-6723-6833')),
+            ('summaries/invalid.json', b'{'),
+            ('summaries/0000-0002-8612-8827.xml', PROFILE_XML),
+        ])
+        key = ORCID_DUMP_CHECKPOINT_KEY.format('dump.tar.gz')
+        redis_client.delete(key)
+        yield path
+        redis_client.delete(key)
+
+    def test_bulk_import(self, archive):
+        metrics = OrcidPaperSource().bulk_import(archive, fetch_papers=False, processes=0, batch_size=2)
+        assert metrics.as_dict()['profiles'] == 3
+        assert metrics.as_dict()['invalid'] == 1
+        assert Researcher.objects.get(orcid='0000-0001-6723-6833').name.last == 'Boersch-Supan'
+        assert Researcher.objects.get(orcid='0000-0002-8612-8827').name.last == 'Delpeuch'
+        assert redis_client.get(ORCID_DUMP_CHECKPOINT_KEY.format('dump.tar.gz')) is None
+
+    def test_bulk_import_resume(self, archive):
+        redis_client.set(ORCID_DUMP_CHECKPOINT_KEY.format('dump.tar.gz'), 'summaries/invalid.json')
+        metrics = OrcidPaperSource().bulk_import(archive, fetch_papers=False, processes=0)
+        assert metrics.as_dict()['profiles'] == 1
+        assert not Researcher.objects.filter(orcid='0000-0001-6723-6833').exists()
+        assert Researcher.objects.filter(orcid='0000-0002-8612-8827').exists()
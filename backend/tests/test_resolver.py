@@ -0,0 +1,89 @@
+import pytest
+
+from backend.resolver import LRUCache
+from backend.resolver import Resolver
+from papers.models import OaiSource
+from publishers.models import Journal
+from publishers.models import Publisher
+
+
+class TestLRUCache():
+
+    def test_get_set(self):
+        cache = LRUCache(10, 60)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache.get('b', None) is None
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_eviction(self):
+        cache = LRUCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('a') == 1
+        assert cache.get('b', None) is None
+        assert len(cache) == 2
+
+    def test_negative_ttl(self):
+        cache = LRUCache(10, 60, negative_ttl=0)
+        cache.set('a', None)
+        cache.set('b', 2)
+        assert cache.get('a', 'expired') == 'expired'
+        assert cache.get('b') == 2
+
+
+@pytest.mark.usefixtures('db')
+class TestResolver():
+
+    @pytest.fixture
+    def resolver(self):
+        return Resolver()
+
+    @pytest.fixture
+    def journal(self):
+        publisher = Publisher.objects.create(name='Detective Stories Ltd.')
+        return Journal.objects.create(title='Detective Stories', issn='1234-5678', publisher=publisher)
+
+    def test_journal(self, resolver, journal, django_assert_num_queries):
+        assert resolver.journal(issn='1234-5678') == journal
+        assert resolver.journal(title='detective stories') == journal
+        with django_assert_num_queries(0):
+            assert resolver.journal(issn='1234-5678') == journal
+            assert resolver.journal(title='DETECTIVE STORIES') == journal
+
+    def test_journal_negative(self, resolver, django_assert_num_queries):
+        assert resolver.journal(issn='8765-4321', title='Unknown Journal') is None
+        with django_assert_num_queries(0):
+            assert resolver.journal(issn='8765-4321', title='Unknown Journal') is None
+
+    def test_journals(self, resolver, journal, django_assert_num_queries):
+        with django_assert_num_queries(2):
+            by_issn, by_title = resolver.journals(['1234-5678', '8765-4321', ''], ['Detective Stories', 'Unknown Journal'])
+        assert by_issn == {'1234-5678' : journal, '8765-4321' : None}
+        assert by_title == {'DETECTIVE STORIES' : journal, 'UNKNOWN JOURNAL' : None}
+        with django_assert_num_queries(0):
+            resolver.journals(['1234-5678'], ['Unknown Journal'])
+            assert resolver.journal(issn='1234-5678') == journal
+
+    def test_publisher(self, resolver, journal, django_assert_num_queries):
+        assert resolver.publisher('Detective Stories Ltd.') == journal.publisher
+        with django_assert_num_queries(0):
+            assert resolver.publisher('Detective Stories Ltd.') == journal.publisher
+
+    def test_source(self, resolver, django_assert_num_queries):
+        crossref = OaiSource.objects.get(identifier='crossref')
+        assert resolver.source('crossref') == crossref
+        with django_assert_num_queries(0):
+            assert resolver.source('crossref') == crossref
+        with pytest.raises(OaiSource.DoesNotExist):
+            resolver.source('unknown source')
+
+    def test_invalidate_on_change_publisher(self, journal):
+        from backend.resolver import resolver
+        assert resolver.journal(issn='1234-5678').publisher == journal.publisher
+        new_publisher = Publisher.objects.create(name='Other Stories Ltd.')
+        journal.change_publisher(new_publisher)
+        assert resolver.journal(issn='1234-5678').publisher == new_publisher
@@ -1,6 +1,8 @@
 from datetime import timedelta
+from time import monotonic
 from time import sleep
 
+from backend.utils import RateLimiter
 from backend.utils import report_speed
 from backend.utils import utf8_truncate
 from backend.utils import with_speed_report
@@ -17,6 +19,13 @@ def test_report_speed():
     
     assert list(second_generator(20)) == list(range(20))
 
+def test_rate_limiter():
+    limiter = RateLimiter(0.05)
+    start = monotonic()
+    for i in range(3):
+        limiter.wait()
+    assert monotonic() - start >= 0.1
+
 class TestUtf8Truncate:
     """
     Tests truncation by utf-8 length
@@ -26,7 +26,7 @@ from papers.baremodels import BareName
 from papers.baremodels import BareOaiRecord
 from papers.baremodels import BarePaper
 from papers.doi import to_doi
-from papers.name import parse_comma_name
+from papers.name import parse_comma_names
 from papers.utils import sanitize_html
 from papers.utils import tolerant_datestamp_to_datetime
 from papers.utils import valid_publication_date
@@ -66,6 +66,27 @@ class OaiTranslator(object):
         """
         raise NotImplementedError()
 
+    def translate_batch(self, records):
+        """
+        Translates a list of records. A record whose translation raises an
+        exception is logged and skipped.
+
+        :param records: a list of (header, metadata) pairs
+        :returns: the list of :class:`BarePaper` (None for the records
+            which could not be translated) and the number of records
+            whose translation raised an exception
+        """
+        papers = []
+        failed = 0
+        for header, metadata in records:
+            try:
+                papers.append(self.translate(header, metadata))
+            except Exception:
+                logger.exception("Translation of OAI record %s failed" % header.identifier())
+                papers.append(None)
+                failed += 1
+        return papers, failed
+
 
 class OAIDCTranslator(OaiTranslator):
     """
@@ -80,7 +101,7 @@ class OAIDCTranslator(OaiTranslator):
         """
         Get the authors names out of a metadata record
         """
-        parsed = list(map(parse_comma_name, metadata['creator']))
+        parsed = parse_comma_names(metadata['creator'])
         names = [BareName.create_bare(fst, lst) for fst, lst in parsed]
         return names
 
@@ -100,7 +121,13 @@ class OAIDCTranslator(OaiTranslator):
                 continue
         return earliest
 
-    def extract_urls(self, header, metadata, source_identifier):
+    def extractor(self):
+        """
+        The :class:`URLExtractor` for the source of the records
+        """
+        return REGISTERED_OAI_EXTRACTORS.get(self.oaisource.identifier, defaultExtractor)
+
+    def extract_urls(self, header, metadata, source_identifier, urls=None):
         """
         Extracts URLs from the record,
         based on the identifier of its source.
@@ -119,16 +146,22 @@ class OAIDCTranslator(OaiTranslator):
             URL should point to the full text directly, otherwise
             to a page where we think a human user can find the
             full text by themselves (and for free).
+
+        :param urls: the URLs already extracted from the record, if any
         """
-        extractor = REGISTERED_OAI_EXTRACTORS.get(source_identifier, defaultExtractor)
-        urls = extractor.extract(header, metadata)
+        if urls is None:
+            extractor = REGISTERED_OAI_EXTRACTORS.get(source_identifier, defaultExtractor)
+            urls = extractor.extract(header, metadata)
         pdf_url = urls.get('pdf')
         splash_url = urls.get('splash')
         return splash_url, pdf_url
 
-    def translate(self, header, metadata):
+    def translate(self, header, metadata, urls=None):
         """
         Creates a BarePaper
+
+        :param urls: the URLs of the record found by its extractor, if
+            they were extracted already
         """
         # We need three things to create a paper:
         # - publication date
@@ -144,15 +177,17 @@ class OAIDCTranslator(OaiTranslator):
         # Create paper and record
         try:
             paper = BarePaper.create(metadata['title'][0], authors, pubdate)
-            self.add_oai_record(header, metadata, paper)
+            self.add_oai_record(header, metadata, paper, urls=urls)
             return paper
         except ValueError as e:
             logger.warning("OAI record "+header.identifier()+" skipped:\n", e, exc_info=True)
             paper.update_availability()
 
-    def add_oai_record(self, header, metadata, paper):
+    def add_oai_record(self, header, metadata, paper, urls=None):
         """
         Add a record (from OAI-PMH) to the given paper
+
+        :param urls: the URLs of the record, see :meth:`extract_urls`
         """
         identifier = header.identifier()
 
@@ -165,7 +200,7 @@ class OAIDCTranslator(OaiTranslator):
 
         # Run extractor to find the URLs
         splash_url, pdf_url = self.extract_urls(
-            header, metadata, self.oaisource.identifier)
+            header, metadata, self.oaisource.identifier, urls=urls)
 
         keywords = ' | '.join(metadata['subject'])
         contributors = ' '.join(metadata['contributor'])[:4096]
@@ -200,6 +235,30 @@ class OAIDCTranslator(OaiTranslator):
         paper.add_oairecord(record)
 
 
+    def translate_batch(self, records):
+        """
+        Translates a list of records, as :meth:`OaiTranslator.translate_batch`
+        does. The URLs of the whole batch are found at once by the
+        extractor of the source.
+        """
+        try:
+            urls = self.extractor().extract_batch(records)
+        except Exception:
+            # the records are translated one by one, to find which ones fail
+            return super(OAIDCTranslator, self).translate_batch(records)
+
+        papers = []
+        failed = 0
+        for (header, metadata), record_urls in zip(records, urls):
+            try:
+                papers.append(self.translate(header, metadata, urls=record_urls))
+            except Exception:
+                logger.exception("Translation of OAI record %s failed" % header.identifier())
+                papers.append(None)
+                failed += 1
+        return papers, failed
+
+
 class BASEDCTranslator(OAIDCTranslator):
     """
     base_dc is very similar to oai_dc, so we
@@ -20,11 +20,13 @@
 
 
 
+from time import monotonic
 from time import sleep
 
 import logging
 import requests
 import requests.exceptions
+import threading
 from datetime import datetime
 from datetime import timedelta
 
@@ -106,6 +108,29 @@ def request_retry(url, **kwargs):
                          backoff=backoff,
                          session=session)
 
+class RateLimiter(object):
+    """
+    Spaces calls to `wait` by at least `min_interval` seconds.
+    Can be shared between threads.
+    """
+
+    def __init__(self, min_interval=0):
+        self.min_interval = min_interval
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Blocks until the next call is allowed
+        """
+        with self.lock:
+            now = monotonic()
+            if self.next_call > now:
+                sleep(self.next_call - now)
+                now = self.next_call
+            self.next_call = now + self.min_interval
+
+
 def urlopen_retry(url, **kwargs):
     return request_retry(url, **kwargs).text
 
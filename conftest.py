@@ -21,6 +21,8 @@ from django.core.management import call_command
 from django.urls import reverse
 from django.utils.text import slugify
 
+from backend import doicache
+from backend.resolver import resolver
 from deposit.models import Repository
 from dissemin.settings import BASE_DIR
 from dissemin.settings import POSSIBLE_LANGUAGE_CODES
@@ -37,6 +39,15 @@ from publishers.models import Publisher
 from upload.models import UploadedPDF
 
 
+@pytest.fixture(autouse=True)
+def clear_resolver():
+    """
+    The resolver caches objects in memory, they must not survive the database of a test
+    """
+    yield
+    resolver.invalidate()
+
+
 @pytest.fixture
 def shib_meta(shib_request):
     SHIB_META = dict()
@@ -252,6 +263,8 @@ def uploaded_pdf(user_leibniz):
 
 @pytest.fixture
 def requests_mocker():
+    # DOIs cached by previous tests would not be requested from the mock
+    doicache.clear()
     with responses.RequestsMock() as rsps:
         yield rsps
 
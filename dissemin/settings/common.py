@@ -97,6 +97,13 @@ DOI_PROXY_SUPPORTS_BATCH = True
 #DOI_PROXY_SUPPORTS_BATCH = False
 
 DOI_OUTDATED_DURATION = timedelta(days=180)
+# Time during which the metadata fetched for a DOI is cached
+DOI_CACHE_DURATION = timedelta(days=1)
+# Time during which a DOI which could not be found is not requested again
+DOI_NOT_FOUND_CACHE_DURATION = timedelta(hours=6)
+
+# Number of batches of works fetched at the same time from the ORCID API
+ORCID_FETCH_THREADS = 4
 # Endpoint to fetch DOI from
 DOI_RESOLVER_ENDPOINT= 'https://dx.doi.org/'
 
@@ -106,6 +113,11 @@ DOI_RESOLVER_ENDPOINT= 'https://dx.doi.org/'
 # It is not mandatory to provide them but it helps get a better service.
 CROSSREF_MAILTO = 'dev@dissem.in'
 CROSSREF_USER_AGENT = 'Dissemin/0.1 (https://dissem.in/; mailto:dev@dissem.in)'
+# Number of batches of DOIs fetched at the same time from CrossRef
+CROSSREF_FETCH_THREADS = 4
+# Number of days of updates fetched in parallel by the update_crossref task,
+# each by its own process. They share the rate limit of CrossRef.
+CROSSREF_FETCH_PROCESSES = 4
 
 ### Paper deposits ###
 # Max size of the PDFs (in bytes)
@@ -293,6 +305,14 @@ CELERY_BEAT_SCHEDULE = {
            'task': 'fetch_updates_from_romeo',
            'schedule': timedelta(days=14),
     },
+    'index_dirty_papers': {
+        'task': 'index_dirty_papers',
+        'schedule': timedelta(minutes=1),
+    },
+#    'update_oai_sources': {
+#          'task': 'update_oai_sources',
+#          'schedule': timedelta(minutes=15),
+#    },
 #    'update_crossref': {
 #          'task': 'update_crossref',
 #          'schedule': timedelta(days=1),
@@ -373,6 +393,17 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
+# If set, papers are reindexed in bulk: either when the transaction
+# modifying them is committed, or by the task index_dirty_papers
+# for ingest (see backend.indexing).
+DEFERRED_INDEXING = True
+
+# Maximum number of OAI sources harvested at the same time, each by its
+# own task (see backend.tasks.update_oai_sources), and number of seconds
+# after which the lock of a harvest expires.
+OAI_HARVEST_CONCURRENCY = 4
+OAI_HARVEST_LOCK_TIMEOUT = 3*24*3600
+
 # Deposit notification callback, can be overriden to notify an external
 # service on deposit
 DEPOSIT_NOTIFICATION_CALLBACK = (lambda payload: None)
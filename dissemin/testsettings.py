@@ -3,6 +3,8 @@ from dissemin.celery import app
 
 DEBUG_TOOLBAR_CONFIG = {'SHOW_TOOLBAR_CALLBACK': lambda r: False}
 app.conf.task_always_eager = True
+# Tests expect the search index to be up to date right away
+DEFERRED_INDEXING = False
 
 # We delete the logger 'dissemin', so that it goes to root logger and gets catched by pytest caplog fixture
 try:
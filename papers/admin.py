@@ -24,6 +24,8 @@ from django.core.paginator import Paginator
 from django.db import connection, transaction, OperationalError
 from django.utils.functional import cached_property
 
+from backend.oai import harvest_lag
+from backend.oai import is_harvesting
 from papers.models import Department
 from papers.models import Institution
 from papers.models import Name
@@ -85,6 +87,20 @@ class OaiRecordAdmin(AdminChangeLinksMixin, admin.ModelAdmin):
     show_full_result_count = False
 
 
+class OaiSourceAdmin(admin.ModelAdmin):
+    list_display = ('identifier', 'name', 'last_update', 'harvesting', 'lag', )
+    readonly_fields = ('resumption_token', 'harvest_datestamp', 'harvest_started', )
+
+    def harvesting(self, obj):
+        return is_harvesting(obj)
+    harvesting.boolean = True
+
+    def lag(self, obj):
+        if not obj.endpoint:
+            return '-'
+        return harvest_lag(obj)
+
+
 class PaperAdmin(AdminChangeLinksMixin, admin.ModelAdmin):
     changelist_links = [
         (
@@ -117,6 +133,6 @@ admin.site.register(Department, DepartmentAdmin)
 admin.site.register(Researcher, ResearcherAdmin)
 admin.site.register(Name)
 admin.site.register(Paper, PaperAdmin)
-admin.site.register(OaiSource)
+admin.site.register(OaiSource, OaiSourceAdmin)
 admin.site.register(OaiRecord, OaiRecordAdmin)
 admin.site.register(PaperWorld, SingletonModelAdmin)
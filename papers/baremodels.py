@@ -27,7 +27,6 @@ done online,
 without name ambiguity resolution.
 """
 
-import hashlib
 import logging
 import re
 from urllib.parse import quote  # for the Google Scholar and CORE link
@@ -40,6 +39,7 @@ from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from papers.bibtex import PAPER_TYPE_TO_BIBTEX, format_paper_citation_dict
 from papers.doi import doi_to_oadoi_url
+from papers.fingerprint import create_paper_fingerprint
 from papers.fingerprint import create_paper_plain_fingerprint
 from papers.utils import datetime_to_date
 from papers.utils import iunaccent
@@ -514,10 +514,7 @@ class BarePaper(BareObject):
         that may have occured since the last computation of the fingerprint.
         This does not update the `fingerprint` field, just computes its candidate value.
         """
-        buf = self.plain_fingerprint(verbose)
-        m = hashlib.md5()
-        m.update(buf.encode('utf-8'))
-        return m.hexdigest()
+        return create_paper_fingerprint(self.plain_fingerprint(verbose))
 
     # Abstract -------------------------------------------------
     @cached_property
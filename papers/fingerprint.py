@@ -20,7 +20,9 @@
 
 
 
+import hashlib
 import re
+from functools import lru_cache
 
 from papers.name import split_name_words
 from papers.utils import kill_html
@@ -71,31 +73,49 @@ def create_paper_plain_fingerprint(title, authors, year):
     if not '-' in title:
         buf += '-'+str(year)
 
-    author_names_list = []
-    for author in authors:
-        if not author:
-            continue
-        author = (remove_diacritics(author[0]), remove_diacritics(author[1]))
-
-        # Last name, without the small words such as "van", "der", "de"…
-        last_name_words, last_name_separators = split_name_words(author[1])
-        last_words = []
-        for i, w in enumerate(last_name_words):
-            if (w[0].isupper() or
-                    (i > 0 and last_name_separators[i-1] == '-')):
-                last_words.append(w)
-
-        # If no word was uppercased, fall back on all the words
-        if not last_words:
-            last_words = last_name_words
-
-        # Lowercase
-        last_words = list(map(ulower, last_words))
-        fp = '-'.join(last_words)
-        author_names_list.append(fp)
-
+    author_names_list = [author_fingerprint(author[1]) for author in authors if author]
     author_names_list.sort()
     for fp in author_names_list:
         buf += '/'+fp
 
     return buf
+
+
+@lru_cache(maxsize=65536)
+def author_fingerprint(last_name):
+    """
+    The part of the plain fingerprint for an author, computed from their
+    last name. This is cached as the same authors appear in many papers.
+
+    >>> author_fingerprint('van der Waals')
+    'waals'
+    >>> author_fingerprint('Kenyon-mathieu')
+    'kenyon-mathieu'
+    """
+    # Last name, without the small words such as "van", "der", "de"…
+    last_name_words, last_name_separators = split_name_words(remove_diacritics(last_name))
+    last_words = []
+    for i, w in enumerate(last_name_words):
+        if (w[0].isupper() or
+                (i > 0 and last_name_separators[i-1] == '-')):
+            last_words.append(w)
+
+    # If no word was uppercased, fall back on all the words
+    if not last_words:
+        last_words = last_name_words
+
+    # Lowercase
+    last_words = list(map(ulower, last_words))
+    return '-'.join(last_words)
+
+
+def create_paper_fingerprint(plain_fingerprint):
+    """
+    Hashes a plain fingerprint, to get the fingerprint stored with papers
+
+    >>> create_paper_fingerprint('ambiguity-2014/doe')
+    '6a0cdbc5372a795ca63980625a258066'
+    """
+    m = hashlib.md5()
+    m.update(plain_fingerprint.encode('utf-8'))
+    return m.hexdigest()
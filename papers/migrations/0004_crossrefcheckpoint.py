@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0003_institution_repository'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrossRefCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('cursor', models.TextField()),
+                ('pages', models.IntegerField(default=0)),
+                ('new_papers', models.IntegerField(default=0)),
+                ('total_results', models.IntegerField(default=0)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
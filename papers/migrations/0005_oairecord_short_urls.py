@@ -0,0 +1,83 @@
+import re
+
+from django.db import migrations, models
+from django.db import transaction
+
+# Copies of papers.doi.to_doi and papers.models.shorten_url at the time of
+# this migration, so that it does not change with them
+
+doi_re = re.compile(
+    r'^ *(?:[Dd][Oo][Ii] *[:=])? *(?:https?://(?:dx\.)?doi\.org/)?(10\.[0-9]{4,}[^ ]*/[^ ]+) *$')
+openaire_doi_re = re.compile(
+    r'info:eu-repo/semantics/altIdentifier/doi/(10\.[0-9]{4,}[^ ]*/[^ ]+) *')
+https_re = re.compile(r'https?(.*)')
+
+def to_doi(candidate):
+    m = doi_re.match(candidate)
+    if m:
+        return m.groups()[0].lower()
+    openaire_match = openaire_doi_re.match(candidate)
+    if openaire_match:
+        return openaire_match.group(1).lower()
+
+def shorten_url(url):
+    if not url:
+        return
+    doi = to_doi(url)
+    if doi:
+        return doi
+    match = https_re.match(url.strip())
+    if match:
+        return match.group(1)
+
+
+def fill_short_urls(apps, schema_editor):
+    """
+    Computes the short urls of the existing records, by batches,
+    each of them in its own transaction
+    """
+    OaiRecord = apps.get_model('papers', 'OaiRecord')
+    batch_size = 5000
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(OaiRecord.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'splash_url', 'pdf_url')[:batch_size])
+            if not batch:
+                break
+            for record in batch:
+                record.short_splash = shorten_url(record.splash_url)
+                record.short_pdf = shorten_url(record.pdf_url)
+            OaiRecord.objects.bulk_update(batch, ['short_splash', 'short_pdf'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # The backfill commits each batch, instead of locking the whole table
+    atomic = False
+
+    dependencies = [
+        ('papers', '0004_crossrefcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oairecord',
+            name='short_splash',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='oairecord',
+            name='short_pdf',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.RunPython(fill_short_urls, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='oairecord',
+            index=models.Index(fields=['about', 'short_splash'], name='papers_oairecord_splash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oairecord',
+            index=models.Index(fields=['about', 'short_pdf'], name='papers_oairecord_pdf_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0006_oaisource_harvest_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oaisource',
+            name='harvest_interval',
+            field=models.DurationField(default=datetime.timedelta(hours=1)),
+        ),
+        migrations.AddField(
+            model_name='oaisource',
+            name='request_delay',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0007_oaisource_harvest_throttling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrcidWorkVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('put_code', models.BigIntegerField()),
+                ('last_modified', models.BigIntegerField(blank=True, null=True)),
+                ('doi', models.CharField(blank=True, max_length=1024, null=True)),
+                ('researcher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='papers.Researcher')),
+            ],
+            options={
+                'unique_together': {('researcher', 'put_code')},
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0008_orcidworkversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oaisource',
+            name='harvest_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -42,6 +42,7 @@ This module defines most of the models used in the platform.
 
 
 
+from collections import defaultdict
 from datetime import datetime
 from datetime import timedelta
 import re
@@ -69,8 +70,11 @@ from django.core.cache.utils import make_template_fragment_key
 from django.core.exceptions import ObjectDoesNotExist
 from django.urls import reverse
 from django.db import DataError
+from django.db import IntegrityError
 from django.db import models
+from django.db import transaction
 from django.db.models import prefetch_related_objects
+from django.db.models import Q
 from django.template.defaultfilters import slugify
 from django.utils import timezone
 from django.utils.functional import cached_property
@@ -595,6 +599,28 @@ class Researcher(models.Model):
         researcher.delete()
         self.save()
 
+class OrcidWorkVersion(models.Model):
+    """
+    The version of a work in the ORCID profile of a researcher, as seen
+    by the latest harvest of the profile. Works whose version did not
+    change are not fetched again by the next harvests.
+    """
+    researcher = models.ForeignKey(Researcher, on_delete=models.CASCADE)
+    #: the identifier of the work in the profile
+    put_code = models.BigIntegerField()
+    #: last modification date of the work, in milliseconds since the epoch,
+    #: as returned by ORCID
+    last_modified = models.BigIntegerField(null=True, blank=True)
+    #: DOI of the work, if any
+    doi = models.CharField(max_length=1024, null=True, blank=True)
+
+    class Meta:
+        unique_together = ('researcher', 'put_code')
+
+    def __str__(self):
+        return '{}/{}'.format(self.researcher_id, self.put_code)
+
+
 class Name(models.Model, BareName):
     first = models.CharField(max_length=MAX_NAME_LENGTH)
     last = models.CharField(max_length=MAX_NAME_LENGTH)
@@ -865,6 +891,17 @@ class Paper(models.Model, BarePaper):
     def find_by_fingerprint(cls, fp):
         return Paper.objects.filter(fingerprint__exact=fp)
 
+    @classmethod
+    def find_by_fingerprints(cls, fps):
+        """
+        Looks up the papers for a batch of fingerprints, with one query
+
+        :returns: a dict from fingerprints to papers
+        """
+        return {
+            paper.fingerprint : paper for paper in Paper.objects.filter(fingerprint__in=set(fps))
+        }
+
     @classmethod
     def from_bare(cls, bare_obj):
         """
@@ -901,6 +938,208 @@ class Paper(models.Model, BarePaper):
             raise ValueError(
                 'Invalid paper, does not fit in the database schema:\n'+str(e))
 
+    @classmethod
+    def from_bare_batch(cls, bare_papers):
+        """
+        Saves a batch of bare papers to the database, as :meth:`from_bare`
+        does for each of them, but with a few queries for the whole batch.
+
+        Existing papers and records are fetched for the whole batch, merged
+        in memory with the bare papers and written with bulk operations, in
+        one transaction. Bare papers matching earlier ones in the batch (by
+        fingerprint, DOI or identifier) are saved in a second round, so that
+        they are merged into the papers created by the first one. Bare papers
+        matching several existing papers go through :meth:`from_bare`, and
+        so does the whole batch if it conflicts with papers saved meanwhile
+        by another process.
+
+        :returns: the list of :class:`Paper` instances, in the order of
+            bare_papers. It contains None for invalid bare papers.
+        """
+        papers = [None] * len(bare_papers)
+        remaining = []
+        try:
+            with transaction.atomic():
+                pending = list(range(len(bare_papers)))
+                while pending:
+                    pending, slow = cls._save_bare_round(bare_papers, pending, papers)
+                    remaining += slow
+        except (DataError, IntegrityError) as e:
+            logger.warning('Bulk save failed, saving papers one by one: {}'.format(e))
+            papers = [None] * len(bare_papers)
+            remaining = range(len(bare_papers))
+
+        for idx in sorted(remaining):
+            # the savepoint keeps an enclosing transaction usable
+            try:
+                with transaction.atomic():
+                    papers[idx] = Paper.from_bare(bare_papers[idx])
+            except (ValueError, DataError, IntegrityError) as e:
+                logger.debug(e)
+
+        return papers
+
+    @classmethod
+    def _save_bare_round(cls, bare_papers, indices, papers):
+        """
+        Saves in bulk the bare papers with the given indices that are new or
+        match exactly one existing paper, and stores the results in papers.
+
+        :returns: the indices of the bare papers matching an earlier one
+            in this round, and the indices of those matching several papers
+        """
+        bare_papers_round = [bare_papers[idx] for idx in indices]
+        fingerprints = set(bare_paper.fingerprint for bare_paper in bare_papers_round)
+        bare_records = [record for bare_paper in bare_papers_round for record in bare_paper.oairecords]
+        dois = set(record.doi for record in bare_records if record.doi)
+        identifiers = set(record.identifier for record in bare_records)
+
+        existing_papers = Paper.find_by_fingerprints(fingerprints)
+        records_by_paper = defaultdict(list)
+        records_by_doi = defaultdict(list)
+        records_by_identifier = dict()
+        for record in OaiRecord.objects.filter(
+                Q(doi__in=dois) | Q(identifier__in=identifiers) | Q(about_id__in=[paper.pk for paper in existing_papers.values()])
+            ).select_related('source'):
+            records_by_paper[record.about_id].append(record)
+            if record.doi:
+                records_by_doi[record.doi].append(record)
+            records_by_identifier[record.identifier] = record
+
+        new = []
+        updated = []
+        next_round = []
+        slow = []
+        seen = set()
+        for idx in indices:
+            bare_paper = bare_papers[idx]
+            keys = set([bare_paper.fingerprint])
+            about_ids = set()
+            for record in bare_paper.oairecords:
+                keys.add(record.identifier)
+                if record.doi:
+                    keys.add(record.doi)
+                    about_ids.update(r.about_id for r in records_by_doi[record.doi])
+                if record.identifier in records_by_identifier:
+                    about_ids.add(records_by_identifier[record.identifier].about_id)
+            paper = existing_papers.get(bare_paper.fingerprint)
+
+            if keys & seen:
+                next_round.append(idx)
+            elif paper is None and not about_ids:
+                new.append(idx)
+            elif paper is not None and about_ids <= set([paper.pk]):
+                updated.append((idx, paper))
+            else:
+                slow.append(idx)
+            seen.update(keys)
+
+        created = cls._create_from_bare_in_bulk([bare_papers[idx] for idx in new])
+        for idx, paper in zip(new, created):
+            papers[idx] = paper
+        cls._update_from_bare_in_bulk(
+            [(paper, bare_papers[idx]) for idx, paper in updated],
+            records_by_paper,
+            records_by_identifier
+        )
+        for idx, paper in updated:
+            papers[idx] = paper
+        return next_round, slow
+
+    @staticmethod
+    def _record_from_bare(paper, bare_record):
+        """
+        Creates an unsaved OaiRecord for paper from a BareOaiRecord
+        """
+        bare_record.cleanup_description()
+        record = OaiRecord.from_bare(bare_record)
+        record.about = paper
+        record.priority = record.source.priority
+        if not record.pubtype:
+            record.pubtype = record.source.default_pubtype
+        record.update_short_urls()
+        return record
+
+    @classmethod
+    def _create_from_bare_in_bulk(cls, bare_papers):
+        """
+        Creates papers and their records that are not yet in the database
+
+        :param bare_papers: list of BarePaper
+        :returns: list of Paper objects
+        """
+        papers = []
+        for bare_paper in bare_papers:
+            bare_paper.update_availability()
+            paper = Paper(**{field : getattr(bare_paper, field) for field in BarePaper._bare_fields})
+            for idx, author in enumerate(bare_paper.authors):
+                paper.add_author(author, position=idx)
+            papers.append(paper)
+        Paper.objects.bulk_create(papers)
+
+        records = []
+        for paper, bare_paper in zip(papers, bare_papers):
+            paper.cached_oairecords = [cls._record_from_bare(paper, bare_record) for bare_record in bare_paper.oairecords]
+            records += paper.cached_oairecords
+        OaiRecord.objects.bulk_create(records)
+
+        return papers
+
+    @classmethod
+    def _update_from_bare_in_bulk(cls, pairs, records_by_paper, records_by_identifier):
+        """
+        Updates existing papers with the authors and records of the bare papers matching them
+
+        :param pairs: list of (Paper, BarePaper)
+        :param records_by_paper: dict mapping paper ids to their existing records
+        :param records_by_identifier: dict mapping identifiers to existing records
+        """
+        now = timezone.now()
+        papers = []
+        new_records = []
+        changed_records = []
+        for paper, bare_paper in pairs:
+            if bare_paper.visible and not paper.visible:
+                paper.visible = True
+            paper.update_authors(bare_paper.authors, save_now=False)
+
+            records = records_by_paper[paper.pk]
+            for bare_record in bare_paper.oairecords:
+                bare_record.cleanup_description()
+                match = records_by_identifier.get(bare_record.identifier)
+                if match is None:
+                    short_splash = shorten_url(bare_record.splash_url)
+                    short_pdf = shorten_url(bare_record.pdf_url)
+                    for record in records:
+                        if short_splash == record.short_splash or (short_pdf is not None and short_pdf == record.short_pdf):
+                            match = record
+                            break
+                if match is not None:
+                    if match.update_conditionally(bare_record.source, bare_record.__dict__):
+                        match.last_update = now
+                        changed_records.append(match)
+                elif len(records) < MAX_OAIRECORDS_PER_PAPER:
+                    record = cls._record_from_bare(paper, bare_record)
+                    records.append(record)
+                    new_records.append(record)
+
+            BarePaper.update_availability(paper, records)
+            paper.cached_oairecords = records
+            paper.last_modified = now
+            papers.append(paper)
+
+        OaiRecord.objects.bulk_create(new_records)
+        OaiRecord.objects.bulk_update(
+            changed_records,
+            ['source', 'priority', 'pdf_url', 'splash_url', 'short_pdf', 'short_splash', 'contributors', 'keywords', 'description', 'doi', 'pubtype', 'last_update']
+        )
+        Paper.objects.bulk_update(
+            papers,
+            ['authors_list', 'visible', 'doctype', 'oa_status', 'pdf_url', 'last_modified']
+        )
+        for paper in papers:
+            paper.invalidate_cache()
+
     ### Other methods, specific to this non-bare subclass ###
 
     def update_author_stats(self):
@@ -1324,10 +1563,23 @@ class Paper(models.Model, BarePaper):
             except haystack.exceptions.NotHandled:
                 pass
 
-    def update_index(self):
+    def update_index(self, deferred=False):
         """
         Updates Haystack's index for this paper
+
+        :param deferred: if True, the paper is reindexed later by the
+            `index_dirty_papers` task, see :mod:`backend.indexing`.
+            Otherwise, if settings.DEFERRED_INDEXING is set, the paper is
+            reindexed when the current transaction is committed.
         """
+        if settings.DEFERRED_INDEXING:
+            from backend.indexing import index_on_commit
+            from backend.indexing import mark_for_indexing
+            if deferred:
+                mark_for_indexing([self.pk])
+            else:
+                index_on_commit([self.pk])
+            return
         using_backends = haystack.connection_router.for_write(instance=self)
         for using in using_backends:
             try:
@@ -1337,8 +1589,52 @@ class Paper(models.Model, BarePaper):
             except haystack.exceptions.NotHandled:
                 pass
 
+    @classmethod
+    def bulk_update_index(cls, papers, deferred=False):
+        """
+        Updates Haystack's index for a list of papers, sending
+        one bulk request per backend instead of one per paper
+
+        :param deferred: see :meth:`update_index`
+        """
+        if not papers:
+            return
+        if settings.DEFERRED_INDEXING:
+            from backend.indexing import index_on_commit
+            from backend.indexing import mark_for_indexing
+            if deferred:
+                mark_for_indexing([paper.pk for paper in papers])
+            else:
+                index_on_commit([paper.pk for paper in papers])
+            return
+        using_backends = haystack.connection_router.for_write()
+        for using in using_backends:
+            try:
+                index = haystack.connections[using].get_unified_index(
+                                        ).get_index(Paper)
+            except haystack.exceptions.NotHandled:
+                continue
+            index.prefetch(papers)
+            haystack.connections[using].get_backend().update(index, papers)
+
 # Rough data extracted through OAI-PMH
 
+https_re = re.compile(r'https?(.*)')
+
+def shorten_url(url):
+    """
+    Removes the 'https?' prefix of an url or converts it to a DOI.
+    This is used to detect duplicate OAI records.
+    """
+    if not url:
+        return
+    doi = to_doi(url)
+    if doi:
+        return doi
+    match = https_re.match(url.strip())
+    if match:
+        return match.group(1)
+
 class OaiSourceManager(CachingManager):
     def get_by_natural_key(self, identifier):
         return self.get(identifier=identifier)
@@ -1381,9 +1677,66 @@ class OaiSource(CachingMixin, models.Model):
     #: Last time we harvested this source.
     last_update = models.DateTimeField(default=datetime(1970,1,1,0,0,0,tzinfo=pytz.UTC))
 
+    #: Resumption token of the harvest in progress, if any.
+    resumption_token = models.CharField(max_length=1024, null=True, blank=True)
+
+    #: Latest datestamp of the records saved by the harvest in progress,
+    #: used to resume it if the resumption token has expired.
+    harvest_datestamp = models.DateTimeField(null=True, blank=True)
+
+    #: Start time of the harvest in progress, which becomes last_update
+    #: once it is complete, even if it was interrupted and resumed.
+    harvest_started = models.DateTimeField(null=True, blank=True)
+
+    #: Minimum time between the starts of two harvests of this source.
+    harvest_interval = models.DurationField(default=timedelta(hours=1))
+
+    #: Minimum delay between two requests to the endpoint, in seconds.
+    request_delay = models.FloatField(default=0)
+
     def __str__(self):
         return self.name
 
+    def start_harvest(self):
+        """
+        Records the start time of a harvest. If the previous harvest was
+        interrupted, its start time is kept: the records modified since
+        then are not covered by its resumption token.
+
+        :returns: the start time of the harvest in progress
+        """
+        if self.harvest_started is None:
+            self.harvest_started = timezone.now()
+            self.save(update_fields=['harvest_started'])
+        return self.harvest_started
+
+    def checkpoint_harvest(self, resumption_token, datestamp):
+        """
+        Records the progress of the harvest in progress, so that it can
+        be resumed from there if it is interrupted.
+
+        :param resumption_token: the token to resume the harvest from
+        :param datestamp: the latest datestamp of the records saved so far
+            (naive datetimes are assumed to be UTC, as in OAI-PMH)
+        """
+        if datestamp is not None and datestamp.tzinfo is None:
+            datestamp = datestamp.replace(tzinfo=pytz.UTC)
+        self.resumption_token = resumption_token
+        if datestamp is not None and (self.harvest_datestamp is None or datestamp > self.harvest_datestamp):
+            self.harvest_datestamp = datestamp
+        self.save(update_fields=['resumption_token', 'harvest_datestamp'])
+
+    def finish_harvest(self, date=None):
+        """
+        Marks the harvest in progress as complete, the next one starting
+        from the given date, by default the start time of the harvest.
+        """
+        self.last_update = date or self.harvest_started or timezone.now()
+        self.resumption_token = None
+        self.harvest_datestamp = None
+        self.harvest_started = None
+        self.save(update_fields=['last_update', 'resumption_token', 'harvest_datestamp', 'harvest_started'])
+
     def natural_key(self):
         return (self.identifier,)
 
@@ -1426,13 +1779,74 @@ class OaiRecord(models.Model, BareOaiRecord):
     # Cached version of source.priority
     priority = models.IntegerField(default=1)
 
+    # Cached versions of shorten_url(splash_url) and shorten_url(pdf_url),
+    # used to detect duplicate records
+    short_splash = models.CharField(max_length=1024, blank=True, null=True)
+    short_pdf = models.CharField(max_length=1024, blank=True, null=True)
+
     def __str__(self):
         return self.identifier
 
+    def save(self, *args, **kwargs):
+        self.update_short_urls()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('splash_url' in update_fields or 'pdf_url' in update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['short_splash', 'short_pdf']
+        super(OaiRecord, self).save(*args, **kwargs)
+
+    def update_short_urls(self):
+        """
+        Updates short_splash and short_pdf. This is done by save(), but
+        needs to be called explicitly before bulk operations.
+        """
+        self.short_splash = shorten_url(self.splash_url)
+        self.short_pdf = shorten_url(self.pdf_url)
+
     def update_priority(self):
         super(OaiRecord, self).update_priority()
         self.save(update_fields=['priority'])
 
+    def update_conditionally(self, source, fields):
+        """
+        Updates the fields of this record with the values of a duplicate
+        record coming from `source`, if they are more informative.
+        This does not save the record.
+
+        :param source: the :class:`OaiSource` of the duplicate record
+        :param fields: dict of the fields of the duplicate record
+        :returns: True if the record has changed
+        """
+        changed = False
+        pdf_url = fields.get('pdf_url')
+
+        if pdf_url != None and (self.pdf_url == None or
+                                (self.pdf_url != pdf_url and self.priority < source.priority)):
+            self.source = source
+            self.priority = source.priority
+            self.pdf_url = pdf_url
+            self.splash_url = fields.get('splash_url')
+            self.update_short_urls()
+            changed = True
+
+        for field in ['contributors', 'keywords', 'description', 'doi']:
+            new_val = fields.get(field, '')
+            if new_val and (not self.__dict__[field] or
+                            len(self.__dict__[field]) < len(new_val)):
+                self.__dict__[field] = new_val
+                changed = True
+
+        new_pubtype = fields.get('pubtype', source.default_pubtype)
+        if new_pubtype in PAPER_TYPE_PREFERENCE:
+            idx = PAPER_TYPE_PREFERENCE.index(new_pubtype)
+            old_idx = len(PAPER_TYPE_PREFERENCE)-1
+            if self.pubtype in PAPER_TYPE_PREFERENCE:
+                old_idx = PAPER_TYPE_PREFERENCE.index(self.pubtype)
+            if idx < old_idx:
+                changed = True
+                self.pubtype = PAPER_TYPE_PREFERENCE[idx]
+
+        return changed
+
     @classmethod
     def new(cls, **kwargs):
         """
@@ -1473,8 +1887,14 @@ class OaiRecord(models.Model, BareOaiRecord):
                     pdf_url)
 
         # We check that there are not already too many records in this
-        # paper
-        if about.cached_oairecords and len(about.cached_oairecords) >= MAX_OAIRECORDS_PER_PAPER:
+        # paper, counting them in the database if they are not cached
+        if about.cached_oairecords is not None:
+            records_count = len(about.cached_oairecords)
+        elif not about.just_created:
+            records_count = about.oairecord_set.count()
+        else:
+            records_count = 0
+        if records_count >= MAX_OAIRECORDS_PER_PAPER:
             raise ValueError('Too many records in paper %d' % about.pk)
 
         # We don't search for records with the same identifier yet,
@@ -1518,44 +1938,13 @@ class OaiRecord(models.Model, BareOaiRecord):
 
         # Update the duplicate if necessary
         if match:
-            changed = False
-
-            if pdf_url != None and (match.pdf_url == None or
-                                    (match.pdf_url != pdf_url and match.priority < source.priority)):
-                match.source = source
-                match.priority = source.priority
-                match.pdf_url = pdf_url
-                match.splash_url = splash_url
-                changed = True
-
-            def update_field_conditionally(field):
-                global changed
-                new_val = kwargs.get(field, '')
-                if new_val and (not match.__dict__[field] or
-                                len(match.__dict__[field]) < len(new_val)):
-                    match.__dict__[field] = new_val
-                    changed = True
-
-            update_field_conditionally('contributors')
-            update_field_conditionally('keywords')
-            update_field_conditionally('description')
-            update_field_conditionally('doi')
+            changed = match.update_conditionally(source, kwargs)
 
             new_pubdate = kwargs.get('pubdate')
             if new_pubdate and match.about.pubdate > new_pubdate:
                 match.about.pubdate = new_pubdate
                 match.save(update_fields=['pubdate'])
 
-            new_pubtype = kwargs.get('pubtype', source.default_pubtype)
-            if new_pubtype in PAPER_TYPE_PREFERENCE:
-                idx = PAPER_TYPE_PREFERENCE.index(new_pubtype)
-                old_idx = len(PAPER_TYPE_PREFERENCE)-1
-                if match.pubtype in PAPER_TYPE_PREFERENCE:
-                    old_idx = PAPER_TYPE_PREFERENCE.index(match.pubtype)
-                if idx < old_idx:
-                    changed = True
-                    match.pubtype = PAPER_TYPE_PREFERENCE[idx]
-
             if changed:
                 try:
                     match.save()
@@ -1584,39 +1973,46 @@ class OaiRecord(models.Model, BareOaiRecord):
         :param splash_url: the splash url of the target record (link to the metadata page)
         :param pdf_url: the url of the PDF, if known (otherwise `None`)
         """
-        https_re = re.compile(r'https?(.*)')
-
-        def shorten(url):
-            """
-            removes the 'https?' prefix or converts to DOI
-            """
-            if not url:
-                return
-            doi = to_doi(url)
-            if doi:
-                return doi
-            match = https_re.match(url.strip())
-            if match:
-                return match.group(1)
-
-        short_splash = shorten(splash_url)
-        short_pdf = shorten(pdf_url)
+        short_splash = shorten_url(splash_url)
+        short_pdf = shorten_url(pdf_url)
 
         if short_splash == None or paper == None:
             return
 
-        records = list(paper.oairecord_set.all()[:MAX_OAIRECORDS_PER_PAPER])
-        paper.cached_oairecords = records
-        for record in records:
-            short_splash2 = shorten(record.splash_url)
-            short_pdf2 = shorten(record.pdf_url)
-            if (short_splash == short_splash2 or
-                (short_pdf is not None and
-                 short_pdf2 == short_pdf)):
-                return record
+        query = Q(short_splash=short_splash)
+        if short_pdf is not None:
+            query |= Q(short_pdf=short_pdf)
+        return paper.oairecord_set.filter(query).order_by('pk').first()
 
     class Meta:
         verbose_name = "OAI record"
+        indexes = [
+            models.Index(fields=['about', 'short_splash'], name='papers_oairecord_splash_idx'),
+            models.Index(fields=['about', 'short_pdf'], name='papers_oairecord_pdf_idx'),
+        ]
+
+
+class CrossRefCheckpoint(models.Model):
+    """
+    Progress of the harvesting of a day from the CrossRef API, so that
+    an interrupted harvest can resume from the last saved page.
+    It is deleted once the day has been fully harvested.
+    """
+    #: The day of updates being harvested
+    day = models.DateField(unique=True)
+    #: The cursor to fetch the next page of results
+    cursor = models.TextField()
+    #: Number of pages saved so far
+    pages = models.IntegerField(default=0)
+    #: Number of papers added or updated so far
+    new_papers = models.IntegerField(default=0)
+    #: Total number of results announced by CrossRef for the day
+    total_results = models.IntegerField(default=0)
+
+    last_update = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{}: {} pages'.format(self.day, self.pages)
 
 
 def create_default_stats():
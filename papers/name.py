@@ -22,6 +22,8 @@
 
 import re
 import logging
+from collections import namedtuple
+from functools import lru_cache
 
 import name_tools
 from papers.utils import iunaccent
@@ -108,6 +110,15 @@ def split_name_words(string):
     :returns: A pair of lists. The first one is the list of words, the second is the
               list of separators (either '' or '-')
     """
+    words, separators = _split_name_words(string)
+    return (list(words), list(separators))
+
+
+@lru_cache(maxsize=65536)
+def _split_name_words(string):
+    """
+    Memoized version of split_name_words, returning tuples
+    """
     buf = string.strip()
     words = []
     separators = []
@@ -142,7 +153,7 @@ def split_name_words(string):
         match = name_separator_re.search(buf)
     if buf:
         words.append(buf)
-    return (words, separators)
+    return (tuple(words), tuple(separators))
 
 
 def has_only_initials(string):
@@ -207,7 +218,19 @@ def match_first_names(pair):
     elif len(b) == 1 and len(a) > 0:
         return b.lower() == a[0].lower()
     else:
-        return remove_diacritics(a).lower() == remove_diacritics(b).lower()
+        return fold_word(a) == fold_word(b)
+
+
+@lru_cache(maxsize=65536)
+def fold_word(word):
+    """
+    Removes diacritics and case, memoized as the same
+    words are compared again and again.
+
+    >>> fold_word('Clément')
+    'clement'
+    """
+    return iunaccent(word)
 
 
 def to_plain_name(name):
@@ -263,6 +286,52 @@ def name_signature(first, last):
         ident = iunaccent(first[0])+'-'+ident
     return ident
 
+### Normalized names ###
+
+#: The parts of a name used by the similarity and unification
+#: heuristics below, computed once per name by :func:`normalize_name`.
+NormalizedName = namedtuple('NormalizedName', [
+    'first', # the first name, as given
+    'last', # the last name, as given
+    'first_words', # words of the first name
+    'first_separators', # separators between these words
+    'first_initials', # initials of these words
+    'unaccented_first_words', # words of the unaccented, lowercase first name
+    'unaccented_last', # unaccented, lowercase last name
+    'unaccented_last_words', # set of the words of unaccented_last
+    'comparable_last', # last name without diacritics and hyphens, see normalize_last_name
+])
+
+
+def normalize_name(name):
+    """
+    Computes the :class:`NormalizedName` of a (first, last) pair.
+    The result is cached, since the same names are compared many times
+    when merging papers.
+
+    >>> normalize_name(('Jean-Pierre', 'Müller')).unaccented_last
+    'muller'
+    """
+    return _normalize_name(name[0], name[1])
+
+
+@lru_cache(maxsize=65536)
+def _normalize_name(first, last):
+    first_words, first_separators = _split_name_words(first)
+    unaccented_last = iunaccent(last)
+    return NormalizedName(
+        first=first,
+        last=last,
+        first_words=first_words,
+        first_separators=first_separators,
+        first_initials=tuple(w[0] for w in first_words),
+        unaccented_first_words=_split_name_words(iunaccent(first))[0],
+        unaccented_last=unaccented_last,
+        unaccented_last_words=frozenset(_split_name_words(unaccented_last)[0]),
+        comparable_last=normalize_last_name(last),
+    )
+
+
 ### Name similarity measure ###
 
 weight_initial_match = 0.4
@@ -288,16 +357,12 @@ def name_similarity(a, b):
 
     if not a or not b or len(a) != 2 or len(b) != 2:
         return False
-    firstA, lastA = a
-    firstB, lastB = b
-    firstA = iunaccent(firstA)
-    firstB = iunaccent(firstB)
-    lastA = iunaccent(lastA)
-    lastB = iunaccent(lastB)
-    if lastA != lastB:
+    normA = normalize_name(a)
+    normB = normalize_name(b)
+    if normA.unaccented_last != normB.unaccented_last:
         return 0.
-    partsA, sepsA = split_name_words(firstA)
-    partsB, sepsB = split_name_words(firstB)
+    partsA = list(normA.unaccented_first_words)
+    partsB = list(normB.unaccented_first_words)
     parts = list(zip(partsA, partsB))
     if not all(map(match_first_names, parts)):
         # Try to match in reverse
@@ -342,24 +407,18 @@ def shallower_name_similarity(a, b):
     """
     if not a or not b or len(a) != 2 or len(b) != 2:
         return False
-    firstA, lastA = a
-    firstB, lastB = b
+    normA = normalize_name(a)
+    normB = normalize_name(b)
 
     # Matching last names
-    lastA = iunaccent(lastA)
-    lastB = iunaccent(lastB)
-    wordsA, _ = split_name_words(lastA)
-    wordsB, _ = split_name_words(lastB)
-    wordsA = set(wordsA)
-    wordsB = set(wordsB)
+    wordsA = normA.unaccented_last_words
+    wordsB = normB.unaccented_last_words
     if not wordsA or not wordsB:
         return False
     ratio = float(len(wordsA & wordsB)) / len(wordsA | wordsB)
 
-    partsA, sepsA = split_name_words(firstA)
-    partsB, sepsB = split_name_words(firstB)
-    partsA = [ p[0] for p in partsA ]
-    partsB = [ p[0] for p in partsB ]
+    partsA = list(normA.first_initials)
+    partsB = list(normB.first_initials)
 
     parts = list(zip(partsA, partsB))
     if not all(map(match_first_names, parts)):
@@ -437,11 +496,41 @@ def predsplit_backwards(predicate, words):
 
 ###### Name splitting heuristic based on name_tools ######
 
+#: Maximum number of raw names whose parsing is cached by
+#: :func:`parse_comma_name`
+PARSE_COMMA_NAME_CACHE_SIZE = 200000
+
+
 def parse_comma_name(name):
     """
     Parse a name of the form "Last name, First name" to (first name, last name)
     Try to do something reasonable if there is no comma.
+
+    The result is cached, see :func:`parse_comma_name_cache_info`.
     """
+    return _parse_comma_name(name)
+
+
+def parse_comma_names(names):
+    """
+    Parses a list of names with :func:`parse_comma_name`
+
+    >>> parse_comma_names(['Ryder, Robin', 'Robin Ryder'])
+    [('Robin', 'Ryder'), ('Robin', 'Ryder')]
+    """
+    return [_parse_comma_name(name) for name in names]
+
+
+def parse_comma_name_cache_info():
+    """
+    :returns: the hits, misses, maximum size and current size of the
+        cache of :func:`parse_comma_name`, as a named tuple
+    """
+    return _parse_comma_name.cache_info()
+
+
+@lru_cache(maxsize=PARSE_COMMA_NAME_CACHE_SIZE)
+def _parse_comma_name(name):
     if ',' in name:
         # In this case name_tools does it well
         prefix, first_name, last_name, suffix = name_tools.split(name)
@@ -560,14 +649,15 @@ def name_unification(a, b):
     :param b: the second name pair (idem)
     :returns: a unified name pair.
     """
-    firstA, lastA = a
-    firstB, lastB = b
+    normA = normalize_name(a)
+    normB = normalize_name(b)
 
-    if normalize_last_name(lastA) != normalize_last_name(lastB):
+    if normA.comparable_last != normB.comparable_last:
         return None
+    lastA = normA.last
 
-    wordsA, sepsA = split_name_words(firstA)
-    wordsB, sepsB = split_name_words(firstB)
+    wordsA, sepsA = list(normA.first_words), list(normA.first_separators)
+    wordsB, sepsB = list(normB.first_words), list(normB.first_separators)
 
     def keep_best(pair):
         a, b = pair
@@ -625,6 +715,13 @@ def unify_name_lists(a, b):
               the second is the pair of indices from the original lists this name was created from
               (None when there is no corresponding name in one of the lists).
     """
+    if len(a) == len(b) and all(tuple(nameA) == tuple(nameB) for nameA, nameB in zip(a, b)):
+        # Fast path for a list unified with itself, which happens each
+        # time a paper is fetched again: the walk below would pair each
+        # name with itself, in the same order.
+        result = [(_unify_name_with_itself(name), (idx, idx)) for idx, name in enumerate(a)]
+        return list(_make_unique_names(result))
+
     # TODO some normalization of last names? for instance case, hyphens…
     a = sorted(enumerate(a), key=lambda idx_first_last: (idx_first_last[1][1], idx_first_last[1][0]))
     b = sorted(enumerate(b), key=lambda idx_first_last1: (idx_first_last1[1][1], idx_first_last1[1][0]))
@@ -681,16 +778,29 @@ def unify_name_lists(a, b):
                 iB += 1
 
     result = [(name, idx) for name, _, idx in sorted(result, key=lambda x: x[1])]
+    return list(_make_unique_names(result))
 
-    def make_unique(lst):
-        seen = set()
-        for name, idx in lst:
-            first, last = name
-            [k1, k2] = sorted([first.lower(), last.lower()])
-            if (k1, k2) not in seen:
-                seen.add((k1, k2))
-                yield (name, idx)
-            else:
-                yield (None, idx)
 
-    return list(make_unique(result))
+def _unify_name_with_itself(name):
+    """
+    Same as name_unification(name, name), without comparing the words
+    """
+    first, last = name
+    words, separators = split_name_words(first)
+    words, separators = deduplicate_words(words, separators)
+    return rebuild_name(words, separators), last
+
+
+def _make_unique_names(lst):
+    """
+    Replaces names already seen in a list of (name, indices) pairs by None
+    """
+    seen = set()
+    for name, idx in lst:
+        first, last = name
+        [k1, k2] = sorted([first.lower(), last.lower()])
+        if (k1, k2) not in seen:
+            seen.add((k1, k2))
+            yield (name, idx)
+        else:
+            yield (None, idx)
@@ -22,11 +22,15 @@
 import logging
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.utils.functional import cached_property
 from papers.errors import MetadataSourceException
 from papers.name import normalize_name_words
 from papers.name import parse_comma_name
+from papers.name import parse_comma_names
 from papers.name import most_similar_author
 from papers.utils import jpath
 from papers.utils import urlize
@@ -38,6 +42,31 @@ from papers.doi import to_doi
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+#: connect and read timeouts of the requests to the ORCID API, in seconds
+ORCID_TIMEOUT = (5, 30)
+
+_orcid_session = None
+
+def orcid_session():
+    """
+    The HTTP session used for the requests to the ORCID API. It is shared
+    between threads, keeps connections alive and retries failed requests
+    with an exponential back-off.
+    """
+    global _orcid_session
+    if _orcid_session is None:
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False)
+        adapter = HTTPAdapter(pool_maxsize=max(settings.ORCID_FETCH_THREADS, 1), max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.headers['Accept'] = 'application/orcid+json'
+        _orcid_session = session
+    return _orcid_session
+
 orcid_type_to_pubtype = {
         'book': 'book',
         'book-chapter': 'book-chapter',
@@ -133,9 +162,8 @@ class OrcidProfile(object):
         """
         Returns the base URL of the profile on the API
         """
-        headers = {'Accept': 'application/orcid+json'}
         url = self.api_uri + path
-        return requests.get(url, headers=headers).json()
+        return orcid_session().get(url, timeout=ORCID_TIMEOUT).json()
 
     def fetch(self):
         """
@@ -151,7 +179,7 @@ class OrcidProfile(object):
                     return self.fetch()
                 raise ValueError
             self.json = parsed
-        except (requests.exceptions.HTTPError, ValueError):
+        except (requests.exceptions.RequestException, ValueError):
             raise MetadataSourceException(
                 'The ORCiD {id} could not be found from {instance}'.format(id=self.id, instance=self.instance))
         except TypeError:
@@ -252,25 +280,27 @@ class OrcidProfile(object):
             names.append((normalize_name_words(jpath('name/given-names/value', person, '')),
                           normalize_name_words(jpath('name/family-name/value', person, ''))))
         other_names = jpath('other-names/other-name', person, default=[])
-        for name in other_names:
-            val = name.get('content')
-            if val is not None:
-                names.append(parse_comma_name(val))
+        names += parse_comma_names([name['content'] for name in other_names if name.get('content') is not None])
         return names
 
     def fetch_works(self, put_codes):
         """
         Retrieves the full metadata of the given works in this profile.
+
+        Works are fetched by batches of 25 (the maximum allowed by the
+        API), with settings.ORCID_FETCH_THREADS batches being fetched at
+        the same time. They are yielded in the order of put_codes.
         """
         batch_size = 25
-        # TODO
-        i = 0
-        while i < len(put_codes):
-            batch = put_codes[i:(i+batch_size)]
-            i += batch_size
-            works_meta = self.request_element('works/'+','.join([str(c) for c in batch]))
-            for work in works_meta.get('bulk') or []:
-                yield OrcidWork(self, work)
+        paths = [
+            'works/'+','.join([str(c) for c in put_codes[i:(i+batch_size)]])
+            for i in range(0, len(put_codes), batch_size)
+        ]
+        threads = max(1, min(settings.ORCID_FETCH_THREADS, len(paths)))
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for works_meta in executor.map(self.request_element, paths):
+                for work in works_meta.get('bulk') or []:
+                    yield OrcidWork(self, work)
 
 
 class OrcidWorkSummary(object):
@@ -310,6 +340,14 @@ class OrcidWorkSummary(object):
     def put_code(self):
         return self.json.get('put-code')
 
+    @property
+    def last_modified(self):
+        """
+        Returns the last modification date of this publication, in
+        milliseconds since the epoch, if any.
+        """
+        return jpath('last-modified-date/value', self.json)
+
     def __str__(self):
         return self.title or '(no title)'
 
@@ -355,7 +393,7 @@ class OrcidWork(object):
     @property
     def authors_from_contributors(self):
         author_names = [c['name'] for c in self.contributors if c['name'] is not None]
-        return list(map(parse_comma_name, author_names))
+        return parse_comma_names(author_names)
 
     @property
     def authors(self):
@@ -1,7 +1,12 @@
+from collections import defaultdict
+
 from haystack import indexes
+from haystack.exceptions import SkipDocument
 from papers.utils import remove_diacritics
 
+from .models import OaiRecord
 from .models import Paper
+from .models import Researcher
 
 # from https://github.com/django-haystack/django-haystack/issues/204#issuecomment-544579
 class IntegerMultiValueField(indexes.MultiValueField):
@@ -39,9 +44,47 @@ class PaperIndex(indexes.SearchIndex, indexes.Indexable):
         return Paper
 
     def full_prepare(self, obj):
-        obj.cache_oairecords()
+        # Unless prefetch was just called, fetch fresh OAI records
+        if not obj.__dict__.pop('_prefetched_for_index', False):
+            obj.cache_oairecords()
+            obj.cached_institution_ids = None
         return super(PaperIndex, self).full_prepare(obj)
 
+    def full_prepare_batch(self, objs):
+        """
+        Prepares the documents for a list of papers, fetching their OAI
+        records and the institutions of their researchers with a constant
+        number of queries. Papers which should not be indexed are skipped.
+
+        :returns: list of prepared documents
+        """
+        objs = list(objs)
+        self.prefetch(objs)
+        prepped_docs = []
+        for obj in objs:
+            try:
+                prepped_docs.append(self.full_prepare(obj))
+            except SkipDocument:
+                continue
+        return prepped_docs
+
+    def prefetch(self, objs):
+        """
+        Caches the OAI records and the institutions of the researchers
+        of a list of papers, for the next call to full_prepare
+        """
+        records = defaultdict(list)
+        for record in OaiRecord.objects.filter(about__in=[obj.pk for obj in objs]):
+            records[record.about_id].append(record)
+        researcher_ids = set()
+        for obj in objs:
+            obj.cached_oairecords = records[obj.pk]
+            researcher_ids.update(obj.researcher_ids)
+        institution_ids = dict(Researcher.objects.filter(id__in=researcher_ids).values_list('id', 'institution_id'))
+        for obj in objs:
+            obj.cached_institution_ids = [institution_ids.get(rid) for rid in obj.researcher_ids]
+            obj._prefetched_for_index = True
+
     def get_updated_field(self):
         return "last_modified"
 
@@ -66,8 +109,10 @@ class PaperIndex(indexes.SearchIndex, indexes.Indexable):
         return [orcid for orcid in obj.orcids() if orcid]
 
     def prepare_institutions(self, obj):
-        return [x for x in [r.institution_id
-            for r in obj.researchers] if x is not None]
+        institution_ids = getattr(obj, 'cached_institution_ids', None)
+        if institution_ids is None:
+            institution_ids = [r.institution_id for r in obj.researchers]
+        return [x for x in institution_ids if x is not None]
 
     def prepare_publisher(self, obj):
         for r in obj.oairecords:
@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Micro-benchmark of :func:`papers.name.unify_name_lists` on author lists of
+various sizes. It is not collected by the test suite, run it with::
+
+    python -m papers.tests.bench_names
+
+Timings are given with the caches of :mod:`papers.name` cleared before
+each run (cold), which includes the normalization of the names, and with
+the caches filled by a previous run (warm).
+"""
+
+import random
+import timeit
+
+from papers import name
+from papers.name import unify_name_lists
+
+SIZES = [10, 100, 5000]
+REPEAT = 5
+
+syllables = ['an', 'be', 'ce', 'de', 'el', 'fo', 'gu', 'ha', 'ic', 'jo', 'ku', 'li', 'mo', 'né', 'ol', 'pa', 'ri', 'sé', 'tu', 'vi', 'wa', 'xé', 'yo', 'zu']
+
+
+def random_word(rnd):
+    return ''.join(rnd.choice(syllables) for i in range(rnd.randint(2, 4))).capitalize()
+
+
+def random_authors(rnd, size):
+    return [(random_word(rnd) + ' ' + rnd.choice('ABCDEFGH') + '.', random_word(rnd)) for i in range(size)]
+
+
+def variant(rnd, authors):
+    """
+    The same list as seen by another source: first names are sometimes
+    abbreviated and a few authors are missing.
+    """
+    result = []
+    for first, last in authors:
+        if rnd.random() < 0.02:
+            continue
+        if rnd.random() < 0.3:
+            first = first[0] + '.'
+        result.append((first, last))
+    return result
+
+
+def clear_caches():
+    name._normalize_name.cache_clear()
+    name._split_name_words.cache_clear()
+    name.fold_word.cache_clear()
+
+
+def bench(a, b, cold):
+    def run():
+        if cold:
+            clear_caches()
+        unify_name_lists(a, b)
+    run()
+    return 1000 * min(timeit.repeat(run, number=1, repeat=REPEAT))
+
+
+def main():
+    rnd = random.Random(42)
+    print('Time of unify_name_lists in ms')
+    print('{:>6} {:>16} {:>16} {:>16} {:>16}'.format('size', 'identical, cold', 'identical, warm', 'variant, cold', 'variant, warm'))
+    for size in SIZES:
+        authors = random_authors(rnd, size)
+        other = variant(rnd, authors)
+        print('{:>6} {:>16.2f} {:>16.2f} {:>16.2f} {:>16.2f}'.format(
+            size,
+            bench(authors, list(authors), True),
+            bench(authors, list(authors), False),
+            bench(authors, other, True),
+            bench(authors, other, False),
+        ))
+
+
+if __name__ == '__main__':
+    main()
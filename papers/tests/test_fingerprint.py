@@ -1,4 +1,6 @@
 from unittest import TestCase
+from papers.fingerprint import author_fingerprint
+from papers.fingerprint import create_paper_fingerprint
 from papers.fingerprint import create_paper_plain_fingerprint
 
 class FingerprintTest(TestCase):
@@ -12,4 +14,12 @@ class FingerprintTest(TestCase):
         self.assertEqual(create_paper_plain_fingerprint('Long titles are unambiguous enough to be unique by themselves, no need for authors', [('John','Doe')], 2015),
                          'long-titles-are-unambiguous-enough-to-be-unique-by-themselves-no-need-for-authors')
         self.assertEqual(create_paper_plain_fingerprint('Ambiguity', [('John','Doe')], 2014),
-                         'ambiguity-2014/doe')
\ No newline at end of file
+                         'ambiguity-2014/doe')
+
+    def test_author_fingerprint(self):
+        self.assertEqual(author_fingerprint('Müller'), 'muller')
+        self.assertEqual(author_fingerprint('de la Higuera'), 'higuera')
+        self.assertEqual(author_fingerprint('de la higuera'), 'de-la-higuera')
+
+    def test_fingerprint(self):
+        self.assertEqual(len(create_paper_fingerprint('ambiguity-2014/doe')), 32)
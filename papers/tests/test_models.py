@@ -37,6 +37,8 @@ import papers.doi
 
 from oaipmh.client import Client
 from papers.baremodels import BareName
+from papers.baremodels import BareOaiRecord
+from papers.baremodels import BarePaper
 from papers.models import Name
 from papers.models import OaiRecord
 from papers.models import OaiSource
@@ -118,6 +120,69 @@ class TestPaper():
         assert book_god_of_the_labyrinth.on_todolist(user_isaac_newton) == on_list
 
 
+@pytest.mark.usefixtures('db')
+class TestFromBareBatch():
+    """
+    Tests for Paper.from_bare_batch
+    """
+
+    @pytest.fixture
+    def bare_paper(self, dummy_oaisource):
+        def make(title, identifier, doi=None, authors=(('Alfred', 'Kastler'),)):
+            paper = BarePaper.create(title, [BareName.create(first, last) for first, last in authors], date(2015, 3, 2))
+            paper.add_oairecord(BareOaiRecord(
+                source=dummy_oaisource,
+                identifier=identifier,
+                splash_url='https://example.com/' + identifier,
+                doi=doi,
+                pubtype='journal-article'))
+            return paper
+        return make
+
+    def test_new_papers(self, bare_paper, django_assert_max_num_queries):
+        bare_papers = [bare_paper('Groundbreaking results', 'a'), bare_paper('Stunning results', 'b')]
+        with django_assert_max_num_queries(6):
+            papers = Paper.from_bare_batch(bare_papers)
+        assert [p.title for p in papers] == ['Groundbreaking results', 'Stunning results']
+        assert OaiRecord.objects.get(identifier='a').about == papers[0]
+        assert OaiRecord.objects.get(identifier='b').about == papers[1]
+        assert Paper.objects.get(pk=papers[0].pk).doctype == 'journal-article'
+
+    def test_new_papers_availability(self, bare_paper):
+        bare = bare_paper('Groundbreaking results', 'a')
+        bare.oairecords[0].pdf_url = 'https://example.com/a.pdf'
+        [paper] = Paper.from_bare_batch([bare])
+        assert Paper.objects.get(pk=paper.pk).pdf_url == 'https://example.com/a.pdf'
+
+    def test_existing_paper(self, bare_paper):
+        p = Paper.from_bare(bare_paper('Groundbreaking results', 'a'))
+        papers = Paper.from_bare_batch([bare_paper('Groundbreaking results', 'b', authors=[('A.', 'Kastler'), ('John', 'Dubuc')])])
+        assert papers[0].pk == p.pk
+        assert OaiRecord.objects.filter(about=p).count() == 2
+        assert len(Paper.objects.get(pk=p.pk).authors) == 2
+
+    def test_paper_saved_concurrently(self, bare_paper, monkeypatch):
+        p = Paper.from_bare(bare_paper('Groundbreaking results', 'a'))
+        # the paper is not seen by the lookup, as if it had been saved by
+        # another process in the meantime
+        monkeypatch.setattr(Paper, 'find_by_fingerprints', lambda fps: {})
+        papers = Paper.from_bare_batch([bare_paper('Groundbreaking results', 'b'), bare_paper('Stunning results', 'c')])
+        assert papers[0].pk == p.pk
+        assert papers[1].title == 'Stunning results'
+        assert OaiRecord.objects.filter(about=p).count() == 2
+
+    def test_duplicates_in_batch(self, bare_paper):
+        papers = Paper.from_bare_batch([
+            bare_paper('Groundbreaking results', 'a', doi='10.1234/a'),
+            bare_paper('Groundbreaking results', 'b'),
+            bare_paper('Other results', 'c', doi='10.1234/a'),
+        ])
+        assert papers[0].pk == papers[1].pk
+        assert set(OaiRecord.objects.filter(about=papers[0]).values_list('identifier', flat=True)) >= {'a', 'b'}
+        # The DOI matches the first paper but not the fingerprint: this goes through from_bare
+        assert papers[2] is not None
+
+
 @pytest.mark.usefixtures('db', 'mock_doi')
 class TestPaperDOIUsage():
     """
@@ -415,6 +480,42 @@ class OaiRecordTest(django.test.TestCase):
         OaiRecord.find_duplicate_records(
             paper, 'ftp://dissem.in/paper.pdf', None)
 
+    def create_record(self, paper, identifier, splash_url, pdf_url=None):
+        return OaiRecord.new(
+            source=OaiSource.objects.get(identifier='arxiv'),
+            identifier=identifier,
+            about=paper,
+            splash_url=splash_url,
+            pdf_url=pdf_url)
+
+    def test_short_urls(self):
+        paper = Paper.get_or_create('this is a title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        record = self.create_record(paper, 'oai:arXiv.org:1234.5678', 'http://arxiv.org/abs/1234.5678', 'https://doi.org/10.1000/abc')
+        record.refresh_from_db()
+        self.assertEqual(record.short_splash, '://arxiv.org/abs/1234.5678')
+        self.assertEqual(record.short_pdf, '10.1000/abc')
+
+    def test_find_duplicate_records(self):
+        paper = Paper.get_or_create('this is a title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        record = self.create_record(paper, 'oai:arXiv.org:1234.5678', 'http://arxiv.org/abs/1234.5678', 'http://arxiv.org/pdf/1234.5678')
+        self.assertEqual(OaiRecord.find_duplicate_records(paper, 'https://arxiv.org/abs/1234.5678', None), record)
+        self.assertEqual(OaiRecord.find_duplicate_records(paper, 'https://example.com/', 'https://arxiv.org/pdf/1234.5678'), record)
+        self.assertEqual(OaiRecord.find_duplicate_records(paper, 'https://example.com/', None), None)
+
+    def test_too_many_records(self):
+        paper = Paper.get_or_create('this is a title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        with patch('papers.models.MAX_OAIRECORDS_PER_PAPER', 2):
+            self.create_record(paper, 'oai:arXiv.org:1234.5678', 'http://arxiv.org/abs/1234.5678')
+            self.create_record(paper, 'oai:arXiv.org:1234.5679', 'http://arxiv.org/abs/1234.5679')
+            # the records of a paper fresh from the database are not cached
+            paper = Paper.objects.get(pk=paper.pk)
+            with self.assertRaises(ValueError):
+                self.create_record(paper, 'oai:arXiv.org:1234.5680', 'http://arxiv.org/abs/1234.5680')
+        self.assertEqual(paper.oairecord_set.count(), 2)
+
 
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(papers.doi))
@@ -28,8 +28,11 @@ import papers.name
 from papers.name import match_names
 from papers.name import name_similarity
 from papers.name import name_unification
+from papers.name import normalize_name
 from papers.name import normalize_name_words
 from papers.name import parse_comma_name
+from papers.name import parse_comma_name_cache_info
+from papers.name import parse_comma_names
 from papers.name import recapitalize_word
 from papers.name import shallower_name_similarity
 from papers.name import split_name_words
@@ -372,6 +375,16 @@ class ParseCommaNameTest(unittest.TestCase):
             'Éric Colin de Verdière'), ('Éric', 'Colin de Verdière'))
 
 
+    def test_batch(self):
+        names = ['Claire Mathieu', 'Mathieu, Claire', 'Claire Mathieu']
+        self.assertEqual(parse_comma_names(names), [parse_comma_name(name) for name in names])
+
+    def test_cache_info(self):
+        parse_comma_name('Tomasz Pawlak')
+        hits = parse_comma_name_cache_info().hits
+        parse_comma_names(['Tomasz Pawlak', 'Pawlak, Tomasz'])
+        self.assertEqual(parse_comma_name_cache_info().hits, hits + 1)
+
 class NameUnificationTest(unittest.TestCase):
 
     def test_simple(self):
@@ -506,6 +519,12 @@ class UnifyNameListsTest(unittest.TestCase):
             [('J.', 'Boutier')]),
             [(('Jérémie', 'Boutier'), (0, 0)), (None, (1, None))])
 
+    def test_identical(self):
+        names = [('Jean P', 'Dupont'), ('Marie', 'Dupont'), ('M.', 'Dupont'), ('Marie', 'Dupont')]
+        self.assertEqual(unify_name_lists(names, [list(name) for name in names]),
+            [(('Jean P.', 'Dupont'), (0, 0)), (('Marie', 'Dupont'), (1, 1)),
+             (('M.', 'Dupont'), (2, 2)), (None, (3, 3))])
+
     def test_shallower_similarity(self):
         self.assertEqual(unify_name_lists(
             [('Clement F.', 'Pit Claudel')],
@@ -537,6 +556,27 @@ class UnifyNameListsTest(unittest.TestCase):
         self.assertTrue(match_first_names(('Clément','Clement')))
 
 
+class NormalizeNameTest(unittest.TestCase):
+
+    def test_fields(self):
+        n = normalize_name(('Jean-Pierre', 'Van Der Müller'))
+        self.assertEqual(n.first_words, ('Jean', 'Pierre'))
+        self.assertEqual(n.first_separators, ('-',))
+        self.assertEqual(n.first_initials, ('J', 'P'))
+        self.assertEqual(n.unaccented_first_words, ('jean', 'pierre'))
+        self.assertEqual(n.unaccented_last, 'van der muller')
+        self.assertEqual(n.unaccented_last_words, {'van', 'der', 'muller'})
+        self.assertEqual(n.comparable_last, 'van der muller')
+
+    def test_cached(self):
+        self.assertIs(normalize_name(('Robin', 'Ryder')), normalize_name(['Robin', 'Ryder']))
+
+    def test_split_name_words_copy(self):
+        words, separators = split_name_words('Jean Pierre')
+        words.reverse()
+        self.assertEqual(split_name_words('Jean Pierre'), (['Jean', 'Pierre'], ['']))
+
+
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(papers.name))
     return tests
@@ -25,6 +25,9 @@ import unittest
 import json
 import requests
 import os
+import time
+
+from django.test import override_settings
 
 from papers.orcid import OrcidProfile
 from papers.orcid import OrcidWorkSummary
@@ -283,6 +286,24 @@ class OrcidProfileTest(unittest.TestCase):
         pubtypes = [work.pubtype for work in works]
         self.assertTrue('journal-article' in pubtypes)
 
+    def test_fetch_works_concurrently(self):
+        class SlowProfile(OrcidProfileStub):
+            def request_element(self, path):
+                put_codes = path.split('/')[1].split(',')
+                # the first batch is the slowest
+                if put_codes[0] == '0':
+                    time.sleep(0.05)
+                self.requested.append(path)
+                return {'bulk': [{'work': {'put-code': int(c), 'title': {'title': {'value': c}}}} for c in put_codes]}
+
+        profile = SlowProfile('0000-0002-8612-8827')
+        profile.requested = []
+        put_codes = list(range(100))
+        with override_settings(ORCID_FETCH_THREADS=3):
+            works = list(profile.fetch_works(put_codes))
+        self.assertEqual(len(profile.requested), 4)
+        self.assertEqual([work.title for work in works], [str(c) for c in put_codes])
+
 
 class OrcidWorkTest(unittest.TestCase):
     @classmethod
@@ -0,0 +1,34 @@
+import pytest
+
+from django.test import TestCase
+
+from papers.models import Paper
+from papers.search_indexes import PaperIndex
+
+@pytest.mark.usefixtures('load_test_data')
+class PaperIndexTest(TestCase):
+
+    def test_full_prepare_batch(self):
+        p = Paper.objects.filter(oairecord__isnull=False).first()
+        p.authors_list[0]['researcher_id'] = self.r1.id
+        p.save()
+
+        index = PaperIndex()
+        expected = [index.full_prepare(paper) for paper in Paper.objects.order_by('pk')]
+
+        papers = list(Paper.objects.order_by('pk'))
+        with self.assertNumQueries(2):
+            docs = index.full_prepare_batch(papers)
+        self.assertEqual(docs, expected)
+
+    def test_full_prepare_after_prefetch(self):
+        """
+        Prefetched data is only used once
+        """
+        p = Paper.objects.filter(oairecord__isnull=False).first()
+        index = PaperIndex()
+        index.prefetch([p])
+        with self.assertNumQueries(0):
+            index.full_prepare(p)
+        with self.assertNumQueries(1 + len(p.researcher_ids)):
+            index.full_prepare(p)
@@ -174,7 +174,6 @@ def maybe_recapitalize_title(title):
 overescaped_re = re.compile(r'&amp;#(\d+);')
 unicode4_re = re.compile(r'(\\u[0-9A-Z]{4})(?![0-9A-Z])')
 whitespace_re = re.compile(r'\s+')
-ltgt_re = re.compile(r'.*[<>&]')
 
 html_cleaner = Cleaner()
 html_cleaner.allow_tags = ['sub', 'sup', 'b', 'span']
@@ -283,13 +282,29 @@ def sanitize_html(s):
     s = whitespace_re.sub(r' ', s)
     s = unescape_latex(s)
     s = kill_double_dollars(s)
-    if ltgt_re.match(s): # only run HTML sanitizer if there is a
-                         # '<', '>' or '&'
+    if may_contain_html(s): # only run HTML sanitizer if there is a
+                            # '<', '>' or '&'
         orig = html_cleaner.clean_html('<span>'+s+'</span>')
         s = orig[6:-7] # We cut the <span />
     return s
 
 
+def may_contain_html(s):
+    """
+    Is there a '<', '>' or '&' in the first line of s?
+    This is a cheap check done before running the HTML cleaners.
+    The first line only is considered, as the previous check
+    with a regular expression did.
+
+    >>> may_contain_html('Fish & Chips')
+    True
+    >>> may_contain_html('Fish and Chips')
+    False
+    """
+    first_line = s.partition('\n')[0]
+    return '<' in first_line or '>' in first_line or '&' in first_line
+
+
 def kill_html(s):
     """
     Removes every tag except <div> (but there are no
@@ -298,7 +313,7 @@ def kill_html(s):
     >>> kill_html('My title<sub>is</sub><a href="http://dissem.in"><sup>nice</sup>    </a>')
     'My titleisnice'
     """
-    if ltgt_re.match(s): # only run HTML sanitizer if there is a '<' or '>'
+    if may_contain_html(s): # only run HTML sanitizer if there is a '<' or '>'
         orig = html_killer.clean_html('<div>'+s+'</div>')
         return orig[5:-6].strip()  # We cut the <div />
     else:
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+def merge_duplicate_aliases(apps, schema_editor):
+    """
+    The unique constraint was never created, so there may be
+    several rows for the same alias. We sum their counts.
+    """
+    schema_editor.execute(
+        """
+        UPDATE papers_aliaspublisher AS a
+        SET count = d.total
+        FROM (
+            SELECT MIN(id) AS id, SUM(count) AS total
+            FROM papers_aliaspublisher
+            GROUP BY name, publisher_id
+            HAVING COUNT(*) > 1
+        ) AS d
+        WHERE a.id = d.id
+        """
+    )
+    schema_editor.execute(
+        """
+        DELETE FROM papers_aliaspublisher AS a
+        USING papers_aliaspublisher AS b
+        WHERE a.name = b.name AND a.publisher_id = b.publisher_id AND a.id > b.id
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publishers', '0008_fix_name_indices'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_aliases, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='aliaspublisher',
+            unique_together={('name', 'publisher')},
+        ),
+    ]
@@ -23,8 +23,11 @@
 
 from statistics.models import AccessStatistics
 
+from collections import Counter
+
 from django.apps import apps
 from django.urls import reverse
+from django.db import connection
 from django.db import models
 from django.db.models import Q
 from django.template.defaultfilters import slugify
@@ -261,6 +264,8 @@ class Publisher(models.Model):
         if other.stats:
             other.stats.delete()
         other.delete()
+        from backend.resolver import resolver
+        resolver.invalidate_publishers()
 
     def breadcrumbs(self):
         result = publishers_breadcrumbs()
@@ -334,6 +339,8 @@ class Journal(models.Model):
         self.publisher = new_publisher
         self.save()
         self.oairecord_set.all().update(publisher = new_publisher)
+        from backend.resolver import resolver
+        resolver.invalidate_publishers()
         if oa_status_changed:
             papers = get_model('papers', 'Paper').objects.filter(
                 oairecord__journal=self.pk)
@@ -402,21 +409,61 @@ class AliasPublisher(models.Model):
     publisher = models.ForeignKey(Publisher, on_delete=models.CASCADE)
     name = models.CharField(max_length=512)
     count = models.IntegerField(default=0)
-    unique_together = ('name', 'publisher')
 
     def __str__(self):
         return self.name + ' --'+str(self.count)+'--> '+str(self.publisher)
 
     @classmethod
-    def increment(cls, name, publisher):
-        # TODO it would be more efficient with an update, but it does not really
-        # work
-        if not name:
+    def increment(cls, name, publisher, count=1):
+        """
+        Adds count to the number of times name has been associated with publisher
+        """
+        if not name or publisher is None:
+            return
+        cls.increment_many({(name, publisher.pk) : count})
+
+    @classmethod
+    def increment_many(cls, counts):
+        """
+        Adds counts for many aliases at once, with a single upsert.
+        This is atomic, so concurrent increments are not lost.
+
+        :param counts: dict mapping (name, publisher id) to the count to add
+        """
+        rows = sorted((name, publisher_id, count) for (name, publisher_id), count in counts.items()
+                      if name and publisher_id is not None and count)
+        if not rows:
             return
-        alias, _ = cls.objects.get_or_create(
-            name=name, publisher=publisher)
-        alias.count += 1
-        alias.save()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO papers_aliaspublisher (name, publisher_id, count)
+                VALUES {}
+                ON CONFLICT (name, publisher_id) DO UPDATE
+                SET count = papers_aliaspublisher.count + EXCLUDED.count
+                """.format(', '.join(['(%s, %s, %s)'] * len(rows))),
+                [value for row in rows for value in row]
+            )
 
     class Meta:
+        unique_together = ('name', 'publisher')
         db_table = 'papers_aliaspublisher'
+
+
+class AliasPublisherCounter(object):
+    """
+    Collects the associations of publisher names and publishers
+    during an ingest batch, to save them at once with
+    :meth:`AliasPublisher.increment_many`.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, name, publisher, count=1):
+        if name and publisher is not None:
+            self.counts[(name, publisher.pk)] += count
+
+    def flush(self):
+        AliasPublisher.increment_many(self.counts)
+        self.counts.clear()
@@ -31,6 +31,7 @@ from datetime import datetime
 from django.conf import settings
 from lxml import etree as ET
 from lxml.html import fromstring
+from backend.resolver import resolver
 from papers.errors import MetadataSourceException
 from papers.utils import kill_html
 from papers.utils import nstrip
@@ -158,6 +159,7 @@ class RomeoAPI(object):
 
         result = Journal(title=name, issn=issn, essn=essn, publisher=publisher)
         result.save()
+        resolver.invalidate_publishers()
         return result
 
 
@@ -256,6 +258,8 @@ class RomeoAPI(object):
                     except Publisher.DoesNotExist:
                         pass
 
+        resolver.invalidate_publishers()
+
     def get_romeo_latest_update_date(self):
         """
         Fetches the dates of the latest updates on the RoMEO service.
@@ -396,6 +400,7 @@ class RomeoAPI(object):
         publisher.oa_status = status
         publisher.last_updated = last_update
         publisher.save()
+        resolver.invalidate_publishers()
 
         if matches:
             publisher.publishercopyrightlink_set.all().delete()
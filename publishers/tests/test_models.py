@@ -9,6 +9,8 @@ import pytest
 from django.test import TestCase
 
 from papers.models import Paper
+from publishers.models import AliasPublisher
+from publishers.models import AliasPublisherCounter
 from publishers.models import Journal
 from publishers.models import Publisher
 from publishers.tests.test_romeo import RomeoAPIStub
@@ -83,3 +85,35 @@ class JournalTest(TestCase):
         self.assertEqual(paper.oa_status, 'UNK')
         self.assertEqual(paper.publisher(), closed_publisher)
         self.assertEqual(journal.publisher, closed_publisher)
+
+
+class AliasPublisherTest(TestCase):
+
+    def setUp(self):
+        super(AliasPublisherTest, self).setUp()
+        self.publisher = Publisher.objects.create(name='Harvard University Press')
+        self.other_publisher = Publisher.objects.create(name='Harvard Press')
+
+    def test_increment(self):
+        AliasPublisher.increment('HUP', self.publisher)
+        AliasPublisher.increment('HUP', self.publisher, 2)
+        AliasPublisher.increment('', self.publisher)
+        AliasPublisher.increment('HUP', None)
+        alias = AliasPublisher.objects.get(name='HUP')
+        self.assertEqual(alias.count, 3)
+        self.assertEqual(AliasPublisher.objects.count(), 1)
+
+    def test_counter(self):
+        AliasPublisher.increment('HUP', self.publisher)
+        counter = AliasPublisherCounter()
+        counter.add('HUP', self.publisher)
+        counter.add('HUP', self.publisher)
+        counter.add('HUP', self.other_publisher)
+        counter.add('Harvard UP', self.publisher)
+        with self.assertNumQueries(1):
+            counter.flush()
+        self.assertEqual(AliasPublisher.objects.get(name='HUP', publisher=self.publisher).count, 3)
+        self.assertEqual(AliasPublisher.objects.get(name='HUP', publisher=self.other_publisher).count, 1)
+        self.assertEqual(AliasPublisher.objects.get(name='Harvard UP').count, 1)
+        with self.assertNumQueries(0):
+            counter.flush()